@@ -6,27 +6,28 @@ from dotenv import load_dotenv
 load_dotenv(override=True)
 
 # Ahora importar el resto de dependencias
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 oauth2_scheme = HTTPBearer()
 from pydantic import BaseModel, EmailStr, Field, validator
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import random
 from datetime import datetime, timedelta, timezone
 import jwt
 import secrets
 import string
-from passlib.context import CryptContext
-from .db import get_pg_pool
+from .db import pg_connection
+from .passwords import hash_password, check_password
+from .ttl_cache import TTLCache
+from .revocation import token_revocations
+from .mailer import mail_sender
+import hashlib
 import asyncpg
 
 # El cliente Supabase ha sido eliminado. Ahora se usará PostgreSQL puro con asyncpg.
 
-# Configuración de seguridad
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 # URL del frontend para verificación de correo
 FRONTEND_URL = os.getenv("FRONTEND_URL")
@@ -47,8 +48,15 @@ except (ValueError, TypeError):
     # Default to 30 days if there's an issue with the environment variable
     ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days in minutes
 
-# Almacenamiento en memoria para tokens revocados (en producción, usa Redis o tu base de datos)
-token_blacklist = set()
+# Caché de usuarios autenticados: evita decodificar el JWT y consultar la base de
+# datos en cada petición. Se invalida al cambiar el usuario en este proceso; en
+# los demás workers el dato puede durar como mucho AUTH_USER_CACHE_TTL segundos.
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", 30))
+AUTH_USER_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", 10000))
+# token -> (email del usuario, id del token); nunca más allá del exp del token
+token_cache: TTLCache[Tuple[str, str]] = TTLCache(max_entries=AUTH_USER_CACHE_MAX_ENTRIES, ttl=AUTH_USER_CACHE_TTL)
+# email -> registro del usuario
+user_cache: TTLCache["UserInDB"] = TTLCache(max_entries=AUTH_USER_CACHE_MAX_ENTRIES, ttl=AUTH_USER_CACHE_TTL)
 
 # Inicializar router
 router = APIRouter(
@@ -150,17 +158,11 @@ class NewPasswordRequest(BaseModel):
 # Enviar correo con enlace de recuperación de contraseña usando SMTP
 
 def send_reset_password_email(email: str, first_name: str, reset_link: str):
-    import smtplib
+    """Encola el correo de recuperación; lo envía app.mailer por su conexión persistente"""
     from email.mime.text import MIMEText
     from email.mime.multipart import MIMEMultipart
-    import os
-
-    smtp_server = os.getenv("EMAIL_HOST")
-    smtp_port = int(os.getenv("EMAIL_PORT", 587))
-    smtp_username = os.getenv("EMAIL_USER")
-    smtp_password = os.getenv("EMAIL_PASS")
 
-    sender_email = smtp_username
+    sender_email = os.getenv("EMAIL_USER")
     message = MIMEMultipart("alternative")
     message["Subject"] = "Recupera tu contraseña"
     message["From"] = sender_email
@@ -185,63 +187,80 @@ def send_reset_password_email(email: str, first_name: str, reset_link: str):
     part = MIMEText(html, "html")
     message.attach(part)
 
-    try:
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.ehlo()
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            server.sendmail(sender_email, email, message.as_string())
-        print(f"[OK] Correo de recuperación enviado a {email}")
-    except Exception as e:
-        print(f"[ERROR] Fallo al enviar correo de recuperación a {email}: {str(e)}")
-
-# Funciones de utilidad
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    def on_failure(error: Exception):
+        print(f"[ERROR] Fallo al enviar correo de recuperación a {email}: {str(error)}")
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    mail_sender.submit(sender_email, email, message, on_failure=on_failure)
 
+# Funciones de utilidad
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # jti: identificador con el que se revoca el token al cerrar sesión
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
+def token_id(token: str, payload: Dict[str, Any]) -> str:
+    """jti del token; los emitidos antes de añadirlo se identifican por su hash"""
+    return payload.get("jti") or hashlib.sha256(token.encode()).hexdigest()
+
+def user_from_row(row) -> UserInDB:
+    data = dict(row)
+    data["id"] = str(data.pop("id_users"))
+    data["role"] = str(data.get("role") or "client")
+    return UserInDB(**data)
+
+def invalidate_user(email: str) -> None:
+    """Descarta el usuario en caché tras modificarlo (contraseña, verificación...)"""
+    user_cache.pop(email)
+
+def get_auth_cache_stats() -> Dict[str, Any]:
+    return {"tokens": token_cache.get_stats(), "users": user_cache.get_stats()}
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(oauth2_scheme)) -> UserInDB:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    token = credentials.credentials
     
-    # Verificar si el token está en la lista negra
-    if token in token_blacklist:
-        raise credentials_exception
-        
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
+    cached = token_cache.get(token)
+    if cached is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.PyJWTError:
+            raise credentials_exception
+        email = payload.get("sub")
         if email is None:
             raise credentials_exception
-        token_data = TokenData(email=email)
-    except JWTError:
+        cached = (email, token_id(token, payload))
+        # Un token en caché nunca sobrevive a su expiración
+        ttl = AUTH_USER_CACHE_TTL
+        if payload.get("exp"):
+            ttl = min(ttl, payload["exp"] - datetime.now(timezone.utc).timestamp())
+        token_cache.set(token, cached, ttl=ttl)
+    email, jti = cached
+    
+    # Tokens revocados (logout), también en cada acierto de la caché; sin E/S
+    # para los no revocados gracias al filtro en memoria
+    if await token_revocations.is_revoked(jti):
         raise credentials_exception
-        
-    # Obtener usuario de la base de datos
-    pool = await get_pg_pool()
-    async with pool.acquire() as conn:
-        user = await conn.fetchrow("SELECT * FROM users WHERE email = $1", email)
-        if not user:
-            raise credentials_exception
-        user = UserInDB(**user)
-        if user is None:
+    
+    user = user_cache.get(email)
+    if user is None:
+        # Obtener usuario de la base de datos
+        async with pg_connection() as conn:
+            row = await conn.fetchrow("SELECT * FROM users WHERE email = $1", email)
+        if not row:
             raise credentials_exception
-        return user
+        user = user_from_row(row)
+        user_cache.set(email, user)
+    return user
 
 async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
     if not current_user.is_active:
@@ -249,8 +268,7 @@ async def get_current_active_user(current_user: UserInDB = Depends(get_current_u
     return current_user
 
 def send_verification_email(email: str, first_name: str, verification_code: str):
-    """Enviar correo con el código de verificación usando SMTP"""
-    import smtplib
+    """Encola el correo con el código de verificación; lo envía app.mailer"""
     from email.mime.text import MIMEText
     from email.mime.multipart import MIMEMultipart
     import logging
@@ -258,12 +276,6 @@ def send_verification_email(email: str, first_name: str, verification_code: str)
     # Obtener el dominio del correo del usuario
     user_domain = email.split('@')[-1] if '@' in email else 'app.com'
     
-    # Configuración del correo desde variables de entorno (adaptado a tu .env)
-    smtp_server = os.getenv("EMAIL_HOST")
-    smtp_port = int(os.getenv("EMAIL_PORT", 587))
-    smtp_username = os.getenv("EMAIL_USER")
-    smtp_password = os.getenv("EMAIL_PASS")
-    
     # Configuración dinámica del remitente
     email_from_name = f"{first_name} desde {user_domain}" if first_name else f"Soporte de {user_domain}"
     sender_email = f"noreply@{user_domain}"
@@ -321,32 +333,29 @@ def send_verification_email(email: str, first_name: str, verification_code: str)
     part = MIMEText(html, "html")
     message.attach(part)
     
-    try:
-        # Enviar el correo usando SMTP con STARTTLS (TLS seguro, puerto 587)
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.ehlo()
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            server.sendmail(sender_email, email, message.as_string())
-        print(f"[OK] Correo de verificación enviado a {email}")
-    except Exception as e:
-        logging.error(f"[ERROR] Fallo al enviar correo a {email}: {str(e)}")
+    def on_failure(error: Exception):
+        # Si el correo no sale (cola llena o reintentos agotados), dejar el código en el log
+        logging.error(f"[ERROR] Fallo al enviar correo a {email}: {str(error)}")
         print(f"\n{'='*50}\n"
               f"Código de verificación para {first_name} ({email}):\n"
               f"{verification_code}\n"
               f"Este código expirará en 24 horas.\n"
               f"{'='*50}\n")
 
+    mail_sender.submit(sender_email, email, message, on_failure=on_failure)
+
 # Endpoints de la API
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user: RegisterRequest, background_tasks: BackgroundTasks):
+async def register(user: RegisterRequest):
     """
     Registrar un nuevo usuario
     """
     try:
+        # bcrypt en su pool de hilos, antes de ocupar una conexión de la base de datos
+        password_hash = await hash_password(user.password)
+        
         # Verificar si el correo ya está registrado
-        pool = await get_pg_pool()
-        async with pool.acquire() as conn:
+        async with pg_connection() as conn:
             existing_user = await conn.fetchrow("SELECT * FROM users WHERE email = $1", user.email)
             if existing_user:
                 raise HTTPException(
@@ -377,7 +386,7 @@ async def register(user: RegisterRequest, background_tasks: BackgroundTasks):
                 user.last_name or None,
                 role,
                 True,
-                get_password_hash(user.password),
+                password_hash,
                 False,
                 verification_code,
                 verification_expiry)
@@ -389,8 +398,7 @@ async def register(user: RegisterRequest, background_tasks: BackgroundTasks):
                 )
 
         # Enviar correo con el código de verificación
-        background_tasks.add_task(
-            send_verification_email,
+        send_verification_email(
             email=user.email,
             first_name=user.first_name or 'Usuario',
             verification_code=verification_code  # Enviar el código en lugar del enlace
@@ -429,43 +437,45 @@ async def login(login_data: LoginRequest):
     """
     try:
         # Buscar usuario por email en tu tabla
-        pool = await get_pg_pool()
-        async with pool.acquire() as conn:
+        async with pg_connection() as conn:
             user = await conn.fetchrow("SELECT * FROM users WHERE email = $1", login_data.email)
-            if not user:
-                raise HTTPException(status_code=401, detail="Correo electrónico o contraseña incorrectos")
-            # Verifica el hash de la contraseña
-            if not verify_password(login_data.password, user['password_hash']):
-                raise HTTPException(status_code=401, detail="Correo electrónico o contraseña incorrectos")
-            # Verifica que esté verificado
-            if not user['is_verified']:
-                raise HTTPException(status_code=401, detail="Debes verificar tu correo electrónico antes de iniciar sesión")
-            # Crear token JWT
-            access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-            access_token = create_access_token(
-                data={"sub": user["email"]},
-                expires_delta=access_token_expires
-            )
-            # Preparar respuesta del usuario
-            user_response = {
-                'id_users': user['id_users'],
-                'email': user['email'],
-                'first_name': user.get('first_name'),
-                'last_name': user.get('last_name'),
-                'role': user.get('role', 'client'),
-                'is_active': user.get('is_active', True),
-                'is_verified': user.get('is_verified', False),
-                'company': user.get('company'),
-                'website': user.get('website'),
-                'is_super_admin': user.get('is_super_admin', False),
-                'created_at': user.get('created_at'),
-                'updated_at': user.get('updated_at'),
-            }
-            return {
-                "access_token": access_token,
-                "token_type": "bearer",
-                "user": user_response
-            }
+        if not user:
+            raise HTTPException(status_code=401, detail="Correo electrónico o contraseña incorrectos")
+        # Verifica el hash de la contraseña (fuera del event loop y sin retener la conexión)
+        if not await check_password(login_data.password, user['password_hash']):
+            raise HTTPException(status_code=401, detail="Correo electrónico o contraseña incorrectos")
+        # Verifica que esté verificado
+        if not user['is_verified']:
+            raise HTTPException(status_code=401, detail="Debes verificar tu correo electrónico antes de iniciar sesión")
+        # Crear token JWT
+        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        access_token = create_access_token(
+            data={"sub": user["email"]},
+            expires_delta=access_token_expires
+        )
+        # Preparar respuesta del usuario
+        user_response = {
+            'id_users': user['id_users'],
+            'email': user['email'],
+            'first_name': user.get('first_name'),
+            'last_name': user.get('last_name'),
+            'role': user.get('role', 'client'),
+            'is_active': user.get('is_active', True),
+            'is_verified': user.get('is_verified', False),
+            'company': user.get('company'),
+            'website': user.get('website'),
+            'is_super_admin': user.get('is_super_admin', False),
+            'created_at': user.get('created_at'),
+            'updated_at': user.get('updated_at'),
+        }
+        return {
+            "access_token": access_token,
+            "token_type": "bearer",
+            "user": user_response
+        }
+    except HTTPException:
+        # 401 de credenciales y 503 de la cola de bcrypt
+        raise
     except Exception as e:
         # Puedes agregar logging aquí si lo deseas
         raise HTTPException(status_code=500, detail=f"Error en login: {str(e)}")
@@ -478,8 +488,7 @@ async def verify_email(verify_data: VerifyRequest):
     import logging
     try:
         # Buscar usuario por email y código de verificación en PostgreSQL
-        pool = await get_pg_pool()
-        async with pool.acquire() as conn:
+        async with pg_connection() as conn:
             user = await conn.fetchrow(
                 "SELECT * FROM users WHERE email = $1 AND verification_token = $2",
                 verify_data.email,
@@ -502,11 +511,12 @@ async def verify_email(verify_data: VerifyRequest):
                 detail="El código de verificación no está disponible o ya fue usado"
             )
         # Actualizar usuario como verificado y limpiar token
-        async with pool.acquire() as conn:
+        async with pg_connection() as conn:
             await conn.execute(
                 "UPDATE users SET is_verified = TRUE, verification_token = NULL, verification_token_expiry = NULL WHERE email = $1",
                 verify_data.email
             )
+        invalidate_user(verify_data.email)
         return {"message": "Correo verificado exitosamente"}
     except HTTPException:
         raise
@@ -518,13 +528,12 @@ async def verify_email(verify_data: VerifyRequest):
         )
 
 @router.post("/forgot-password")
-async def forgot_password(reset_data: ResetPasswordRequest, background_tasks: BackgroundTasks):
+async def forgot_password(reset_data: ResetPasswordRequest):
     """
     Enviar correo electrónico para restablecer la contraseña
     """
     try:
-        pool = await get_pg_pool()
-        async with pool.acquire() as conn:
+        async with pg_connection() as conn:
             user = await conn.fetchrow("SELECT id_users, email, first_name FROM users WHERE email = $1", reset_data.email)
             if not user:
                 # No revelar que el correo no existe
@@ -536,8 +545,7 @@ async def forgot_password(reset_data: ResetPasswordRequest, background_tasks: Ba
                 UPDATE users SET reset_password_token = $1, reset_password_token_expiry = $2 WHERE id_users = $3
             ''', reset_token, expiry, user['id_users'])
             reset_link = f"{FRONTEND_URL}/reset-password?token={reset_token}"
-            background_tasks.add_task(
-                send_reset_password_email,
+            send_reset_password_email(
                 email=user['email'],
                 first_name=user.get('first_name', 'Usuario'),
                 reset_link=reset_link
@@ -554,8 +562,7 @@ async def reset_password(reset_data: NewPasswordRequest):
     Restablecer la contraseña usando el token de restablecimiento
     """
     try:
-        pool = await get_pg_pool()
-        async with pool.acquire() as conn:
+        async with pg_connection() as conn:
             user = await conn.fetchrow("SELECT * FROM users WHERE reset_password_token = $1", reset_data.token)
             if not user:
                 raise HTTPException(
@@ -579,14 +586,21 @@ async def reset_password(reset_data: NewPasswordRequest):
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="El token de restablecimiento ha expirado"
                 )
-            # Actualizar la contraseña
+        # bcrypt en su pool de hilos, sin retener la conexión
+        new_hash = await hash_password(reset_data.new_password)
+        async with pg_connection() as conn:
+            # Actualizar la contraseña (solo si el token sigue siendo el mismo)
             await conn.execute('''
-                UPDATE users SET password_hash = $1, reset_password_token = NULL, reset_password_token_expiry = NULL, updated_at = $2 WHERE id_users = $3
+                UPDATE users SET password_hash = $1, reset_password_token = NULL, reset_password_token_expiry = NULL, updated_at = $2 WHERE id_users = $3 AND reset_password_token = $4
             ''',
-            get_password_hash(reset_data.new_password),
+            new_hash,
             datetime.utcnow(),
-            user['id_users'])
+            user['id_users'],
+            reset_data.token)
+        invalidate_user(user['email'])
         return {"message": "Contraseña restablecida exitosamente"}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error al restablecer la contraseña: {str(e)}")
         raise HTTPException(
@@ -594,9 +608,6 @@ async def reset_password(reset_data: NewPasswordRequest):
             detail="No se pudo restablecer la contraseña"
         )
 
-# Inicializa el blacklist al inicio del archivo si no existe
-token_blacklist = set()
-
 @router.post("/logout")
 async def logout(token: HTTPAuthorizationCredentials = Depends(oauth2_scheme)):
     """
@@ -606,12 +617,15 @@ async def logout(token: HTTPAuthorizationCredentials = Depends(oauth2_scheme)):
     print(f"[DEBUG] Token recibido en logout: {token_str}")
     try:
         payload = jwt.decode(token_str, SECRET_KEY, algorithms=[ALGORITHM])
-        # Agregar el token a la blacklist
-        token_blacklist.add(token_str)
+        # Revocar el token hasta su exp, para todos los workers
+        await token_revocations.revoke(token_id(token_str, payload), payload.get("exp"))
+        token_cache.pop(token_str)
+        if payload.get("sub"):
+            invalidate_user(payload["sub"])
         return {"message": "Sesión cerrada correctamente"}
     except jwt.ExpiredSignatureError:
         return {"message": "El token ya ha expirado"}
-    except JWTError:
+    except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Token inválido")
     
     return {"message": "Sesión cerrada exitosamente"}
@@ -1,22 +1,138 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
 import asyncpg
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger("webscraper")
+
 POSTGRES_HOST = os.getenv("POSTGRES_HOST")
 POSTGRES_PORT = int(os.getenv("POSTGRES_PORT", 5433))
 POSTGRES_DB = os.getenv("POSTGRES_DB")
 POSTGRES_USER = os.getenv("POSTGRES_USER")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 
-async def get_pg_pool():
-    return await asyncpg.create_pool(
-        host=POSTGRES_HOST,
-        port=POSTGRES_PORT,
-        user=POSTGRES_USER,
-        password=POSTGRES_PASSWORD,
-        database=POSTGRES_DB,
-        min_size=1,
-        max_size=5
-    )
+# Configuración del pool (uno por proceso/worker de uvicorn)
+POSTGRES_POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", 1))
+POSTGRES_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", 5))
+POSTGRES_STATEMENT_CACHE_SIZE = int(os.getenv("POSTGRES_STATEMENT_CACHE_SIZE", 100))
+POSTGRES_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("POSTGRES_POOL_MAX_INACTIVE_LIFETIME", 300))
+POSTGRES_COMMAND_TIMEOUT = float(os.getenv("POSTGRES_COMMAND_TIMEOUT", 30))
+
+_pool: Optional[asyncpg.Pool] = None
+_pool_lock: Optional[asyncio.Lock] = None
+
+# Estadísticas de uso del pool
+_stats = {
+    "acquired_total": 0,
+    "in_use": 0,
+    "wait_time_total_ms": 0.0,
+    "wait_time_max_ms": 0.0,
+}
+
+
+def _get_lock() -> asyncio.Lock:
+    # El lock se crea dentro del event loop de uvicorn, no al importar el módulo
+    global _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    return _pool_lock
+
+
+async def init_pg_pool() -> asyncpg.Pool:
+    """Crea el pool compartido del proceso y precalienta sus conexiones"""
+    global _pool
+    async with _get_lock():
+        if _pool is not None:
+            return _pool
+        pool = await asyncpg.create_pool(
+            host=POSTGRES_HOST,
+            port=POSTGRES_PORT,
+            user=POSTGRES_USER,
+            password=POSTGRES_PASSWORD,
+            database=POSTGRES_DB,
+            min_size=POSTGRES_POOL_MIN_SIZE,
+            max_size=POSTGRES_POOL_MAX_SIZE,
+            statement_cache_size=POSTGRES_STATEMENT_CACHE_SIZE,
+            max_inactive_connection_lifetime=POSTGRES_POOL_MAX_INACTIVE_LIFETIME,
+            command_timeout=POSTGRES_COMMAND_TIMEOUT,
+        )
+        # Precalentar: asegurar que las conexiones mínimas responden antes de servir tráfico
+        try:
+            conns = []
+            try:
+                for _ in range(POSTGRES_POOL_MIN_SIZE):
+                    conns.append(await pool.acquire())
+                await asyncio.gather(*(conn.execute("SELECT 1") for conn in conns))
+            finally:
+                for conn in conns:
+                    await pool.release(conn)
+        except BaseException:
+            # Sin esto cada reintento de arranque dejaría un pool con sus conexiones abiertas
+            await pool.close()
+            raise
+        _pool = pool
+        logger.info(f"Pool de PostgreSQL iniciado (min={POSTGRES_POOL_MIN_SIZE}, max={POSTGRES_POOL_MAX_SIZE})")
+        return _pool
+
+
+async def close_pg_pool() -> None:
+    """Cierra el pool compartido (se llama al apagar la aplicación)"""
+    global _pool
+    async with _get_lock():
+        if _pool is None:
+            return
+        pool, _pool = _pool, None
+    await pool.close()
+    logger.info("Pool de PostgreSQL cerrado")
+
+
+async def get_pg_pool() -> asyncpg.Pool:
+    """Devuelve el pool compartido del proceso, creándolo si aún no existe"""
+    if _pool is not None:
+        return _pool
+    return await init_pg_pool()
+
+
+@asynccontextmanager
+async def pg_connection():
+    """Toma una conexión del pool compartido registrando el tiempo de espera"""
+    pool = await get_pg_pool()
+    start = time.perf_counter()
+    conn = await pool.acquire()
+    wait_ms = (time.perf_counter() - start) * 1000
+    _stats["acquired_total"] += 1
+    _stats["in_use"] += 1
+    _stats["wait_time_total_ms"] += wait_ms
+    _stats["wait_time_max_ms"] = max(_stats["wait_time_max_ms"], wait_ms)
+    try:
+        yield conn
+    finally:
+        _stats["in_use"] -= 1
+        await pool.release(conn)
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Estadísticas del pool para dimensionarlo bajo carga"""
+    acquired = _stats["acquired_total"]
+    stats = {
+        "initialized": _pool is not None,
+        "min_size": POSTGRES_POOL_MIN_SIZE,
+        "max_size": POSTGRES_POOL_MAX_SIZE,
+        "size": 0,
+        "idle": 0,
+        "in_use": _stats["in_use"],
+        "acquired_total": acquired,
+        "wait_time_avg_ms": round(_stats["wait_time_total_ms"] / acquired, 3) if acquired else 0.0,
+        "wait_time_max_ms": round(_stats["wait_time_max_ms"], 3),
+    }
+    if _pool is not None:
+        stats["size"] = _pool.get_size()
+        stats["idle"] = _pool.get_idle_size()
+    return stats
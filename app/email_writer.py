@@ -0,0 +1,252 @@
+"""
+Escritura por lotes de los correos encontrados (write-behind).
+
+Los escaneos no escriben en found_emails directamente: dejan sus filas en un
+buffer compartido que se vuelca cada FOUND_EMAILS_FLUSH_INTERVAL segundos o al
+llegar a FOUND_EMAILS_BATCH_SIZE filas, juntando las de todos los trabajos del
+proceso. Por encima de FOUND_EMAILS_MAX_PENDING filas sin volcar, quien escribe
+espera al volcado (contrapresión), así que la memoria del buffer está acotada.
+
+Cada escaneo escribe a través de un EmailSink: los correos se encolan a medida
+que se descubren, no al terminar, y un timeout o una caída pierden como mucho
+el último intervalo de volcado. Cada volcado es un COPY binario a una tabla temporal y un único
+INSERT ... ON CONFLICT ... RETURNING contra el índice único
+(email, url, COALESCE(user_id, ...)), que sí deduplica las filas anónimas.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from .db import pg_connection
+
+load_dotenv()
+
+logger = logging.getLogger("webscraper")
+
+FOUND_EMAILS_BATCH_SIZE = int(os.getenv("FOUND_EMAILS_BATCH_SIZE", 500))
+FOUND_EMAILS_FLUSH_INTERVAL = float(os.getenv("FOUND_EMAILS_FLUSH_INTERVAL", 0.5))
+FOUND_EMAILS_MAX_PENDING = int(os.getenv("FOUND_EMAILS_MAX_PENDING", 5000))
+
+# user_id que representa "sin dueño" en el índice único de found_emails
+ANONYMOUS_OWNER = uuid.UUID(int=0)
+
+Row = Tuple[Optional[uuid.UUID], str, str]
+
+
+class _PendingWrite:
+    __slots__ = ("rows", "future")
+
+    def __init__(self, rows: List[Row], future: asyncio.Future):
+        self.rows = rows
+        self.future = future
+
+
+class FoundEmailWriter:
+    """Buffer de filas de found_emails compartido por todos los escaneos"""
+
+    def __init__(self, batch_size: int = FOUND_EMAILS_BATCH_SIZE,
+                 flush_interval: float = FOUND_EMAILS_FLUSH_INTERVAL,
+                 max_pending: int = FOUND_EMAILS_MAX_PENDING):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, batch_size)
+        self._pending: Deque[_PendingWrite] = deque()
+        self._pending_rows = 0
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.stats = {"batches": 0, "rows": 0, "inserted": 0, "refreshed": 0, "errors": 0, "backpressure_waits": 0}
+
+    def _get_lock(self) -> asyncio.Lock:
+        # Se crea dentro del bucle de eventos en ejecución
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        return self._flush_lock
+
+    def start(self) -> None:
+        if self._flusher is None:
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    async def write(self, url: str, emails: Iterable[str], user_id: Optional[str] = None,
+                    wait: bool = True) -> List[str]:
+        """
+        Encola los correos de una URL para el siguiente volcado
+
+        Con wait=True espera a que el lote se escriba y devuelve los correos que
+        no existían; con wait=False vuelve enseguida (escritura diferida).
+        """
+        future = await self.submit(url, emails, user_id)
+        if future is None:
+            return []
+        if not wait:
+            future.add_done_callback(_consume_exception)
+            return []
+        return await future
+
+    async def submit(self, url: str, emails: Iterable[str],
+                     user_id: Optional[str] = None) -> Optional[asyncio.Future]:
+        """Encola los correos y devuelve el futuro con los que no existían (None si no hay nada)"""
+        owner = uuid.UUID(str(user_id)) if user_id else None
+        # La columna email es VARCHAR(255)
+        rows = [(owner, email, url) for email in dict.fromkeys(emails) if len(email) <= 255]
+        if not rows:
+            return None
+        if self._flusher is not None and self._pending_rows >= self.max_pending:
+            # Buffer lleno: esperar al volcado en lugar de seguir acumulando
+            self.stats["backpressure_waits"] += 1
+            await self.flush()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_PendingWrite(rows, future))
+        self._pending_rows += len(rows)
+        if self._flusher is None:
+            # Sin tarea de fondo (p. ej. fuera de la API): volcar ya
+            await self.flush()
+        elif self._pending_rows >= self.batch_size:
+            self._wakeup.set()
+        return future
+
+    def request_flush(self) -> None:
+        """Adelanta el siguiente volcado sin esperar al intervalo"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def sink(self, url: str, user_id: Optional[str] = None, limit: Optional[int] = None) -> "EmailSink":
+        return EmailSink(self, url, user_id, limit)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._get_lock():
+            while self._pending:
+                batch: List[_PendingWrite] = []
+                rows = 0
+                while self._pending and (not batch or rows + len(self._pending[0].rows) <= self.batch_size):
+                    write = self._pending.popleft()
+                    batch.append(write)
+                    rows += len(write.rows)
+                self._pending_rows -= rows
+                await self._write_batch(batch)
+
+    async def _write_batch(self, batch: List[_PendingWrite]) -> None:
+        records = [row for write in batch for row in write.rows]
+        try:
+            inserted = await self._copy_upsert(records)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Error guardando {len(records)} correos en la base de datos: {str(e)}")
+            for write in batch:
+                if not write.future.done():
+                    write.future.set_exception(e)
+            return
+        self.stats["batches"] += 1
+        self.stats["rows"] += len(records)
+        self.stats["inserted"] += len(inserted)
+        self.stats["refreshed"] += len(set(records)) - len(inserted)
+        for write in batch:
+            if not write.future.done():
+                write.future.set_result([email for owner, email, url in write.rows
+                                         if (owner, email, url) in inserted])
+
+    async def _copy_upsert(self, records: List[Row]) -> Set[Row]:
+        """COPY binario a una tabla temporal y un único upsert; devuelve las filas nuevas"""
+        async with pg_connection() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS found_emails_staging (
+                        user_id UUID,
+                        email VARCHAR(255),
+                        url TEXT
+                    ) ON COMMIT DELETE ROWS
+                """)
+                await conn.copy_records_to_table(
+                    "found_emails_staging", records=records, columns=["user_id", "email", "url"]
+                )
+                rows = await conn.fetch(
+                    """
+                    INSERT INTO public.found_emails (user_id, email, url, found_at, last_seen_at)
+                    SELECT DISTINCT ON (email, url, COALESCE(user_id, $1::uuid)) user_id, email, url, NOW(), NOW()
+                    FROM found_emails_staging
+                    ON CONFLICT (email, url, COALESCE(user_id, '00000000-0000-0000-0000-000000000000'::uuid))
+                    DO UPDATE SET last_seen_at = EXCLUDED.last_seen_at
+                    RETURNING user_id, email, url, (xmax = 0) AS inserted
+                    """,
+                    ANONYMOUS_OWNER
+                )
+        return {(row["user_id"], row["email"], row["url"]) for row in rows if row["inserted"]}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"pending_rows": self._pending_rows, "batch_size": self.batch_size, **self.stats}
+
+
+class EmailSink:
+    """Correos de un escaneo, persistidos en micro-lotes a medida que se descubren"""
+
+    def __init__(self, writer: FoundEmailWriter, url: str, user_id: Optional[str] = None,
+                 limit: Optional[int] = None):
+        self.writer = writer
+        self.url = url
+        self.user_id = user_id
+        self.limit = limit
+        # Orden de descubrimiento, acotado por limit (max_emails del escaneo)
+        self.emails: List[str] = []
+        self.inserted: List[str] = []
+        self.errors = 0
+        self._inflight: Set[asyncio.Future] = set()
+
+    async def add(self, emails: Iterable[str]) -> None:
+        emails = list(emails)
+        if self.limit is not None:
+            emails = emails[:max(0, self.limit - len(self.emails))]
+        if not emails:
+            return
+        self.emails.extend(emails)
+        future = await self.writer.submit(self.url, emails, self.user_id)
+        if future is not None:
+            self._inflight.add(future)
+            future.add_done_callback(self._collect)
+
+    def _collect(self, future: asyncio.Future) -> None:
+        self._inflight.discard(future)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.errors += 1
+            return
+        self.inserted.extend(future.result())
+
+    async def finish(self) -> List[str]:
+        """Espera a que se vuelquen los correos pendientes; devuelve los que no existían"""
+        if self._inflight:
+            self.writer.request_flush()
+            await asyncio.gather(*list(self._inflight), return_exceptions=True)
+        return self.inserted
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    # Escrituras sin esperar: el error ya se registró en el log
+    if not future.cancelled():
+        future.exception()
+
+
+# Escritor compartido por todos los escaneos del proceso
+email_writer = FoundEmailWriter()
@@ -0,0 +1,181 @@
+"""
+Análisis de páginas HTML en una sola pasada.
+
+Cada página se parsea una única vez y de ese árbol se obtienen los correos del
+texto, los correos en atributos, las imágenes candidatas para OCR y los enlaces
+salientes que alimentan la cola del crawler.
+"""
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Set, Tuple
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger("webscraper")
+
+# Usar lxml (implementado en C) si está instalado; si no, el parser de la stdlib
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# Patrón de referencia: descarta un candidato si después de él, en la misma línea,
+# aparece una extensión de imagen. find_emails() produce exactamente los mismos
+# resultados sin evaluar ese lookahead en cada posición del texto.
+EMAIL_PATTERN = r'\b(?!.*\.(?:png|jpg|jpeg|gif|webp|svg|ico))[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b'
+
+_EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b', re.IGNORECASE)
+_VALID_EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+_IMAGE_EXTENSION_RE = re.compile(r'\.(?:png|jpg|jpeg|gif|webp|svg|ico)', re.IGNORECASE)
+
+# Reglas de filtrado de falsos positivos (nombres de recursos, CDNs, etc.)
+_BLOCKED_LOCAL_RE = re.compile(r'icon|logo|image|img|sprite')
+_BLOCKED_DOMAIN_RE = re.compile(r'cdn|static|assets|media|images|img|js|css|fonts')
+
+# Arroba como entidad HTML sin decodificar: &#64; y &#x40; (con ceros a la
+# izquierda y en cualquier caja, como &#064; o &#X40;) y &commat;
+_AT_ENTITY_RE = re.compile(r'&#0*64;|&#x0*40;|&commat;', re.IGNORECASE)
+
+# Atributos en los que se buscan correos además del texto visible
+EMAIL_ATTRIBUTES = ('href', 'data-email', 'data-contact', 'data-mail', 'data-email-address')
+
+# Términos en el nombre de una imagen que sugieren que contiene un correo
+IMAGE_EMAIL_TERMS = ('email', 'mail', 'contact', 'correo')
+
+# Términos en el texto de un enlace que indican una página de contacto
+CONTACT_LINK_TERMS = ('contact', 'contacto', 'about', 'nosotros', 'equipo', 'team')
+
+SKIPPED_HREF_PREFIXES = ('javascript:', 'mailto:', 'tel:', '#')
+
+
+@dataclass
+class PageAnalysis:
+    """Resultado del análisis de una página"""
+    text_emails: Set[str] = field(default_factory=set)
+    attr_emails: Set[str] = field(default_factory=set)
+    image_candidates: List[str] = field(default_factory=list)
+    # (url absoluta, es_enlace_de_contacto)
+    links: List[Tuple[str, bool]] = field(default_factory=list)
+    # <link rel="canonical"> declarado por la página, si existe
+    canonical_url: Optional[str] = None
+
+
+def may_contain_email(content: str) -> bool:
+    """Prefiltro barato: sin arroba (literal o como entidad HTML) no puede haber correos"""
+    if '@' in content:
+        return True
+    return _AT_ENTITY_RE.search(content) is not None
+
+
+def find_emails(text: str) -> List[str]:
+    """
+    Busca correos en un texto; equivale a re.findall(EMAIL_PATTERN, text, re.IGNORECASE)
+    """
+    if '@' not in text:
+        return []
+    found = []
+    for line in text.split('\n'):
+        if '@' not in line:
+            continue
+        # El lookahead del patrón excluye cualquier inicio anterior a la última
+        # extensión de imagen de la línea, así que se busca solo después de ella
+        cutoff = -1
+        for match in _IMAGE_EXTENSION_RE.finditer(line):
+            cutoff = match.start()
+        if cutoff >= 0 and '@' not in line[cutoff + 1:]:
+            continue
+        found.extend(_EMAIL_RE.findall(line, cutoff + 1))
+    return found
+
+
+def is_valid_email(email: str) -> bool:
+    """Verifica si un correo electrónico es válido"""
+    return _VALID_EMAIL_RE.fullmatch(email) is not None
+
+
+def filter_emails(candidates) -> Set[str]:
+    """Normaliza los candidatos y descarta los inválidos o falsos positivos en una pasada"""
+    filtered = set()
+    for email in candidates:
+        email = email.lower().strip()
+        if email in filtered or len(email) <= 5 or not _VALID_EMAIL_RE.fullmatch(email):
+            continue
+        local, _, domain = email.partition('@')
+        if (local.isdigit() or
+                _BLOCKED_LOCAL_RE.search(local) or
+                _BLOCKED_DOMAIN_RE.search(domain.split('.', 1)[0]) or
+                '.' not in domain):
+            continue
+        filtered.add(email)
+    return filtered
+
+
+def make_soup(content: str, parser: Optional[str] = None) -> BeautifulSoup:
+    """Crea el árbol con el parser más rápido disponible, recurriendo a html.parser"""
+    parser = parser or HTML_PARSER
+    try:
+        return BeautifulSoup(content, parser)
+    except Exception as e:
+        if parser == "html.parser":
+            raise
+        logger.debug(f"Parser {parser} falló ({str(e)}), usando html.parser")
+        return BeautifulSoup(content, "html.parser")
+
+
+def analyze_page(content: str, base_url: str, parser: Optional[str] = None,
+                 need_links: bool = True) -> PageAnalysis:
+    """
+    Parsea la página una sola vez y extrae todo lo que necesita el crawler
+
+    Sin arroba (literal o como entidad) no se buscan correos ni imágenes para OCR;
+    con need_links=False no se recogen los enlaces. Si no queda nada que buscar
+    la página ni siquiera se parsea.
+    """
+    analysis = PageAnalysis()
+    scan_emails = may_contain_email(content)
+    if not scan_emails and not need_links:
+        return analysis
+    soup = make_soup(content, parser)
+
+    # 1. Correos en el texto de la página (solo si la página tiene alguna arroba)
+    if scan_emails:
+        analysis.text_emails.update(find_emails(soup.get_text()))
+
+    # 2. Un único recorrido del árbol para atributos, imágenes y enlaces
+    for tag in soup.find_all(True):
+        attrs = tag.attrs
+        if scan_emails:
+            for attr in EMAIL_ATTRIBUTES:
+                attr_value = attrs.get(attr)
+                if not isinstance(attr_value, str) or '@' not in attr_value:
+                    continue
+                if attr == 'href' and attr_value.startswith('mailto:'):
+                    # Eliminar 'mailto:' y parámetros
+                    analysis.attr_emails.add(attr_value[7:].split('?')[0].strip())
+                else:
+                    analysis.attr_emails.update(find_emails(attr_value))
+
+        name = tag.name
+        if name == 'img':
+            if not scan_emails:
+                continue
+            img_src = attrs.get('src')
+            if img_src and any(term in img_src.lower() for term in IMAGE_EMAIL_TERMS):
+                analysis.image_candidates.append(urljoin(base_url, img_src))
+        elif name in ('a', 'link'):
+            href = (attrs.get('href') or '').strip()
+            if not href or href.startswith(SKIPPED_HREF_PREFIXES):
+                continue
+            if name == 'link' and 'canonical' in (attrs.get('rel') or ()):
+                analysis.canonical_url = urljoin(base_url, href)
+                continue
+            if not need_links:
+                continue
+            link_text = (tag.get_text() or '').lower()
+            is_contact = any(term in link_text for term in CONTACT_LINK_TERMS)
+            analysis.links.append((urljoin(base_url, href), is_contact))
+
+    return analysis
@@ -0,0 +1,131 @@
+"""
+Frontera de rastreo con prioridad y control de concurrencia por host.
+
+Las URLs pendientes se guardan en un heap ordenado por una puntuación (enlaces de
+contacto y rutas incluidas primero, menor profundidad antes); a igual puntuación
+se respeta el orden de llegada. Cada host tiene un máximo de peticiones en curso
+y la frontera deja de entregar URLs en cuanto se agota el presupuesto de páginas
+o el escaneo la cierra al alcanzar el máximo de correos.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", 5))
+CRAWL_MAX_PER_HOST = int(os.getenv("CRAWL_MAX_PER_HOST", 4))
+
+# Términos en la ruta de una URL que sugieren una página con datos de contacto
+CONTACT_PATH_TERMS = ('contact', 'contacto', 'about', 'nosotros', 'equipo', 'team', 'impressum', 'aviso-legal')
+
+
+def link_priority(url: str, is_contact: bool, depth: int, include_paths: Iterable[str] = ()) -> float:
+    """Puntuación de una URL: mayor valor = se visita antes"""
+    path = urlparse(url).path.lower()
+    score = 0.0
+    if include_paths and any(path.startswith(p.lower()) for p in include_paths):
+        score += 20
+    if is_contact:
+        score += 10
+    if any(term in path for term in CONTACT_PATH_TERMS):
+        score += 5
+    return score - depth
+
+
+class CrawlFrontier:
+    """Cola de prioridad de URLs con límite por host y presupuesto de páginas"""
+
+    def __init__(self, max_pages: int, per_host_limit: int = CRAWL_MAX_PER_HOST):
+        self.max_pages = max_pages
+        self.per_host_limit = per_host_limit
+        self._heap: List[Tuple[float, int, str, int]] = []
+        self._counter = itertools.count()
+        self._in_flight: Dict[str, int] = {}
+        self._total_in_flight = 0
+        # Páginas entregadas que aún cuentan para el presupuesto (las fallidas se devuelven)
+        self._claimed = 0
+        self._closed = False
+        self._cond = asyncio.Condition()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def push(self, url: str, depth: int, priority: float = 0.0) -> None:
+        async with self._cond:
+            if self._closed:
+                return
+            heapq.heappush(self._heap, (-priority, next(self._counter), url, depth))
+            self._cond.notify()
+
+    async def pop(self) -> Optional[Tuple[str, int]]:
+        """
+        Espera la URL de mayor prioridad cuyo host tenga capacidad libre
+
+        Devuelve None cuando ya no habrá más trabajo: frontera cerrada, presupuesto
+        de páginas agotado o cola vacía sin peticiones en curso.
+        """
+        async with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                if self._claimed >= self.max_pages or not self._heap:
+                    if self._total_in_flight == 0:
+                        self._close_locked()
+                        return None
+                else:
+                    item = self._pop_ready()
+                    if item is not None:
+                        return item
+                await self._cond.wait()
+
+    async def done(self, url: str, fetched: bool) -> None:
+        """Libera el hueco del host; si la página no se pudo obtener devuelve su presupuesto"""
+        host = urlparse(url).netloc
+        async with self._cond:
+            remaining = self._in_flight.get(host, 1) - 1
+            if remaining > 0:
+                self._in_flight[host] = remaining
+            else:
+                self._in_flight.pop(host, None)
+            self._total_in_flight -= 1
+            if not fetched:
+                self._claimed -= 1
+            self._cond.notify_all()
+
+    async def close(self) -> None:
+        """Deja de entregar URLs (p. ej. al alcanzar el máximo de correos)"""
+        async with self._cond:
+            self._close_locked()
+
+    def _close_locked(self) -> None:
+        self._closed = True
+        self._heap.clear()
+        self._cond.notify_all()
+
+    def _pop_ready(self) -> Optional[Tuple[str, int]]:
+        # Saltar temporalmente las URLs de hosts saturados sin perder su posición
+        blocked = []
+        item = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            host = urlparse(entry[2]).netloc
+            if self._in_flight.get(host, 0) < self.per_host_limit:
+                self._in_flight[host] = self._in_flight.get(host, 0) + 1
+                self._total_in_flight += 1
+                self._claimed += 1
+                item = (entry[2], entry[3])
+                break
+            blocked.append(entry)
+        for entry in blocked:
+            heapq.heappush(self._heap, entry)
+        return item
@@ -0,0 +1,213 @@
+"""
+Cliente HTTP compartido por todos los escaneos del proceso.
+
+Una única aiohttp.ClientSession con keep-alive, caché de DNS y límites de
+conexiones (globales y por host). Los escaneos la toman prestada en lugar de
+crear su propia sesión, de modo que las conexiones TCP/TLS se reutilizan entre
+páginas y entre trabajos.
+"""
+import logging
+import os
+import re
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("webscraper")
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", 8))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+# Máximo de bytes que se leen de una página; el resto se descarta
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", 2 * 1024 * 1024))
+PAGE_CHUNK_SIZE = 64 * 1024
+
+# Marcadores de correos (arroba literal o como entidad) y de enlaces/imágenes, por separado:
+# casi todas las páginas tienen enlaces, así que solo los primeros deciden si hay correos
+_EMAIL_MARKER_RE = re.compile(rb'@|&#0*64;|&#x0*40;|&commat;', re.IGNORECASE)
+_LINK_MARKER_RE = re.compile(rb'href|<img', re.IGNORECASE)
+# Bytes del bloque anterior que se vuelven a mirar por si un marcador queda partido
+_MARKER_OVERLAP = 15
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+}
+
+_session: Optional[aiohttp.ClientSession] = None
+
+# Contadores globales del proceso
+_totals = {
+    "requests": 0,
+    "new_connections": 0,
+    "reused_connections": 0,
+    "dns_lookups": 0,
+    "dns_cache_hits": 0,
+}
+
+
+def new_connection_stats() -> Dict[str, int]:
+    """Contadores de conexión de un escaneo; se pasan como trace_request_ctx"""
+    return {key: 0 for key in _totals}
+
+
+def _counter(key: str):
+    async def _on_event(session, trace_config_ctx: SimpleNamespace, params) -> None:
+        _totals[key] += 1
+        job_stats = trace_config_ctx.trace_request_ctx
+        if isinstance(job_stats, dict) and key in job_stats:
+            job_stats[key] += 1
+    return _on_event
+
+
+def _build_trace_config() -> aiohttp.TraceConfig:
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_counter("requests"))
+    # Una conexión nueva implica handshake TCP (y TLS en https)
+    trace_config.on_connection_create_end.append(_counter("new_connections"))
+    trace_config.on_connection_reuseconn.append(_counter("reused_connections"))
+    trace_config.on_dns_resolvehost_end.append(_counter("dns_lookups"))
+    trace_config.on_dns_cache_hit.append(_counter("dns_cache_hits"))
+    return trace_config
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    """Crea una sesión con keep-alive, caché de DNS y límites de conexión"""
+    timeout = aiohttp.ClientTimeout(
+        total=30,  # Tiempo total de espera
+        connect=10,  # Tiempo para conectar
+        sock_connect=10,  # Tiempo para conectar el socket
+        sock_read=10  # Tiempo para leer del socket
+    )
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_MAX_CONNECTIONS,
+        limit_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+        use_dns_cache=True,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        enable_cleanup_closed=True,
+        ssl=False  # Desactivar verificación SSL
+    )
+    return aiohttp.ClientSession(
+        headers=DEFAULT_HEADERS,
+        timeout=timeout,
+        connector=connector,
+        trust_env=True,  # Usar configuraciones de proxy del sistema
+        auto_decompress=True,  # Manejar automáticamente la compresión
+        trace_configs=[_build_trace_config()]
+    )
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Devuelve la sesión compartida del proceso, creándola si aún no existe"""
+    global _session
+    if _session is None or _session.closed:
+        _session = create_http_session()
+        logger.info(f"Cliente HTTP compartido iniciado (límite={HTTP_MAX_CONNECTIONS}, "
+                    f"por host={HTTP_MAX_CONNECTIONS_PER_HOST})")
+    return _session
+
+
+def init_http_session() -> None:
+    """Crea la sesión compartida (se llama al arrancar la aplicación)"""
+    get_http_session()
+
+
+async def close_http_session() -> None:
+    """Cierra la sesión compartida (se llama al apagar la aplicación)"""
+    global _session
+    if _session is not None:
+        session, _session = _session, None
+        await session.close()
+        logger.info("Cliente HTTP compartido cerrado")
+
+
+class PageBody:
+    """Resultado de leer el cuerpo de una página en streaming"""
+    __slots__ = ("text", "size", "truncated", "has_emails", "has_links", "decoded")
+
+    def __init__(self, text: str, size: int, truncated: bool, has_emails: bool, has_links: bool,
+                 decoded: bool = True):
+        self.text = text
+        self.size = size
+        self.truncated = truncated
+        self.has_emails = has_emails
+        self.has_links = has_links
+        # False si se saltó la decodificación porque no había nada que extraer
+        self.decoded = decoded
+
+
+def _sniff_charset(head: bytes, declared: Optional[str]) -> str:
+    """Charset de la cabecera HTTP o del <meta charset>; utf-8 si no hay ninguno"""
+    if declared:
+        return declared
+    match = _META_CHARSET_RE.search(head)
+    if match:
+        return match.group(1).decode('ascii', 'ignore')
+    return 'utf-8'
+
+
+async def read_html_body(response: aiohttp.ClientResponse, max_bytes: int = PAGE_MAX_BYTES,
+                         need_links: bool = True) -> Optional[PageBody]:
+    """
+    Lee el cuerpo en bloques respetando un límite de bytes
+
+    Devuelve None si el contenido parece binario. Mientras llegan los bloques se
+    buscan por separado marcadores de correo (@ o su entidad) y de enlaces
+    (href, <img). Si no hay correos y el rastreo no necesita los enlaces de esta
+    página (need_links=False, o no los tiene) no hay nada que extraer y se evita
+    decodificarla (PageBody.text queda vacío).
+    """
+    chunks = []
+    size = 0
+    truncated = False
+    has_emails = False
+    has_links = False
+    tail = b''
+    async for chunk in response.content.iter_chunked(PAGE_CHUNK_SIZE):
+        if size == 0 and b'\x00' in chunk[:1024]:
+            # HTML mal etiquetado: en realidad es un binario
+            return None
+        if size + len(chunk) > max_bytes:
+            chunk = chunk[:max_bytes - size]
+            truncated = True
+        if not (has_emails and has_links):
+            window = tail + chunk
+            has_emails = has_emails or _EMAIL_MARKER_RE.search(window) is not None
+            has_links = has_links or _LINK_MARKER_RE.search(window) is not None
+            tail = window[-_MARKER_OVERLAP:]
+        chunks.append(chunk)
+        size += len(chunk)
+        if truncated:
+            break
+
+    if not has_emails and not (need_links and has_links):
+        return PageBody("", size, truncated, False, has_links, decoded=False)
+
+    raw = b''.join(chunks)
+    charset = _sniff_charset(raw[:2048], response.charset)
+    try:
+        text = raw.decode(charset, errors='replace')
+    except LookupError:
+        text = raw.decode('utf-8', errors='replace')
+    return PageBody(text, size, truncated, has_emails, has_links)
+
+
+def get_http_stats() -> Dict[str, Any]:
+    """Estadísticas de reutilización de conexiones del proceso"""
+    stats: Dict[str, Any] = dict(_totals)
+    connections = _totals["new_connections"] + _totals["reused_connections"]
+    stats["reuse_rate"] = round(_totals["reused_connections"] / connections, 3) if connections else 0.0
+    if _session is not None and not _session.closed:
+        connector = _session.connector
+        stats["limit"] = connector.limit
+        stats["limit_per_host"] = connector.limit_per_host
+    return stats
@@ -0,0 +1,545 @@
+"""
+Almacén persistente del estado de los trabajos de escaneo.
+
+El estado ya no vive en un dict del proceso: con `uvicorn --workers N` cualquier
+worker tiene que poder responder a /api/v1/status. Hay dos backends:
+
+- PostgresJobStore: tabla scrape_jobs usando el pool compartido (multi-nodo).
+- SQLiteJobStore: fichero SQLite embebido (un solo nodo, desarrollo y pruebas).
+
+Las actualizaciones de progreso se acumulan en memoria y se escriben por lotes
+cada JOB_STORE_FLUSH_INTERVAL segundos; la creación y los estados finales se
+escriben en el momento para que otros workers los vean de inmediato.
+
+La misma tabla hace de cola de trabajos: la API inserta en estado 'queued' y los
+procesos de rastreo (app.worker) los reclaman con FOR UPDATE SKIP LOCKED en
+PostgreSQL o con una transacción BEGIN IMMEDIATE en SQLite.
+
+Las solicitudes idénticas a un trabajo en curso (misma dedupe_key) no se
+encolan: se guardan como alias ('alias_of') y leen el estado del trabajo real.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .db import pg_connection
+
+load_dotenv()
+
+logger = logging.getLogger("webscraper")
+
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "postgres").lower()
+JOB_STORE_SQLITE_PATH = os.getenv("JOB_STORE_SQLITE_PATH", "scrape_jobs.sqlite3")
+JOB_STORE_FLUSH_INTERVAL = float(os.getenv("JOB_STORE_FLUSH_INTERVAL", 1.0))
+# Un trabajo en curso sin actualizaciones durante este tiempo se considera
+# abandonado (worker caído) y vuelve a la cola
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", 600))
+
+
+def _dumps(value: Dict[str, Any]) -> str:
+    return json.dumps(value, default=str)
+
+
+class JobStore(ABC):
+    """Base común: buffer de actualizaciones pendientes y tarea de volcado por lotes"""
+
+    def __init__(self, flush_interval: float = JOB_STORE_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+        await self._setup()
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    async def create(self, request_id: str, entry: Dict[str, Any]) -> None:
+        await self._insert(request_id, entry)
+
+    async def enqueue(self, request_id: str, entry: Dict[str, Any], params: Dict[str, Any],
+                      dedupe_key: Optional[str] = None) -> str:
+        """
+        Registra un trabajo en estado 'queued' con los parámetros para ejecutarlo
+
+        Si ya hay un trabajo en cola o en curso con la misma dedupe_key, request_id
+        se registra como alias suyo y se devuelve el request_id del trabajo real.
+        """
+        return await self._enqueue(request_id, {**entry, "status": "queued"}, params, dedupe_key)
+
+    async def find_inflight(self, dedupe_key: str) -> Optional[str]:
+        """request_id del trabajo en cola o en curso con esa clave, si lo hay"""
+        return await self._find_inflight(dedupe_key)
+
+    async def claim(self, worker_id: str, limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """Reclama hasta `limit` trabajos en cola; devuelve (request_id, params)"""
+        if limit <= 0:
+            return []
+        return await self._claim(worker_id, limit, time.time() - JOB_STALE_AFTER)
+
+    async def release(self, worker_id: str) -> int:
+        """Devuelve a la cola los trabajos en curso de un worker que se detiene"""
+        return await self._release(worker_id)
+
+    async def count_queued(self) -> int:
+        return await self._count_queued()
+
+    async def update(self, request_id: str, fields: Dict[str, Any], flush: bool = False) -> None:
+        """Acumula cambios; con flush=True (estados finales) se escriben ya"""
+        self._pending.setdefault(request_id, {}).update(fields)
+        if flush:
+            await self.flush(request_id)
+
+    async def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        entry = await self._fetch(request_id)
+        if entry is not None and entry.get("alias_of"):
+            # Solicitud agrupada con otra idéntica: el estado es el del trabajo real
+            return await self.get(entry["alias_of"])
+        pending = self._pending.get(request_id)
+        if pending:
+            # Leer también lo que este proceso aún no ha volcado
+            entry = {**(entry or {}), **pending}
+        return entry
+
+    async def resolve(self, request_id: str) -> Optional[str]:
+        """request_id del trabajo real (el propio o el del alias); None si no existe"""
+        entry = await self._fetch(request_id)
+        if entry is None:
+            return request_id if request_id in self._pending else None
+        return entry.get("alias_of") or request_id
+
+    async def flush(self, request_id: Optional[str] = None) -> None:
+        if request_id is not None:
+            batch = {request_id: self._pending.pop(request_id)} if request_id in self._pending else {}
+        else:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        try:
+            await self._write_batch(batch)
+        except Exception as e:
+            logger.error(f"Error guardando el estado de {len(batch)} trabajos: {str(e)}")
+            # Reintentar en el siguiente volcado sin pisar cambios más recientes
+            for req_id, fields in batch.items():
+                self._pending[req_id] = {**fields, **self._pending.get(req_id, {})}
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def purge_older_than(self, max_age_seconds: float) -> int:
+        """Elimina los trabajos terminados sin actualizar desde hace más de max_age_seconds"""
+        return await self._purge(time.time() - max_age_seconds)
+
+    # Implementación de cada backend
+    @abstractmethod
+    async def _setup(self) -> None:
+        ...
+
+    @abstractmethod
+    async def _insert(self, request_id: str, entry: Dict[str, Any],
+                      params: Optional[Dict[str, Any]] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def _enqueue(self, request_id: str, entry: Dict[str, Any], params: Dict[str, Any],
+                       dedupe_key: Optional[str]) -> str:
+        ...
+
+    @abstractmethod
+    async def _find_inflight(self, dedupe_key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def _claim(self, worker_id: str, limit: int, stale_before: float) -> List[Tuple[str, Dict[str, Any]]]:
+        ...
+
+    @abstractmethod
+    async def _release(self, worker_id: str) -> int:
+        ...
+
+    @abstractmethod
+    async def _count_queued(self) -> int:
+        ...
+
+    @abstractmethod
+    async def _write_batch(self, batch: Dict[str, Dict[str, Any]]) -> None:
+        ...
+
+    @abstractmethod
+    async def _fetch(self, request_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def _purge(self, cutoff: float) -> int:
+        ...
+
+
+class PostgresJobStore(JobStore):
+    """Estado de los trabajos en la tabla public.scrape_jobs"""
+
+    async def _setup(self) -> None:
+        async with pg_connection() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS public.scrape_jobs (
+                    request_id TEXT PRIMARY KEY,
+                    status VARCHAR(20) NOT NULL,
+                    data JSONB NOT NULL,
+                    params JSONB,
+                    claimed_by TEXT,
+                    dedupe_key TEXT,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                );
+                ALTER TABLE public.scrape_jobs ADD COLUMN IF NOT EXISTS params JSONB;
+                ALTER TABLE public.scrape_jobs ADD COLUMN IF NOT EXISTS claimed_by TEXT;
+                ALTER TABLE public.scrape_jobs ADD COLUMN IF NOT EXISTS dedupe_key TEXT;
+                CREATE INDEX IF NOT EXISTS idx_scrape_jobs_updated_at ON public.scrape_jobs(updated_at);
+                CREATE INDEX IF NOT EXISTS idx_scrape_jobs_queued ON public.scrape_jobs(created_at) WHERE status = 'queued';
+                CREATE INDEX IF NOT EXISTS idx_scrape_jobs_claimed_by ON public.scrape_jobs(claimed_by) WHERE status = 'processing';
+                CREATE INDEX IF NOT EXISTS idx_scrape_jobs_inflight ON public.scrape_jobs(dedupe_key) WHERE status IN ('queued', 'processing');
+            """)
+
+    _INSERT_SQL = """
+        INSERT INTO public.scrape_jobs (request_id, status, data, params, dedupe_key)
+        VALUES ($1, $2, $3::jsonb, $4::jsonb, $5)
+        ON CONFLICT (request_id) DO UPDATE
+        SET status = EXCLUDED.status, data = EXCLUDED.data, params = EXCLUDED.params,
+            dedupe_key = EXCLUDED.dedupe_key, updated_at = NOW()
+    """
+    _FIND_INFLIGHT_SQL = """
+        SELECT request_id FROM public.scrape_jobs
+        WHERE dedupe_key = $1 AND status IN ('queued', 'processing')
+        ORDER BY created_at
+        LIMIT 1
+    """
+
+    async def _insert(self, request_id: str, entry: Dict[str, Any],
+                      params: Optional[Dict[str, Any]] = None) -> None:
+        async with pg_connection() as conn:
+            await conn.execute(
+                self._INSERT_SQL,
+                request_id, entry.get("status", "processing"), _dumps(entry),
+                _dumps(params) if params is not None else None, None
+            )
+
+    async def _enqueue(self, request_id: str, entry: Dict[str, Any], params: Dict[str, Any],
+                       dedupe_key: Optional[str]) -> str:
+        async with pg_connection() as conn:
+            async with conn.transaction():
+                if dedupe_key:
+                    # Serializa las altas con la misma clave entre procesos
+                    await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", dedupe_key)
+                    primary = await conn.fetchval(self._FIND_INFLIGHT_SQL, dedupe_key)
+                    if primary is not None:
+                        await conn.execute(
+                            self._INSERT_SQL, request_id, "alias", _dumps({"status": "alias", "alias_of": primary}), None, None
+                        )
+                        return primary
+                await conn.execute(
+                    self._INSERT_SQL, request_id, entry["status"], _dumps(entry), _dumps(params), dedupe_key
+                )
+        return request_id
+
+    async def _find_inflight(self, dedupe_key: str) -> Optional[str]:
+        async with pg_connection() as conn:
+            return await conn.fetchval(self._FIND_INFLIGHT_SQL, dedupe_key)
+
+    async def _claim(self, worker_id: str, limit: int, stale_before: float) -> List[Tuple[str, Dict[str, Any]]]:
+        async with pg_connection() as conn:
+            async with conn.transaction():
+                # Recuperar trabajos de workers que dejaron de dar señales
+                await conn.execute(
+                    """
+                    UPDATE public.scrape_jobs
+                    SET status = 'queued', claimed_by = NULL, data = data || '{"status": "queued"}'::jsonb, updated_at = NOW()
+                    WHERE status = 'processing' AND params IS NOT NULL AND updated_at < to_timestamp($1)
+                    """,
+                    stale_before
+                )
+                rows = await conn.fetch(
+                    """
+                    WITH next AS (
+                        SELECT request_id FROM public.scrape_jobs
+                        WHERE status = 'queued'
+                        ORDER BY created_at
+                        LIMIT $2
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    UPDATE public.scrape_jobs j
+                    SET status = 'processing', claimed_by = $1, data = j.data || '{"status": "processing"}'::jsonb, updated_at = NOW()
+                    FROM next
+                    WHERE j.request_id = next.request_id
+                    RETURNING j.request_id, j.params
+                    """,
+                    worker_id, limit
+                )
+        return [(row["request_id"], json.loads(row["params"])) for row in rows if row["params"] is not None]
+
+    async def _release(self, worker_id: str) -> int:
+        async with pg_connection() as conn:
+            result = await conn.execute(
+                """
+                UPDATE public.scrape_jobs
+                SET status = 'queued', claimed_by = NULL, data = data || '{"status": "queued"}'::jsonb, updated_at = NOW()
+                WHERE claimed_by = $1 AND status = 'processing'
+                """,
+                worker_id
+            )
+        return int(result.split()[-1])
+
+    async def _count_queued(self) -> int:
+        async with pg_connection() as conn:
+            return await conn.fetchval("SELECT COUNT(*) FROM public.scrape_jobs WHERE status = 'queued'")
+
+    async def _write_batch(self, batch: Dict[str, Dict[str, Any]]) -> None:
+        async with pg_connection() as conn:
+            await conn.executemany(
+                """
+                UPDATE public.scrape_jobs
+                SET data = data || $2::jsonb, status = COALESCE($3, status), updated_at = NOW()
+                WHERE request_id = $1
+                """,
+                [(req_id, _dumps(fields), fields.get("status")) for req_id, fields in batch.items()]
+            )
+
+    async def _fetch(self, request_id: str) -> Optional[Dict[str, Any]]:
+        async with pg_connection() as conn:
+            data = await conn.fetchval("SELECT data FROM public.scrape_jobs WHERE request_id = $1", request_id)
+        return json.loads(data) if data is not None else None
+
+    async def _purge(self, cutoff: float) -> int:
+        async with pg_connection() as conn:
+            result = await conn.execute(
+                "DELETE FROM public.scrape_jobs WHERE updated_at < to_timestamp($1) AND status IN ('completed', 'error', 'alias', 'cancelled')",
+                cutoff
+            )
+        return int(result.split()[-1])
+
+
+class SQLiteJobStore(JobStore):
+    """Estado de los trabajos en un fichero SQLite local (modo WAL)"""
+
+    def __init__(self, path: str = JOB_STORE_SQLITE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _run(self, func, *args):
+        # sqlite3 es bloqueante: cada operación se ejecuta en el pool de hilos
+        def _locked():
+            with self._lock:
+                return func(*args)
+        return asyncio.to_thread(_locked)
+
+    def _setup_sync(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS scrape_jobs (
+                request_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL,
+                params TEXT,
+                claimed_by TEXT,
+                dedupe_key TEXT,
+                created_at REAL NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(scrape_jobs)")}
+        for column, ddl in (("params", "TEXT"), ("claimed_by", "TEXT"), ("dedupe_key", "TEXT"),
+                            ("created_at", "REAL NOT NULL DEFAULT 0")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE scrape_jobs ADD COLUMN {column} {ddl}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scrape_jobs_updated_at ON scrape_jobs(updated_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scrape_jobs_status ON scrape_jobs(status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scrape_jobs_dedupe_key ON scrape_jobs(dedupe_key)")
+
+    async def _setup(self) -> None:
+        if self._conn is None:
+            await self._run(self._setup_sync)
+
+    async def close(self) -> None:
+        await super().close()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+
+    def _insert_sync(self, request_id: str, entry: Dict[str, Any], params: Optional[Dict[str, Any]],
+                     dedupe_key: Optional[str] = None) -> None:
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO scrape_jobs (request_id, status, data, params, dedupe_key, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (request_id, entry.get("status", "processing"), _dumps(entry),
+             _dumps(params) if params is not None else None, dedupe_key, now, now)
+        )
+
+    async def _insert(self, request_id: str, entry: Dict[str, Any],
+                      params: Optional[Dict[str, Any]] = None) -> None:
+        await self._run(self._insert_sync, request_id, entry, params)
+
+    def _find_inflight_sync(self, dedupe_key: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT request_id FROM scrape_jobs WHERE dedupe_key = ? AND status IN ('queued', 'processing') "
+            "ORDER BY created_at LIMIT 1",
+            (dedupe_key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    async def _find_inflight(self, dedupe_key: str) -> Optional[str]:
+        return await self._run(self._find_inflight_sync, dedupe_key)
+
+    def _enqueue_sync(self, request_id: str, entry: Dict[str, Any], params: Dict[str, Any],
+                      dedupe_key: Optional[str]) -> str:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            primary = self._find_inflight_sync(dedupe_key) if dedupe_key else None
+            if primary is not None:
+                self._insert_sync(request_id, {"status": "alias", "alias_of": primary}, None)
+            else:
+                self._insert_sync(request_id, entry, params, dedupe_key)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return primary or request_id
+
+    async def _enqueue(self, request_id: str, entry: Dict[str, Any], params: Dict[str, Any],
+                       dedupe_key: Optional[str]) -> str:
+        return await self._run(self._enqueue_sync, request_id, entry, params, dedupe_key)
+
+    def _set_status(self, request_id: str, data: str, status: str, worker_id: Optional[str], now: float) -> None:
+        data = _dumps({**json.loads(data), "status": status})
+        self._conn.execute(
+            "UPDATE scrape_jobs SET status = ?, claimed_by = ?, data = ?, updated_at = ? WHERE request_id = ?",
+            (status, worker_id, data, now, request_id)
+        )
+
+    def _claim_sync(self, worker_id: str, limit: int, stale_before: float) -> List[Tuple[str, Dict[str, Any]]]:
+        # BEGIN IMMEDIATE toma el bloqueo de escritura: hace el papel de SKIP LOCKED
+        # entre procesos que comparten el fichero
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            stale = conn.execute(
+                "SELECT request_id, data FROM scrape_jobs "
+                "WHERE status = 'processing' AND params IS NOT NULL AND updated_at < ?",
+                (stale_before,)
+            ).fetchall()
+            for request_id, data in stale:
+                self._set_status(request_id, data, "queued", None, now)
+            rows = conn.execute(
+                "SELECT request_id, data, params FROM scrape_jobs WHERE status = 'queued' "
+                "ORDER BY created_at LIMIT ?",
+                (limit,)
+            ).fetchall()
+            claimed = []
+            for request_id, data, params in rows:
+                self._set_status(request_id, data, "processing", worker_id, now)
+                if params is not None:
+                    claimed.append((request_id, json.loads(params)))
+            conn.execute("COMMIT")
+            return claimed
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def _claim(self, worker_id: str, limit: int, stale_before: float) -> List[Tuple[str, Dict[str, Any]]]:
+        return await self._run(self._claim_sync, worker_id, limit, stale_before)
+
+    def _release_sync(self, worker_id: str) -> int:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT request_id, data FROM scrape_jobs WHERE claimed_by = ? AND status = 'processing'",
+                (worker_id,)
+            ).fetchall()
+            now = time.time()
+            for request_id, data in rows:
+                self._set_status(request_id, data, "queued", None, now)
+            conn.execute("COMMIT")
+            return len(rows)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def _release(self, worker_id: str) -> int:
+        return await self._run(self._release_sync, worker_id)
+
+    def _count_queued_sync(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM scrape_jobs WHERE status = 'queued'").fetchone()[0]
+
+    async def _count_queued(self) -> int:
+        return await self._run(self._count_queued_sync)
+
+    def _write_batch_sync(self, batch: Dict[str, Dict[str, Any]]) -> None:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            for req_id, fields in batch.items():
+                row = conn.execute("SELECT data FROM scrape_jobs WHERE request_id = ?", (req_id,)).fetchone()
+                if row is None:
+                    continue
+                data = {**json.loads(row[0]), **fields}
+                conn.execute(
+                    "UPDATE scrape_jobs SET data = ?, status = ?, updated_at = ? WHERE request_id = ?",
+                    (_dumps(data), data.get("status", "processing"), now, req_id)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def _write_batch(self, batch: Dict[str, Dict[str, Any]]) -> None:
+        await self._run(self._write_batch_sync, batch)
+
+    def _fetch_sync(self, request_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT data FROM scrape_jobs WHERE request_id = ?", (request_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def _fetch(self, request_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._fetch_sync, request_id)
+
+    def _purge_sync(self, cutoff: float) -> int:
+        cursor = self._conn.execute(
+            "DELETE FROM scrape_jobs WHERE updated_at < ? AND status IN ('completed', 'error', 'alias', 'cancelled')", (cutoff,)
+        )
+        return cursor.rowcount
+
+    async def _purge(self, cutoff: float) -> int:
+        return await self._run(self._purge_sync, cutoff)
+
+
+def create_job_store(backend: str = JOB_STORE_BACKEND) -> JobStore:
+    if backend == "sqlite":
+        return SQLiteJobStore()
+    if backend == "postgres":
+        return PostgresJobStore()
+    raise RuntimeError(f"JOB_STORE_BACKEND desconocido: {backend} (usa 'postgres' o 'sqlite')")
+
+
+# Almacén compartido por todo el proceso
+job_store = create_job_store()
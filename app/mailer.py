@@ -0,0 +1,316 @@
+"""
+Envío de correo asíncrono con conexiones SMTP persistentes.
+
+Antes cada mensaje abría su propia conexión (TCP + STARTTLS + LOGIN) dentro de
+una BackgroundTask, ocupando un hilo del pool durante todo el handshake; un pico
+de registros era una tormenta de handshakes. Ahora los handlers solo encolan:
+
+- una cola acotada (MAIL_QUEUE_SIZE) desacopla las peticiones del envío;
+- MAIL_CONNECTIONS conexiones persistentes la vacían, cada una enviando lotes de
+  hasta MAIL_BATCH_SIZE mensajes por la misma sesión SMTP (smtplib es bloqueante,
+  así que cada lote se envía en un hilo, fuera del event loop);
+- los errores temporales se reintentan con espera exponencial hasta
+  MAIL_MAX_ATTEMPTS; los rechazos permanentes (5xx) no se reintentan;
+- las conexiones inactivas más de MAIL_IDLE_TIMEOUT segundos se cierran.
+
+Para pruebas locales basta un servidor SMTP de desarrollo sin TLS ni
+autenticación (EMAIL_USE_TLS=false y EMAIL_USER vacío), por ejemplo
+`python -m aiosmtpd -n -l localhost:1025` o MailHog.
+"""
+import asyncio
+import logging
+import os
+import smtplib
+import time
+from email.message import Message
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("webscraper")
+
+EMAIL_HOST = os.getenv("EMAIL_HOST")
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
+EMAIL_USER = os.getenv("EMAIL_USER")
+EMAIL_PASS = os.getenv("EMAIL_PASS")
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "true").lower() in ("1", "true", "yes")
+
+MAIL_CONNECTIONS = int(os.getenv("MAIL_CONNECTIONS", 2))
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", 1000))
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", 20))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 5))
+MAIL_RETRY_BASE_DELAY = float(os.getenv("MAIL_RETRY_BASE_DELAY", 2))
+MAIL_IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", 60))
+MAIL_TIMEOUT = float(os.getenv("MAIL_TIMEOUT", 30))
+# Segundos para vaciar la cola al apagar antes de descartar lo pendiente
+MAIL_SHUTDOWN_GRACE = float(os.getenv("MAIL_SHUTDOWN_GRACE", 5))
+
+
+class OutgoingMail:
+    __slots__ = ("sender", "recipient", "message", "on_failure", "attempts", "queued_at")
+
+    def __init__(self, sender: str, recipient: str, message: Message,
+                 on_failure: Optional[Callable[[Exception], None]] = None):
+        self.sender = sender
+        self.recipient = recipient
+        self.message = message
+        self.on_failure = on_failure
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+
+
+class SMTPConnection:
+    """Sesión SMTP reutilizable; solo la usa una tarea de envío a la vez"""
+
+    def __init__(self, host: str, port: int, username: Optional[str], password: Optional[str],
+                 use_tls: bool, timeout: float, stats: Dict[str, Any]):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.stats = stats
+        self._smtp: Optional[smtplib.SMTP] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._smtp is not None
+
+    def open(self) -> None:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.use_tls:
+                smtp.starttls()
+                smtp.ehlo()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self.stats["connections_opened"] += 1
+
+    def close(self) -> None:
+        if self._smtp is None:
+            return
+        smtp, self._smtp = self._smtp, None
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    def send(self, mail: OutgoingMail) -> None:
+        if self._smtp is None:
+            self.open()
+        try:
+            self._smtp.sendmail(mail.sender, [mail.recipient], mail.message.as_string())
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # El servidor cerró la sesión inactiva: reconectar una vez y reintentar
+            self._smtp = None
+            self.stats["reconnects"] += 1
+            self.open()
+            self._smtp.sendmail(mail.sender, [mail.recipient], mail.message.as_string())
+
+    def send_batch(self, batch: List[OutgoingMail]) -> List[Tuple[OutgoingMail, Optional[Exception]]]:
+        """Se ejecuta en un hilo: envía el lote por la misma sesión"""
+        results = []
+        for mail in batch:
+            try:
+                self.send(mail)
+                results.append((mail, None))
+            except Exception as e:
+                if not isinstance(e, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                                      smtplib.SMTPDataError)):
+                    # Sesión en estado desconocido: la siguiente la abre de nuevo
+                    self.close()
+                results.append((mail, e))
+        return results
+
+
+def is_permanent(error: Exception) -> bool:
+    """Rechazos 5xx: reintentar no cambiaría el resultado"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+class MailSender:
+    """Cola de envío compartida por todas las peticiones del proceso"""
+
+    def __init__(self, host: Optional[str] = EMAIL_HOST, port: int = EMAIL_PORT,
+                 username: Optional[str] = EMAIL_USER, password: Optional[str] = EMAIL_PASS,
+                 use_tls: bool = EMAIL_USE_TLS, connections: int = MAIL_CONNECTIONS,
+                 queue_size: int = MAIL_QUEUE_SIZE, batch_size: int = MAIL_BATCH_SIZE,
+                 max_attempts: int = MAIL_MAX_ATTEMPTS, retry_base_delay: float = MAIL_RETRY_BASE_DELAY,
+                 idle_timeout: float = MAIL_IDLE_TIMEOUT, timeout: float = MAIL_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.connections = max(1, connections)
+        self.queue_size = queue_size
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_delay = retry_base_delay
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retrying = 0
+        # Correos sacados de la cola cuyo lote aún no ha terminado
+        self._sending = 0
+        self.stats = {
+            "queued": 0,
+            "sent": 0,
+            "failed": 0,
+            "retried": 0,
+            "rejected": 0,
+            "batches": 0,
+            "connections_opened": 0,
+            "reconnects": 0,
+            "latency_total_ms": 0.0,
+            "latency_max_ms": 0.0,
+        }
+
+    def start(self) -> None:
+        if self._queue is None:
+            # La cola y las tareas se crean dentro del event loop en ejecución
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._tasks = [asyncio.create_task(self._sender_loop()) for _ in range(self.connections)]
+
+    async def close(self, grace: float = MAIL_SHUTDOWN_GRACE) -> None:
+        if self._queue is None:
+            return
+        # join() también espera a los lotes que ya se están enviando en un hilo,
+        # aunque la cola esté vacía; cancelarlos perdería esos correos
+        try:
+            await asyncio.wait_for(self._queue.join(), grace)
+        except asyncio.TimeoutError:
+            logger.warning(f"Se descartan {self._queue.qsize()} correos en cola y "
+                           f"{self._sending} en envío al apagar")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, sender: str, recipient: str, message: Message,
+               on_failure: Optional[Callable[[Exception], None]] = None) -> bool:
+        """
+        Encola un mensaje sin esperar al envío
+
+        Devuelve False si la cola está llena (se llama a on_failure). on_failure
+        también se llama si el mensaje agota sus reintentos.
+        """
+        mail = OutgoingMail(sender, recipient, message, on_failure)
+        if not self.host:
+            # Sin servidor configurado (entorno local): fallar ya para que actúe on_failure
+            self._give_up(mail, RuntimeError("EMAIL_HOST no configurado"))
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait(mail)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            logger.error(f"Cola de correo llena ({self.queue_size}), no se envía el mensaje a {recipient}")
+            self._give_up(mail, RuntimeError("Cola de correo llena"))
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    async def _sender_loop(self) -> None:
+        conn = SMTPConnection(self.host, self.port, self.username, self.password,
+                              self.use_tls, self.timeout, self.stats)
+        try:
+            while True:
+                try:
+                    first = await asyncio.wait_for(self._queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    # Sin tráfico: liberar la sesión en lugar de mantenerla abierta
+                    if conn.connected:
+                        await asyncio.to_thread(conn.close)
+                    continue
+                batch = [first]
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                self._sending += len(batch)
+                try:
+                    results = await asyncio.to_thread(conn.send_batch, batch)
+                finally:
+                    self._sending -= len(batch)
+                    for _ in batch:
+                        self._queue.task_done()
+                self.stats["batches"] += 1
+                for mail, error in results:
+                    if error is None:
+                        self._record_sent(mail)
+                    else:
+                        self._retry_or_fail(mail, error)
+        finally:
+            # QUIT también es bloqueante: fuera del event loop
+            await asyncio.to_thread(conn.close)
+
+    def _record_sent(self, mail: OutgoingMail) -> None:
+        latency_ms = (time.monotonic() - mail.queued_at) * 1000
+        self.stats["sent"] += 1
+        self.stats["latency_total_ms"] += latency_ms
+        self.stats["latency_max_ms"] = max(self.stats["latency_max_ms"], latency_ms)
+
+    def _retry_or_fail(self, mail: OutgoingMail, error: Exception) -> None:
+        mail.attempts += 1
+        if is_permanent(error) or mail.attempts >= self.max_attempts:
+            logger.error(f"No se pudo enviar el correo a {mail.recipient} "
+                         f"tras {mail.attempts} intentos: {str(error)}")
+            self._give_up(mail, error)
+            return
+        delay = self.retry_base_delay * (2 ** (mail.attempts - 1))
+        logger.warning(f"Error enviando correo a {mail.recipient} (intento {mail.attempts}), "
+                       f"reintento en {delay:g}s: {str(error)}")
+        self.stats["retried"] += 1
+        self._retrying += 1
+        asyncio.get_running_loop().call_later(delay, self._requeue, mail)
+
+    def _requeue(self, mail: OutgoingMail) -> None:
+        self._retrying -= 1
+        if self._queue is None:
+            self._give_up(mail, RuntimeError("Envío de correo detenido"))
+            return
+        try:
+            self._queue.put_nowait(mail)
+        except asyncio.QueueFull:
+            self._give_up(mail, RuntimeError("Cola de correo llena"))
+
+    def _give_up(self, mail: OutgoingMail, error: Exception) -> None:
+        self.stats["failed"] += 1
+        if mail.on_failure is not None:
+            try:
+                mail.on_failure(error)
+            except Exception as e:
+                logger.error(f"Error en on_failure del correo a {mail.recipient}: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        sent = self.stats["sent"]
+        stats = {k: v for k, v in self.stats.items() if k != "latency_total_ms"}
+        stats["latency_max_ms"] = round(stats["latency_max_ms"], 1)
+        return {
+            "connections": self.connections,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "retrying": self._retrying,
+            "sending": self._sending,
+            "latency_avg_ms": round(self.stats["latency_total_ms"] / sent, 1) if sent else 0.0,
+            **stats,
+        }
+
+
+# Cola de envío compartida por todo el proceso
+mail_sender = MailSender()
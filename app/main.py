@@ -6,11 +6,11 @@ load_dotenv(override=True)
 
 # Ahora importar el resto de dependencias
 try:
-    from fastapi import FastAPI, HTTPException, Query, BackgroundTasks, Depends
+    from fastapi import FastAPI, HTTPException, Query, BackgroundTasks, Depends, Header, File, Form, UploadFile
     from fastapi.middleware.cors import CORSMiddleware
     from fastapi.security import OAuth2PasswordBearer
     from pydantic import BaseModel, Field, HttpUrl, EmailStr
-    from typing import List, Optional, Dict, Any, Union, Set, Tuple
+    from typing import List, Optional, Dict, Any, Union, Set, Tuple, Callable, Awaitable
     import asyncio
     import aiohttp
     import re
@@ -19,17 +19,36 @@ try:
     import time
     from datetime import datetime
     import json
+    import hashlib
     import io
     from io import BytesIO
     import base64
     from PIL import Image
     import pytesseract
-    from fastapi.responses import JSONResponse
+    from fastapi.responses import JSONResponse, StreamingResponse
     from fastapi.openapi.docs import get_swagger_ui_html
     from fastapi.openapi.utils import get_openapi
     import logging
     logger = logging.getLogger("webscraper")
     logger.setLevel(logging.INFO)
+    from itertools import chain
+    from .ocr import get_tesseract_cmd, run_ocr, new_job_limiter, init_ocr_pool, close_ocr_pool, get_ocr_stats
+    from .ocr_cache import ocr_cache, content_hash
+    from .http_client import (DEFAULT_HEADERS, create_http_session, get_http_session, init_http_session,
+                              close_http_session, new_connection_stats, get_http_stats, read_html_body)
+    from .frontier import CrawlFrontier, link_priority, CRAWL_WORKERS
+    from .urls import SeenURLs, canonical_host, canonicalize_url, site_domain
+    from .extraction import PageAnalysis, analyze_page, make_soup, find_emails, filter_emails, is_valid_email
+    from .job_store import job_store
+    from .worker import (ScrapeWorker, JOB_EMBEDDED_WORKER, JOB_POLL_INTERVAL, JOB_QUEUE_MAX_PENDING,
+                         JOB_QUEUE_RETRY_AFTER)
+    from .ttl_cache import TTLCache
+    from .page_cache import page_cache
+    from .progress import progress_broker, format_sse, JobChannel
+    from .email_writer import EmailSink, email_writer
+    from .passwords import init_password_pool, close_password_pool, get_password_stats
+    from .revocation import token_revocations
+    from .mailer import mail_sender
 
 except ImportError as e:
     print(f"Error importing dependencies: {e}")
@@ -37,6 +56,7 @@ except ImportError as e:
 
 # Import auth router
 from . import auth
+from . import results
 import aiohttp
 from typing import Union
 
@@ -284,22 +304,6 @@ def custom_openapi():
 
 app.openapi = custom_openapi
 
-# Limpieza de entradas antiguas en caché
-async def cleanup_old_entries(current_request_id: str, max_age_hours: int = 1):
-    """Elimina entradas antiguas de la caché"""
-    await asyncio.sleep(3600 * max_age_hours)  # Esperar el tiempo especificado
-    current_time = datetime.now()
-    
-    for req_id in list(result_cache.keys()):
-        if req_id == current_request_id:
-            continue
-            
-        entry_time = datetime.fromisoformat(result_cache[req_id]["timestamp"])
-        if (current_time - entry_time).total_seconds() > (3600 * max_age_hours):
-            del result_cache[req_id]
-            logger.debug(f"Eliminada entrada antigua de caché: {req_id}")
-
-
 load_dotenv()
 
 
@@ -319,43 +323,103 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Resultados de trabajos terminados: no cambian, así que /status puede servirlos
+# desde memoria sin consultar el almacén en cada sondeo
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 3600))
+JOB_RESULT_CACHE_MAX_ENTRIES = int(os.getenv("JOB_RESULT_CACHE_MAX_ENTRIES", 1000))
+JOB_PURGE_INTERVAL = int(os.getenv("JOB_PURGE_INTERVAL", 300))
+FINISHED_STATUSES = ("completed", "error")
 
-result_cache: Dict[str, Dict[str, Any]] = {}
+result_cache: TTLCache[Dict[str, Any]] = TTLCache(max_entries=JOB_RESULT_CACHE_MAX_ENTRIES, ttl=JOB_RESULT_TTL)
 
-class ScrapeRequest(BaseModel):
-    """Modelo para la solicitud de escaneo"""
-    url: HttpUrl = Field(..., description="URL del sitio web a escanear (ej: https://ejemplo.com)")
+# Solicitudes que se agruparon con un trabajo idéntico ya en curso
+coalesce_stats = {"coalesced": 0}
+
+# Con max_age, a partir de esta fracción de la antigüedad se relanza el escaneo en segundo plano
+FRESHNESS_REFRESH_RATIO = float(os.getenv("FRESHNESS_REFRESH_RATIO", 0.8))
+freshness_stats = {"fresh_hits": 0, "misses": 0, "refreshes": 0}
+
+class ScrapeConfig(BaseModel):
+    """Parámetros de rastreo comunes a un escaneo individual y a un lote"""
     max_pages: int = Field(10, ge=1, le=50, description="Número máximo de páginas a escanear")
     max_emails: int = Field(50, ge=1, le=200, description="Número máximo de correos a encontrar")
     include_paths: Optional[List[str]] = Field(None, description="Rutas específicas a incluir (ej: /contacto, /about)")
     exclude_domains: Optional[List[str]] = Field(None, description="Dominios a excluir (ej: google.com, facebook.com)")
     timeout: int = Field(30, ge=5, le=120, description="Tiempo máximo de escaneo en segundos")
     max_depth: int = Field(2, ge=1, le=5, description="Profundidad máxima de navegación (niveles)")
+    cache_max_age: int = Field(0, ge=0, le=604800, description="Reutilizar páginas en caché con menos de estos segundos sin consultar el sitio (0 = revalidar siempre)")
+
+class ScrapeRequest(ScrapeConfig):
+    """Modelo para la solicitud de escaneo"""
+    url: HttpUrl = Field(..., description="URL del sitio web a escanear (ej: https://ejemplo.com)")
+    max_age: Optional[int] = Field(None, ge=1, le=2592000, description="Si la URL se escaneó hace menos de estos segundos, responder con los correos ya guardados sin rastrear")
+
+    def dedupe_key(self) -> str:
+        """
+        Clave de las solicitudes equivalentes: misma URL canónica, límites y filtros
+
+        Incluye el tiempo máximo y la antigüedad aceptada de la caché de páginas:
+        una solicitud no debe recibir un escaneo cortado antes o hecho con páginas
+        más viejas de lo que pidió.
+        """
+        normalized = {
+            "url": canonicalize_url(str(self.url)),
+            "max_pages": self.max_pages,
+            "max_emails": self.max_emails,
+            "max_depth": self.max_depth,
+            "timeout": self.timeout,
+            "cache_max_age": self.cache_max_age,
+            "include_paths": sorted(set(self.include_paths or [])),
+            "exclude_domains": sorted({d.lower() for d in self.exclude_domains or []}),
+        }
+        return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+class BulkScrapeRequest(BaseModel):
+    """Lote de sitios que comparten la misma configuración de rastreo"""
+    urls: List[HttpUrl] = Field(..., description="URLs de los sitios a escanear")
+    config: ScrapeConfig = Field(default_factory=ScrapeConfig, description="Configuración aplicada a todos los sitios")
 
 class ScrapeResponse(BaseModel):
     """Modelo para la respuesta del escaneo"""
     request_id: str = Field(..., description="ID único de la solicitud")
-    status: str = Field(..., description="Estado del escaneo (processing|completed|failed)")
+    status: str = Field(..., description="Estado del escaneo (queued|processing|completed|error)")
     url: str = Field(..., description="URL escaneada")
     emails: Optional[List[str]] = Field(None, description="Lista de correos encontrados")
     pages_scanned: int = Field(0, description="Número de páginas escaneadas")
     emails_found: int = Field(0, description="Número de correos encontrados")
     error: Optional[str] = Field(None, description="Mensaje de error en caso de fallo")
     timestamp: str = Field(..., description="Fecha y hora de la respuesta")
+    http_stats: Optional[Dict[str, int]] = Field(None, description="Conexiones HTTP nuevas/reutilizadas del escaneo")
+    cached_at: Optional[str] = Field(None, description="Fecha del escaneo anterior cuyos correos se reutilizaron (max_age)")
+    partial: bool = Field(False, description="El escaneo no terminó; emails contiene lo encontrado (y guardado) hasta el error")
+    unsaved_batches: int = Field(0, description="Lotes de correos que no se pudieron guardar en found_emails")
+
+# Extensiones de recursos que no se rastrean como páginas
+SKIPPED_LINK_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.pdf', '.zip', '.mp4', '.mp3',
+                           '.css', '.js', '.svg', '.ico', '.woff', '.ttf', '.eot')
 
 class EmailScraper:
     """Clase para realizar el escaneo de correos electrónicos"""
     
-    def __init__(self, max_workers: int = 5):
-        self.session = None
+    def __init__(self, max_workers: int = 5, session: Optional[aiohttp.ClientSession] = None,
+                 on_progress: Optional[Callable[[int, int, List[str]], Awaitable[None]]] = None,
+                 cache_max_age: int = 0):
+        # Sesión HTTP compartida del proceso; si no se recibe, se crea una propia en __aenter__
+        self.session = session
+        # Antigüedad máxima (s) de una página en caché para usarla sin revalidar
+        self.cache_max_age = cache_max_age
+        # Se llama con (páginas escaneadas, correos encontrados, correos nuevos) tras cada página
+        self.on_progress = on_progress
+        self._owns_session = session is None
         self.semaphore = asyncio.Semaphore(max_workers)
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        self.ocr_limiter = new_job_limiter()
+        self.headers = dict(DEFAULT_HEADERS)
+        # Contadores de conexiones nuevas/reutilizadas de este escaneo
+        self.http_stats = new_connection_stats()
         # Inicializar atributos adicionales
         self.visited_urls = set()
         self.emails = set()
-        self.queue = None
+        self.frontier = None
         self.max_pages = 10
         self.max_emails = 50
         self.include_paths = set()
@@ -364,110 +428,84 @@ class EmailScraper:
         self.base_domain = ""
     
     async def __aenter__(self):
-        # Configuración mejorada de la sesión HTTP
-        timeout = aiohttp.ClientTimeout(
-            total=30,  # Tiempo total de espera
-            connect=10,  # Tiempo para conectar
-            sock_connect=10,  # Tiempo para conectar el socket
-            sock_read=10  # Tiempo para leer del socket
-        )
-        
-        # Configuración de la sesión con soporte para compresión
-        connector = aiohttp.TCPConnector(
-            limit=100,  # Número máximo de conexiones
-            force_close=True,
-            enable_cleanup_closed=True,
-            ssl=False  # Desactivar verificación SSL
-        )
-        
-        self.session = aiohttp.ClientSession(
-            headers=self.headers,
-            timeout=timeout,
-            connector=connector,
-            trust_env=True,  # Usar configuraciones de proxy del sistema
-            auto_decompress=True  # Manejar automáticamente la compresión
-        )
-        
-        # Añadir encabezados de aceptación de compresión
-        self.session.headers.update({
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-        })
-        
+        if self.session is None:
+            self.session = create_http_session()
+            self._owns_session = True
         return self
     
     async def __aexit__(self, exc_type, exc, tb):
-        if self.session:
+        # La sesión compartida la cierra la aplicación al apagarse
+        if self.session and self._owns_session:
             await self.session.close()
             
     async def extract_text_from_image(self, image_url: str) -> Optional[str]:
         """
         Extrae texto de una imagen usando OCR (Reconocimiento Óptico de Caracteres)
+        
+        La descarga se hace en el event loop; el OCR se ejecuta en el pool de procesos.
         """
         try:
-            # Configurar la ruta exacta de Tesseract encontrada en el sistema
-            import platform, os
-            system_type = platform.system()
-            if system_type == "Windows":
-                tesseract_path = r'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
-            else:
-                tesseract_path = '/usr/bin/tesseract'
-            logger.info(f"[OCR] platform.system() = {system_type}, usando tesseract_path = {tesseract_path}")
-            if system_type != "Windows" and not os.path.exists(tesseract_path):
-                logger.error(f"[OCR] Tesseract no está instalado en {tesseract_path}. Instálalo con 'apt-get install tesseract-ocr'")
-                return None
-            try:
-                pytesseract.pytesseract.tesseract_cmd = tesseract_path
-                # Verificar que Tesseract funciona
-                pytesseract.get_tesseract_version()
-            except Exception as e:
-                logger.error(f"Error al inicializar Tesseract en {tesseract_path}: {str(e)}")
+            if not get_tesseract_cmd():
                 return None
             
             # Validar si la imagen es una ruta local y existe
-            from urllib.parse import urlparse
             parsed = urlparse(image_url)
             if not parsed.scheme or parsed.scheme == 'file':
                 # Es ruta local
                 if not os.path.exists(image_url):
                     logger.warning(f"[OCR] Imagen local no encontrada: {image_url}")
                     return None
+            # Imagen ya analizada: si sigue fresca no hace falta ni descarga ni OCR
+            cached = await ocr_cache.lookup(image_url)
+            if cached is not None and ocr_cache.is_fresh(cached):
+                return ocr_cache.fresh_hit(cached) or None
+            
+            # Si no, revalidar con ETag/Last-Modified
+            request_headers = {}
+            if cached is not None:
+                if cached.get("etag"):
+                    request_headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    request_headers["If-Modified-Since"] = cached["last_modified"]
+            
             # Descargar la imagen
-            async with self.session.get(image_url, timeout=10) as response:
+            async with self.session.get(image_url, headers=request_headers, timeout=10,
+                                        trace_request_ctx=self.http_stats) as response:
+                if response.status == 304 and cached is not None:
+                    return (await ocr_cache.revalidated_hit(image_url, cached)) or None
                 if response.status != 200:
                     return None
                     
                 image_data = await response.read()
-                
-                # Verificar si es una imagen
-                if not image_data.startswith(b'\xff\xd8') and not image_data.startswith(b'\x89PNG'):
-                    return None
-                
-                try:
-                    # Procesar la imagen con PIL
-                    image = Image.open(BytesIO(image_data))
-                    
-                    # Convertir a escala de grises para mejor OCR
-                    if image.mode != 'L':
-                        image = image.convert('L')
-                    
-                    # Mejorar el contraste para mejor reconocimiento
-                    from PIL import ImageEnhance
-                    enhancer = ImageEnhance.Contrast(image)
-                    image = enhancer.enhance(2.0)  # Aumentar contraste
-                    
-                    # Extraer texto en inglés (cambiar a 'spa' una vez instalado el paquete de idioma español)
-                    text = pytesseract.image_to_string(image, lang='eng')
-                    
-                    # Limpiar y devolver solo líneas con @ (posibles correos)
-                    email_lines = [line.strip() for line in text.split('\n') if '@' in line]
-                    
-                    return '\n'.join(email_lines) if email_lines else None
-                    
-                except Exception as img_error:
-                    logger.warning(f"Error al procesar imagen {image_url}: {str(img_error)}")
-                    return None
+                validators = response.headers
+            
+            digest = content_hash(image_data)
+            etag = validators.get("ETag")
+            last_modified = validators.get("Last-Modified")
+            
+            # La misma imagen puede servirse desde otra URL
+            result = await ocr_cache.content_hit(image_url, digest, etag, last_modified)
+            if result is not None:
+                return result or None
+            
+            # Verificar si es una imagen
+            if not image_data.startswith(b'\xff\xd8') and not image_data.startswith(b'\x89PNG'):
+                await ocr_cache.put(image_url, digest, "", etag, last_modified)
+                return None
+            
+            # Extraer texto en inglés (cambiar OCR_LANG a 'spa' una vez instalado el paquete de idioma español)
+            text = await run_ocr(image_data, self.ocr_limiter)
+            if text is None:
+                # Fallo o cola llena: no se guarda para reintentar en la próxima visita
+                ocr_cache.record_miss()
+                return None
+            
+            # Limpiar y devolver solo líneas con @ (posibles correos)
+            email_lines = [line.strip() for line in text.split('\n') if '@' in line]
+            result = '\n'.join(email_lines)
+            await ocr_cache.put(image_url, digest, result, etag, last_modified)
+            
+            return result or None
                 
         except Exception as e:
             logger.warning(f"Error al procesar imagen {image_url}: {str(e)}")
@@ -475,80 +513,44 @@ class EmailScraper:
     
     def is_valid_email(self, email: str) -> bool:
         """Verifica si un correo electrónico es válido"""
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(pattern, email) is not None
+        return is_valid_email(email)
     
-    async def extract_emails_from_page(self, content: str, base_url: str) -> Set[str]:
+    async def extract_emails_from_page(self, content: str, base_url: str,
+                                       analysis: Optional[PageAnalysis] = None) -> Set[str]:
         """
         Extrae correos electrónicos de una página web, incluyendo aquellos en imágenes
-        """
-        emails = set()
-        soup = BeautifulSoup(content, 'html.parser')
-        
-        # 1. Extraer correos del texto de la página
-        text = soup.get_text()
-        email_pattern = r'\b(?!.*\.(?:png|jpg|jpeg|gif|webp|svg|ico))[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b'
-        text_emails = re.findall(email_pattern, text, re.IGNORECASE)
         
-        # 2. Extraer correos de atributos que puedan contener correos
-        attr_emails = set()
-        for tag in soup.find_all(True):  # Buscar en todos los tags
-            for attr in ['href', 'data-email', 'data-contact', 'data-mail', 'data-email-address']:
-                if attr in tag.attrs and '@' in tag[attr]:
-                    # Extraer correos de atributos como mailto: o data-email
-                    attr_value = tag[attr]
-                    if attr == 'href' and attr_value.startswith('mailto:'):
-                        email = attr_value[7:].split('?')[0]  # Eliminar 'mailto:' y parámetros
-                        attr_emails.add(email.strip())
-                    elif '@' in attr_value:
-                        # Buscar correos en otros atributos
-                        found_emails = re.findall(email_pattern, attr_value, re.IGNORECASE)
-                        attr_emails.update(found_emails)
+        Si se recibe el análisis ya hecho de la página se reutiliza en lugar de volver a parsearla.
+        """
+        if analysis is None:
+            analysis = analyze_page(content, base_url)
+        text_emails = analysis.text_emails
+        attr_emails = analysis.attr_emails
         
-        # 3. Buscar correos en imágenes (solo si es necesario)
+        # Buscar correos en imágenes cuyo nombre sugiere que contienen uno
+        # (en paralelo; el pool de OCR limita cuántas se procesan a la vez)
         image_emails = set()
-        if len(emails) < 5:  # Solo buscar en imágenes si no encontramos suficientes correos
-            for img in soup.find_all('img'):
-                img_src = img.get('src')
-                if img_src:
-                    # Construir URL completa
-                    if img_src.startswith('//'):
-                        img_url = 'https:' + img_src
-                    elif img_src.startswith('/'):
-                        img_url = urljoin(base_url, img_src)
-                    else:
-                        img_url = img_src
-                    
-                    # Verificar si la imagen podría contener un correo (por nombre de archivo)
-                    if any(term in img_src.lower() for term in ['email', 'mail', 'contact', 'correo']):
-                        try:
-                            img_text = await self.extract_text_from_image(img_url)
-                            if img_text:
-                                found_emails = re.findall(email_pattern, img_text, re.IGNORECASE)
-                                image_emails.update(found_emails)
-                        except Exception as e:
-                            logger.warning(f"Error al procesar imagen {img_url}: {str(e)}")
+        if analysis.image_candidates:
+            results = await asyncio.gather(
+                *[self.extract_text_from_image(img_url) for img_url in analysis.image_candidates],
+                return_exceptions=True
+            )
+            for img_url, img_text in zip(analysis.image_candidates, results):
+                if isinstance(img_text, Exception):
+                    logger.warning(f"Error al procesar imagen {img_url}: {str(img_text)}")
+                elif img_text:
+                    image_emails.update(find_emails(img_text))
         
-        # Combinar todos los correos encontrados
-        all_emails = set(text_emails) | attr_emails | image_emails
-        
-        # Filtrar y validar correos
-        filtered_emails = set()
-        for email in all_emails:
-            email = email.lower().strip()
-            if (self.is_valid_email(email) and
-                len(email) > 5 and
-                not email.split('@')[0].isdigit() and
-                not any(ext in email.split('@')[0].lower() for ext in ['icon', 'logo', 'image', 'img', 'sprite']) and
-                not any(ext in email.split('@')[1].split('.')[0].lower() for ext in ['cdn', 'static', 'assets', 'media', 'images', 'img', 'js', 'css', 'fonts']) and
-                '.' in email.split('@')[1]):
-                filtered_emails.add(email)
-        
-        return filtered_emails
+        # Combinar, normalizar y filtrar todos los correos encontrados en una pasada
+        return filter_emails(chain(text_emails, attr_emails, image_emails))
     
-    async def get_page_content(self, url: str) -> Optional[str]:
+    async def get_page_content(self, url: str, need_links: bool = True) -> Optional[str]:
         """
         Obtiene el contenido de una página web de forma asíncrona con manejo mejorado de errores
+        
+        Devuelve None si la página no se pudo obtener y una cadena vacía si se obtuvo
+        pero no contiene nada que extraer: ni correos, ni enlaces (o need_links=False
+        porque el rastreo no va a seguirlos).
         """
         if not self.session:
             logger.warning(f"Sesión no inicializada para {url}")
@@ -558,6 +560,13 @@ class EmailScraper:
             start_time = time.time()
             logger.debug(f"Solicitando URL: {url}")
             
+            # Página en caché aún dentro de la antigüedad permitida: sin red
+            cached = await page_cache.get(url)
+            if cached is not None and self.cache_max_age and cached.age() < self.cache_max_age:
+                if cached.final_url and cached.final_url != url:
+                    self.redirects[url] = cached.final_url
+                return await page_cache.fresh_hit(cached)
+            
             async with self.semaphore:
                 # Headers mejorados para parecer un navegador real
                 headers = {
@@ -575,6 +584,12 @@ class EmailScraper:
                     'DNT': '1',
                     'Referer': 'https://www.google.com/'
                 }
+                # Petición condicional si tenemos validadores de una descarga anterior
+                if cached is not None:
+                    if cached.etag:
+                        headers['If-None-Match'] = cached.etag
+                    if cached.last_modified:
+                        headers['If-Modified-Since'] = cached.last_modified
                 
                 # Configuración de tiempo de espera
                 timeout = aiohttp.ClientTimeout(total=15, connect=10, sock_connect=10, sock_read=10)
@@ -585,25 +600,54 @@ class EmailScraper:
                         headers=headers, 
                         allow_redirects=True, 
                         timeout=timeout,
-                        ssl=False  # Desactivar verificación SSL para evitar problemas de certificado
+                        ssl=False,  # Desactivar verificación SSL para evitar problemas de certificado
+                        trace_request_ctx=self.http_stats
                     ) as response:
+                        # No ha cambiado desde la última descarga: reutilizar el cuerpo
+                        if response.status == 304 and cached is not None:
+                            if cached.final_url and cached.final_url != url:
+                                self.redirects[url] = cached.final_url
+                            return await page_cache.revalidated_hit(url, cached)
+                        
                         # Verificar el código de estado
                         if response.status != 200:
                             logger.warning(f"Error HTTP {response.status} al obtener {url}")
                             return None
                         
-                        # Verificar el tipo de contenido
+                        # Registrar la URL final si hubo redirecciones
+                        final_url = str(response.url)
+                        if final_url != url:
+                            self.redirects[url] = final_url
+                        
+                        # Verificar el tipo de contenido antes de leer el cuerpo
                         content_type = response.headers.get('Content-Type', '').lower()
                         if 'text/html' not in content_type:
                             logger.warning(f"Tipo de contenido no soportado en {url}: {content_type}")
                             return None
                         
-                        # Obtener el contenido con un timeout específico
+                        # Obtener el contenido en streaming con límite de tamaño y timeout
                         try:
-                            content = await asyncio.wait_for(response.text(), timeout=10)
+                            body = await asyncio.wait_for(read_html_body(response, need_links=need_links),
+                                                          timeout=10)
+                            if body is None:
+                                logger.warning(f"Contenido binario etiquetado como HTML en {url}")
+                                return None
+                            if body.truncated:
+                                logger.info(f"Página truncada a {body.size} bytes: {url}")
+                            # Un cuerpo sin decodificar no sirve a un escaneo que sí necesite los enlaces
+                            if body.decoded:
+                                await page_cache.put(
+                                    url, body.text,
+                                    etag=response.headers.get('ETag'),
+                                    last_modified=response.headers.get('Last-Modified'),
+                                    final_url=final_url
+                                )
+                            else:
+                                page_cache.record_miss()
                             load_time = time.time() - start_time
                             logger.debug(f"Página cargada: {url} en {load_time:.2f}s")
-                            return content
+                            # Cadena vacía = página descargada pero sin nada que extraer
+                            return body.text
                             
                         except asyncio.TimeoutError:
                             logger.warning(f"Timeout al leer el contenido de {url}")
@@ -628,7 +672,8 @@ class EmailScraper:
     
     async def scrape_website(self, url: str, max_pages: int = 10, max_emails: int = 50, 
                           include_paths: List[str] = None, exclude_domains: List[str] = None,
-                          max_depth: int = 3, timeout: int = 300) -> Dict[str, Any]:
+                          max_depth: int = 3, timeout: int = 300,
+                          workers: int = CRAWL_WORKERS) -> Dict[str, Any]:
         """
         Función principal que coordina el scraping de un sitio web
         
@@ -640,6 +685,7 @@ class EmailScraper:
             exclude_domains: Lista de dominios a excluir (opcional)
             max_depth: Profundidad máxima de navegación
             timeout: Tiempo máximo en segundos para el escaneo
+            workers: Número de workers concurrentes (nunca más que max_pages)
             
         Returns:
             Dict con los resultados del scraping
@@ -647,7 +693,9 @@ class EmailScraper:
         start_time = time.time()
         self.visited_urls = set()
         self.emails = set()
-        self.queue = asyncio.Queue()
+        self.frontier = CrawlFrontier(max_pages=max_pages)
+        self.seen = SeenURLs()
+        self.redirects = {}
         self.max_pages = max_pages
         self.max_emails = max_emails
         self.include_paths = set(include_paths or [])
@@ -657,31 +705,25 @@ class EmailScraper:
         try:
             # Configurar el timeout global
             async def scrape_main():
-                # Asegurarse de que la URL base esté en la cola
+                # Asegurarse de que la URL base esté en la frontera
                 parsed_url = urlparse(url)
-                self.base_domain = parsed_url.netloc
-                await self.queue.put((url, 0))  # (url, profundidad)
+                self.base_domain = canonical_host(parsed_url.netloc)
+                self.seen.add(url)
+                await self.frontier.push(url, 0, link_priority(url, False, 0, self.include_paths))
                 
-                # Procesar la cola con múltiples workers
-                workers = []
-                num_workers = min(5, max_pages)  # No más workers que páginas máximas
+                # Procesar la frontera con múltiples workers
+                num_workers = max(1, min(workers, max_pages))  # No más workers que páginas máximas
                 
                 logger.info(f"Iniciando scraping de {url} con {num_workers} trabajadores")
                 
-                # Iniciar workers
-                for _ in range(num_workers):
-                    worker = asyncio.create_task(self.worker())
-                    workers.append(worker)
-                
-                # Esperar a que se completen todas las tareas o se alcance el límite
+                # Los workers terminan solos cuando la frontera se agota o se cierra
+                tasks = [asyncio.create_task(self.worker()) for _ in range(num_workers)]
                 try:
-                    await self.queue.join()
-                except asyncio.CancelledError:
-                    pass
+                    await asyncio.gather(*tasks)
                 finally:
-                    for w in workers:
-                        w.cancel()
-                    await asyncio.gather(*workers, return_exceptions=True)
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
 
                 logger.info(f"Finalizado scraping de {url}. "
                             f"Páginas: {len(self.visited_urls)}, "
@@ -691,7 +733,8 @@ class EmailScraper:
                     "emails": list(self.emails)[:max_emails],  # Limitar al máximo solicitado
                     "pages_scanned": len(self.visited_urls),
                     "emails_found": min(len(self.emails), max_emails),
-                    "execution_time_seconds": round(time.time() - start_time, 2)
+                    "execution_time_seconds": round(time.time() - start_time, 2),
+                    "http_stats": dict(self.http_stats)
                 }
 
             result = await asyncio.wait_for(scrape_main(), timeout)
@@ -706,7 +749,8 @@ class EmailScraper:
                 "pages_scanned": len(self.visited_urls),
                 "emails_found": min(len(self.emails), max_emails),
                 "error": f"Tiempo de espera agotado ({timeout}s)",
-                "execution_time_seconds": round(time.time() - start_time, 2)
+                "execution_time_seconds": round(time.time() - start_time, 2),
+                "http_stats": dict(self.http_stats)
             }
             
         except Exception as e:
@@ -717,94 +761,95 @@ class EmailScraper:
                 "pages_scanned": len(self.visited_urls),
                 "emails_found": min(len(self.emails), max_emails),
                 "error": str(e),
-                "execution_time_seconds": round(time.time() - start_time, 2)
+                "execution_time_seconds": round(time.time() - start_time, 2),
+                "http_stats": dict(self.http_stats)
             }
     
     async def worker(self):
         while True:
-            url, depth = await self.queue.get()
-            if url in self.visited_urls:
-                self.queue.task_done()
-                continue
-            
-            if depth > self.max_depth:
-                self.queue.task_done()
-                continue
+            item = await self.frontier.pop()
+            if item is None:
+                return
+            url, depth = item
+            fetched = False
             
             try:
-                content = await self.get_page_content(url)
+                if depth > self.max_depth:
+                    continue
+                
+                # En la profundidad máxima los enlaces de la página no se van a seguir
+                need_links = depth < self.max_depth
+                content = await self.get_page_content(url, need_links=need_links)
+                
+                # Una redirección a una página ya vista no es una página nueva
+                final_url = self.redirects.pop(url, None)
+                if content is None or not self.seen.add_alias(url, final_url):
+                    continue
+                
+                # Página sin nada que extraer: cuenta como escaneada pero no se parsea
                 if not content:
-                    self.queue.task_done()
+                    fetched = True
+                    self.visited_urls.add(url)
                     continue
                 
+                # Parsear la página una sola vez para correos y enlaces
+                analysis = analyze_page(content, final_url or url, need_links=need_links)
+                
+                # Tampoco lo es una página cuyo canonical apunta a otra ya vista
+                if not self.seen.add_alias(url, analysis.canonical_url):
+                    logger.debug(f"{url} es un duplicado de {analysis.canonical_url}")
+                    continue
+                fetched = True
+                
                 # Extraer correos de la página actual
-                page_emails = await self.extract_emails_from_page(content, url)
+                page_emails = await self.extract_emails_from_page(content, url, analysis)
+                new_emails = [email for email in page_emails if email not in self.emails]
                 if page_emails:
                     logger.info(f"Encontrados {len(page_emails)} correos en {url}")
                     self.emails.update(page_emails)
                 
-                # Si ya alcanzamos el máximo de correos, detenemos
+                self.visited_urls.add(url)
+                if self.on_progress is not None:
+                    await self.on_progress(len(self.visited_urls), min(len(self.emails), self.max_emails), new_emails)
+                
+                # Si ya alcanzamos el máximo de correos, ningún worker saca más URLs
                 if len(self.emails) >= self.max_emails:
-                    self.queue.task_done()
+                    await self.frontier.close()
                     continue
                 
-                # Procesar enlaces
-                soup = BeautifulSoup(content, 'html.parser')
-                links_found = 0
-                
-                # Buscar enlaces en elementos comunes que suelen contener información de contacto
-                contact_links = []
-                for link in soup.find_all(['a', 'link'], href=True):
-                    href = link.get('href', '').strip()
-                    if not href or href.startswith(('javascript:', 'mailto:', 'tel:', '#')):
-                        continue
-                        
-                    # Construir URL completa
-                    if href.startswith('//'):
-                        full_url = 'https:' + href if url.startswith('https:') else 'http:' + href
-                    elif href.startswith('/'):
-                        full_url = urljoin(url, href)
-                    else:
-                        full_url = href
-                    
-                    # Priorizar enlaces de contacto
-                    link_text = (link.get_text() or '').lower()
-                    if any(term in link_text for term in ['contact', 'contacto', 'about', 'nosotros', 'equipo', 'team']):
-                        contact_links.insert(0, full_url)  # Añadir al principio
-                    else:
-                        contact_links.append(full_url)
+                if depth >= self.max_depth:
+                    continue
                 
-                # Procesar primero los enlaces de contacto
-                for link_url in contact_links:
-                    if len(self.visited_urls) >= self.max_pages or len(self.emails) >= self.max_emails:
-                        break
-                    
+                links_found = 0
+                for link_url, is_contact in analysis.links:
                     try:
                         parsed_url = urlparse(link_url)
+                        lowered = link_url.lower()
                         
                         # Validar dominio y rutas
-                        if (parsed_url.netloc == self.base_domain and 
-                            link_url not in self.visited_urls and
-                            not any(exclude in link_url.lower() for exclude in self.exclude_domains) and
-                            not any(ext in link_url.lower() 
-                                  for ext in ['.jpg', '.jpeg', '.png', '.gif', '.pdf', '.zip', 
-                                             '.mp4', '.mp3', '.css', '.js', '.svg', '.ico', '.woff', '.ttf', '.eot'])):
+                        if (canonical_host(parsed_url.netloc) == self.base_domain and 
+                            not any(exclude in lowered for exclude in self.exclude_domains) and
+                            not any(ext in lowered for ext in SKIPPED_LINK_EXTENSIONS)):
+                            
+                            # Deduplicar al encolar (variantes de la misma página incluidas)
+                            if not self.seen.add(link_url):
+                                continue
                             
                             links_found += 1
                             if links_found > 50:  # Límite de enlaces por página
                                 break
-                                
-                            await self.queue.put((link_url, depth + 1))
+                            
+                            priority = link_priority(link_url, is_contact, depth + 1, self.include_paths)
+                            await self.frontier.push(link_url, depth + 1, priority)
                     except Exception as e:
                         logger.warning(f"Error al procesar enlace {link_url}: {str(e)}")
                         continue
-                
-                self.visited_urls.add(url)
-                self.queue.task_done()
             
             except Exception as e:
                 logger.error(f"Error al procesar {url}: {str(e)}", exc_info=True)
-                self.queue.task_done()
+            
+            finally:
+                await self.frontier.done(url, fetched)
     
     async def _process_page(self, url: str, base_domain: str, visited: set, emails: set, 
                           max_pages: int, max_emails: int, depth: int, max_depth: int,
@@ -834,7 +879,7 @@ class EmailScraper:
             
             # Procesar enlaces
             if depth < max_depth:
-                soup = BeautifulSoup(content, 'html.parser')
+                soup = make_soup(content)
                 tasks = []
                 links_found = 0
                 
@@ -897,13 +942,148 @@ class EmailScraper:
 
 # Include auth router
 app.include_router(auth.router)
+# Consulta y exportación de los correos guardados
+app.include_router(results.router)
 
 # Ruta raíz
 
 # Rutas de la API
 from app.auth import get_current_active_user
 from fastapi import Depends
-from app.db import get_pg_pool
+from app.db import pg_connection, init_pg_pool, close_pg_pool, get_pool_stats
+
+def new_request_id() -> str:
+    return f"req_{int(time.time())}_{os.urandom(4).hex()}"
+
+def new_job_entry(url: str) -> Dict[str, Any]:
+    """Estado inicial de un trabajo en el almacén"""
+    return {
+        "status": "queued",
+        "url": url,
+        "emails": [],
+        "pages_scanned": 0,
+        "emails_found": 0,
+        "started_at": datetime.utcnow().isoformat(),
+        "completed_at": None,
+        "error": None,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+def scraper_params(request: ScrapeRequest) -> Dict[str, Any]:
+    """Argumentos de run_scraper que usará el worker que reclame el trabajo"""
+    return {
+        "url": str(request.url),
+        "max_pages": request.max_pages,
+        "max_emails": request.max_emails,
+        "include_paths": request.include_paths,
+        "exclude_domains": request.exclude_domains,
+        "max_depth": request.max_depth,
+        "timeout": request.timeout,  # Usar el timeout definido en la solicitud
+        "cache_max_age": request.cache_max_age
+    }
+
+async def record_site_scan(url: str, pages_scanned: int, emails_found: int) -> None:
+    """Anota en site_scans que el sitio se acaba de rastrear por completo"""
+    try:
+        async with pg_connection() as conn:
+            await conn.execute(
+                """
+                INSERT INTO public.site_scans (domain, url, pages_scanned, emails_found, completed_at)
+                VALUES ($1, $2, $3, $4, NOW())
+                ON CONFLICT (domain) DO UPDATE SET url = EXCLUDED.url,
+                    pages_scanned = EXCLUDED.pages_scanned,
+                    emails_found = EXCLUDED.emails_found,
+                    completed_at = EXCLUDED.completed_at
+                """,
+                site_domain(url), url, pages_scanned, emails_found
+            )
+    except Exception as e:
+        logger.warning(f"No se pudo registrar el escaneo de {url}: {str(e)}")
+
+async def answer_from_found_emails(request: ScrapeRequest, dedupe_key: str) -> Optional[Dict[str, Any]]:
+    """
+    Responde con los correos guardados si el sitio se escaneó dentro de max_age
+    
+    La frescura la da el último escaneo completado del dominio (site_scans), no
+    los correos, así que un sitio sin correos también se sirve desde aquí. Los
+    correos se buscan por dominio con el índice (domain, last_seen_at) de
+    found_emails. Si los datos están cerca de caducar se encola un escaneo de
+    refresco en segundo plano (agrupado con cualquier otro idéntico en curso).
+    """
+    url = str(request.url)
+    domain = site_domain(url)
+    try:
+        async with pg_connection() as conn:
+            scan = await conn.fetchrow(
+                """
+                SELECT completed_at FROM public.site_scans
+                WHERE domain = $1 AND completed_at > NOW() - make_interval(secs => $2)
+                """,
+                domain, float(request.max_age)
+            )
+            rows = []
+            if scan is not None:
+                rows = await conn.fetch(
+                    """
+                    SELECT email, MAX(last_seen_at) AS last_seen_at FROM public.found_emails
+                    WHERE domain = $1 AND user_id IS NULL AND last_seen_at > NOW() - make_interval(secs => $2)
+                    GROUP BY email
+                    ORDER BY last_seen_at DESC
+                    LIMIT $3
+                    """,
+                    domain, float(request.max_age), request.max_emails
+                )
+    except Exception as e:
+        logger.warning(f"No se pudieron consultar correos recientes de {url}: {str(e)}")
+        return None
+    if scan is None:
+        freshness_stats["misses"] += 1
+        return None
+    freshness_stats["fresh_hits"] += 1
+    
+    scanned_at = scan["completed_at"]
+    age = (datetime.now(scanned_at.tzinfo) - scanned_at).total_seconds()
+    if age >= request.max_age * FRESHNESS_REFRESH_RATIO:
+        try:
+            if await job_store.count_queued() < JOB_QUEUE_MAX_PENDING:
+                refresh_id = new_request_id()
+                primary_id = await job_store.enqueue(refresh_id, new_job_entry(url), scraper_params(request),
+                                                     dedupe_key=dedupe_key)
+                if primary_id == refresh_id:
+                    freshness_stats["refreshes"] += 1
+                    logger.info(f"Refrescando en segundo plano los correos de {url} ({refresh_id})")
+                    if embedded_worker is not None:
+                        embedded_worker.notify()
+        except Exception as e:
+            logger.warning(f"No se pudo encolar el refresco de {url}: {str(e)}")
+    
+    # Registrar la respuesta como un trabajo ya terminado para que /status también la conozca
+    request_id = new_request_id()
+    emails = [row["email"] for row in rows]
+    now = datetime.utcnow().isoformat()
+    entry = {
+        **new_job_entry(url),
+        "status": "completed",
+        "emails": emails,
+        "emails_found": len(emails),
+        "completed_at": now,
+        "cached_at": scanned_at.isoformat()
+    }
+    try:
+        await job_store.create(request_id, entry)
+    except Exception as e:
+        logger.warning(f"No se pudo registrar la respuesta en caché {request_id}: {str(e)}")
+    result_cache.set(request_id, entry)
+    return {
+        "request_id": request_id,
+        "status": "completed",
+        "url": url,
+        "emails": emails,
+        "pages_scanned": 0,
+        "emails_found": len(emails),
+        "timestamp": now,
+        "cached_at": scanned_at.isoformat()
+    }
 
 @app.post("/api/v1/scrape", response_model=ScrapeResponse, tags=["Scraping"])
 async def scrape_website(
@@ -913,48 +1093,265 @@ async def scrape_website(
     """
     Inicia un nuevo trabajo de escaneo de correos electrónicos.
     
-    Esta ruta inicia el proceso de escaneo en segundo plano y devuelve inmediatamente
-    un ID de solicitud que puede usarse para verificar el estado.
+    Esta ruta encola el escaneo y devuelve inmediatamente un ID de solicitud que
+    puede usarse para verificar el estado. Si la cola está llena responde 429 con
+    la cabecera Retry-After.
+    
+    Una solicitud idéntica a otra que aún está en cola o en curso no lanza un
+    rastreo nuevo: recibe su propio request_id, asociado al resultado compartido.
     """
-    request_id = f"req_{int(time.time())}_{os.urandom(4).hex()}"
+    dedupe_key = request.dedupe_key()
     
-    # Inicializar el resultado en caché con todos los campos necesarios
-    result_cache[request_id] = {
-        "status": "processing",
-        "url": str(request.url),
-        "emails": [],
-        "pages_scanned": 0,
-        "emails_found": 0,
-        "started_at": datetime.utcnow().isoformat(),
-        "completed_at": None,
-        "error": None,
-        "timestamp": datetime.utcnow().isoformat()
-    }
+    # Resultado reciente en found_emails: responder sin rastrear
+    if request.max_age:
+        fresh = await answer_from_found_emails(request, dedupe_key)
+        if fresh is not None:
+            return fresh
     
-    # Ejecutar el scraper en segundo plano usando asyncio.create_task
-    asyncio.create_task(
-        run_scraper(
-            request_id=request_id,
-            url=str(request.url),
-            max_pages=request.max_pages,
-            max_emails=request.max_emails,
-            include_paths=request.include_paths,
-            exclude_domains=request.exclude_domains,
-            max_depth=request.max_depth,
-            timeout=request.timeout  # Usar el timeout definido en la solicitud
+    # Contrapresión: no aceptar más trabajo del que los workers pueden absorber
+    # (agruparse con un trabajo en curso no añade carga)
+    if (await job_store.count_queued() >= JOB_QUEUE_MAX_PENDING and
+            await job_store.find_inflight(dedupe_key) is None):
+        raise HTTPException(
+            status_code=429,
+            detail="Demasiados escaneos en cola. Inténtalo de nuevo más tarde.",
+            headers={"Retry-After": str(JOB_QUEUE_RETRY_AFTER)}
         )
-    )
+    
+    request_id = new_request_id()
+    
+    # Registrar el trabajo en la cola compartida antes de responder, para que
+    # cualquier worker pueda contestar a /status desde el primer momento
+    primary_id = await job_store.enqueue(request_id, new_job_entry(str(request.url)), scraper_params(request),
+                                         dedupe_key=dedupe_key)
+    
+    if primary_id != request_id:
+        coalesce_stats["coalesced"] += 1
+        logger.info(f"Solicitud {request_id} agrupada con el trabajo en curso {primary_id}")
+        primary = await job_store.get(primary_id) or {}
+        return {
+            "request_id": request_id,
+            "status": primary.get("status", "queued"),
+            "url": str(request.url),
+            "pages_scanned": primary.get("pages_scanned", 0),
+            "emails_found": primary.get("emails_found", 0),
+            "timestamp": datetime.utcnow().isoformat(),
+            "message": "Ya hay un escaneo idéntico en curso. Utiliza el request_id para verificar el estado."
+        }
+    
+    if embedded_worker is not None:
+        embedded_worker.notify()
     
     return {
         "request_id": request_id,
-        "status": "processing",
+        "status": "queued",
         "url": str(request.url),
         "pages_scanned": 0,
         "emails_found": 0,
         "timestamp": datetime.utcnow().isoformat(),
-        "message": "El escaneo ha comenzado. Utiliza el request_id para verificar el estado."
+        "message": "El escaneo está en cola. Utiliza el request_id para verificar el estado."
+    }
+
+# Escaneo masivo: varios sitios por petición con resultados en streaming (NDJSON).
+# Cada sitio es un trabajo más de la cola compartida (mismos workers, mismo límite
+# de cola y mismo almacén), y el progreso del lote se guarda en job_store para que
+# cualquier proceso de la API pueda responder a /scrape/bulk/{batch_id}
+BULK_MAX_URLS = int(os.getenv("BULK_MAX_URLS", 5000))
+# Sitios de un mismo lote en cola o en curso a la vez: un lote grande no acapara la cola
+BULK_MAX_CONCURRENT_SITES = int(os.getenv("BULK_MAX_CONCURRENT_SITES", 10))
+bulk_stats = {"batches": 0, "sites": 0, "cancelled": 0}
+
+async def enqueue_bulk_site(batch_id: str, url: str, config: ScrapeConfig) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Encola un sitio del lote como un trabajo normal; devuelve (request_id, línea)
+    
+    La línea solo viene rellena si el sitio no se pudo encolar (URL no válida).
+    """
+    request_id = new_request_id()
+    try:
+        request = ScrapeRequest(url=url, **dict(config))
+    except ValueError:
+        return request_id, bulk_result_line(request_id, url, {
+            "status": "error", "emails": [], "pages_scanned": 0, "emails_found": 0,
+            "error": f"URL no válida: {url}"
+        })
+    await job_store.enqueue(request_id, {**new_job_entry(url), "batch_id": batch_id},
+                            scraper_params(request), dedupe_key=request.dedupe_key())
+    return request_id, None
+
+def bulk_result_line(request_id: str, url: str, job: Dict[str, Any]) -> Dict[str, Any]:
+    """Línea NDJSON de un sitio terminado a partir de su trabajo"""
+    emails = job.get("emails") or []
+    error = job.get("error")
+    if job.get("status") == "completed" and not error and not job.get("pages_scanned"):
+        error = "No se pudo obtener ninguna página del sitio"
+    return {
+        "type": "result",
+        "request_id": request_id,
+        "url": url,
+        "status": "error" if error and not emails else "completed",
+        "emails": emails,
+        "pages_scanned": job.get("pages_scanned", 0),
+        "emails_found": len(emails),
+        "error": error,
+        "execution_time_seconds": job.get("execution_time_seconds")
     }
 
+async def run_bulk_batch(batch_id: str, urls: List[str], config: ScrapeConfig):
+    """Encola los sitios del lote a medida que hay sitio y genera una línea NDJSON por cada uno que termina"""
+    progress = {"done": 0, "errors": 0, "emails_found": 0}
+    pending = iter(urls)
+    in_flight: Dict[str, str] = {}
+    finished = False
+    
+    async def fill() -> List[Dict[str, Any]]:
+        # Respeta la ventana del lote y el límite global de la cola (429 en /scrape)
+        lines = []
+        while len(in_flight) < BULK_MAX_CONCURRENT_SITES:
+            if in_flight and await job_store.count_queued() >= JOB_QUEUE_MAX_PENDING:
+                break
+            url = next(pending, None)
+            if url is None:
+                break
+            request_id, line = await enqueue_bulk_site(batch_id, url, config)
+            if line is not None:
+                lines.append(line)
+            else:
+                in_flight[request_id] = url
+                bulk_stats["sites"] += 1
+        if in_flight and embedded_worker is not None:
+            embedded_worker.notify()
+        return lines
+    
+    async def record(line: Dict[str, Any]) -> str:
+        progress["done"] += 1
+        progress["emails_found"] += line["emails_found"]
+        if line["status"] == "error":
+            progress["errors"] += 1
+        line["progress"] = {"done": progress["done"], "total": len(urls)}
+        await job_store.update(batch_id, {**progress, "in_flight": len(in_flight)})
+        return json.dumps(line) + "\n"
+    
+    try:
+        yield json.dumps({"type": "batch", "batch_id": batch_id, "total": len(urls)}) + "\n"
+        while True:
+            for line in await fill():
+                yield await record(line)
+            if not in_flight:
+                break
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            for request_id, url in list(in_flight.items()):
+                job = await job_store.get(request_id)
+                if job is None or job.get("status") in FINISHED_STATUSES:
+                    del in_flight[request_id]
+                    yield await record(bulk_result_line(request_id, url, job or {
+                        "status": "error", "error": "El trabajo ya no existe en el almacén"
+                    }))
+        finished = True
+        summary = {
+            "batch_id": batch_id,
+            "status": "completed",
+            "total": len(urls),
+            **progress,
+            "in_flight": 0,
+            "completed_at": datetime.utcnow().isoformat()
+        }
+        await job_store.update(batch_id, summary, flush=True)
+        yield json.dumps({"type": "summary", **summary}) + "\n"
+    finally:
+        if not finished:
+            # Cliente desconectado: no se encolan más sitios; los ya encolados
+            # terminan y sus correos quedan guardados
+            bulk_stats["cancelled"] += 1
+            await job_store.update(batch_id, {
+                "status": "cancelled",
+                "in_flight": len(in_flight),
+                "completed_at": datetime.utcnow().isoformat()
+            }, flush=True)
+
+async def start_bulk_batch(urls: List[str], config: ScrapeConfig) -> StreamingResponse:
+    # Sitios repetidos (misma URL canónica) se escanean una sola vez
+    unique: Dict[str, str] = {}
+    for url in urls:
+        unique.setdefault(canonicalize_url(url), url)
+    urls = list(unique.values())
+    if not urls:
+        raise HTTPException(status_code=400, detail="El lote no contiene URLs")
+    if len(urls) > BULK_MAX_URLS:
+        raise HTTPException(status_code=413, detail=f"El lote supera el máximo de {BULK_MAX_URLS} URLs")
+    # Misma contrapresión que /scrape: con la cola llena no se acepta el lote
+    if await job_store.count_queued() >= JOB_QUEUE_MAX_PENDING:
+        raise HTTPException(
+            status_code=429,
+            detail="Demasiados escaneos en cola. Inténtalo de nuevo más tarde.",
+            headers={"Retry-After": str(JOB_QUEUE_RETRY_AFTER)}
+        )
+    
+    batch_id = f"batch_{int(time.time())}_{os.urandom(4).hex()}"
+    await job_store.create(batch_id, {
+        "type": "batch",
+        "batch_id": batch_id,
+        "status": "processing",
+        "total": len(urls),
+        "done": 0,
+        "in_flight": 0,
+        "errors": 0,
+        "emails_found": 0,
+        "started_at": datetime.utcnow().isoformat(),
+        "completed_at": None
+    })
+    bulk_stats["batches"] += 1
+    logger.info(f"Iniciando escaneo masivo {batch_id} de {len(urls)} sitios")
+    return StreamingResponse(
+        run_bulk_batch(batch_id, urls, config),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Id": batch_id}
+    )
+
+@app.post("/api/v1/scrape/bulk", tags=["Scraping"])
+async def scrape_bulk(request: BulkScrapeRequest):
+    """
+    Escanea una lista de sitios con la misma configuración.
+    
+    Los resultados se devuelven en streaming como NDJSON, una línea por sitio en
+    cuanto termina (sin esperar al más lento), precedidas de una línea `batch` con
+    el batch_id y seguidas de una línea `summary`. Cada sitio se encola como un
+    escaneo normal: lo ejecutan los mismos workers, cuenta para el límite de la
+    cola (429 si ya está llena) y su estado se consulta también en /status.
+    """
+    return await start_bulk_batch([str(url) for url in request.urls], request.config)
+
+@app.post("/api/v1/scrape/bulk/upload", tags=["Scraping"])
+async def scrape_bulk_upload(
+    file: UploadFile = File(..., description="Fichero de texto o CSV con una URL por línea (primera columna)"),
+    config: str = Form("{}", description="Configuración de rastreo en JSON (mismos campos que ScrapeConfig)")
+):
+    """
+    Igual que /api/v1/scrape/bulk pero con las URLs en un fichero subido.
+    """
+    try:
+        scrape_config = ScrapeConfig(**json.loads(config or "{}"))
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Configuración no válida: {str(e)}")
+    content = (await file.read()).decode("utf-8", errors="replace")
+    urls = []
+    for line in content.splitlines():
+        value = line.split(",", 1)[0].strip().strip('"')
+        if not value or value.startswith("#"):
+            continue
+        if not value.startswith(("http://", "https://")):
+            value = f"https://{value}"
+        urls.append(value)
+    return await start_bulk_batch(urls, scrape_config)
+
+@app.get("/api/v1/scrape/bulk/{batch_id}", tags=["Estado"])
+async def bulk_status(batch_id: str):
+    """Progreso agregado de un lote (sitios terminados, en curso, con error y correos)"""
+    progress = await job_store.get(batch_id)
+    if progress is None or progress.get("type") != "batch":
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    return progress
+
 @app.get("/api/v1/status/{request_id}", response_model=ScrapeResponse, tags=["Estado"])
 async def check_status(request_id: str):
     """
@@ -963,26 +1360,105 @@ async def check_status(request_id: str):
     Utiliza el request_id devuelto por la ruta /scrape para obtener
     el estado actual y los resultados si están disponibles.
     """
-    if request_id not in result_cache:
-        raise HTTPException(status_code=404, detail="Solicitud no encontrada")
-    
-    result = result_cache[request_id]
+    result = result_cache.get(request_id)
+    if result is None:
+        result = await job_store.get(request_id)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Solicitud no encontrada")
+        if result.get("status") in FINISHED_STATUSES:
+            result_cache.set(request_id, result)
     
     response = {
         "request_id": request_id,
         "status": result["status"],
         "url": result["url"],
-        "emails": result["emails"] if result["status"] == "completed" else None,
+        "emails": result.get("emails") if result["status"] in FINISHED_STATUSES else None,
         "pages_scanned": result["pages_scanned"],
         "emails_found": result["emails_found"],
-        "timestamp": result["timestamp"]
+        "timestamp": result["timestamp"],
+        "http_stats": result.get("http_stats"),
+        "cached_at": result.get("cached_at"),
+        "partial": result.get("partial", False),
+        "unsaved_batches": result.get("unsaved_batches", 0)
     }
     
-    if result["error"]:
+    if result.get("error"):
         response["error"] = result["error"]
     
     return response
 
+# Intervalo de sondeo del almacén cuando el trabajo corre en otro proceso
+PROGRESS_POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", 1.0))
+
+async def channel_events(channel: JobChannel, after: Optional[int] = None):
+    async for item in channel.subscribe(after=after):
+        if item is None:
+            yield ": keepalive\n\n"
+            continue
+        seq, event, data = item
+        yield format_sse(event, data, seq)
+
+async def job_events(job_id: str, last_event_id: Optional[int] = None):
+    """Eventos SSE de un trabajo: del canal en vivo si corre aquí, si no sondeando el almacén"""
+    channel = progress_broker.get(job_id)
+    if channel is not None:
+        async for chunk in channel_events(channel, last_event_id):
+            yield chunk
+        return
+    
+    # Sondeo: los correos nuevos salen de comparar la lista guardada con la ya enviada
+    last_state = None
+    sent: Set[str] = set()
+    while True:
+        entry = await job_store.get(job_id)
+        if entry is None:
+            yield format_sse("status", {"status": "error", "error": "Solicitud no encontrada"})
+            return
+        finished = entry.get("status") in FINISHED_STATUSES
+        emails = entry.get("emails") or []
+        state = {
+            "status": entry.get("status"),
+            "pages_scanned": entry.get("pages_scanned", 0),
+            "emails_found": entry.get("emails_found", 0)
+        }
+        if finished:
+            state["emails"] = emails
+            if entry.get("error"):
+                state["error"] = entry["error"]
+            yield format_sse("status", state)
+            return
+        new_emails = [email for email in emails if email not in sent]
+        if state != last_state or new_emails:
+            sent.update(new_emails)
+            yield format_sse("progress", {**state, "new_emails": new_emails})
+            last_state = state
+        # El trabajo puede haber empezado en este proceso mientras tanto
+        channel = progress_broker.get(job_id)
+        if channel is not None:
+            async for chunk in channel_events(channel):
+                yield chunk
+            return
+        await asyncio.sleep(PROGRESS_POLL_INTERVAL)
+
+@app.get("/api/v1/status/{request_id}/stream", tags=["Estado"])
+async def stream_status(request_id: str, last_event_id: Optional[int] = Header(None, alias="Last-Event-ID")):
+    """
+    Progreso en vivo de un trabajo de escaneo (Server-Sent Events).
+    
+    Emite un evento `snapshot` con el estado acumulado, eventos `progress` con las
+    páginas escaneadas y los correos nuevos (`new_emails`) a medida que aparecen,
+    y un evento final `status` con el resultado. Admite la cabecera Last-Event-ID
+    para reanudar la conexión sin perder eventos.
+    """
+    job_id = await job_store.resolve(request_id)
+    if job_id is None:
+        raise HTTPException(status_code=404, detail="Solicitud no encontrada")
+    return StreamingResponse(
+        job_events(job_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/v1/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
     return get_swagger_ui_html(
@@ -1003,10 +1479,44 @@ async def get_open_api_endpoint():
         )
     )
 
+def persist_error(sink: EmailSink) -> str:
+    error_msg = f"No se pudieron guardar {sink.errors} lotes de correos de {sink.url} en la base de datos"
+    logger.error(error_msg)
+    return error_msg
+
+async def finish_partial(request_id: str, sink: EmailSink, error_msg: str, pages_scanned: int,
+                         start_time: float) -> None:
+    """Registra un escaneo interrumpido con lo que ya quedó guardado en found_emails"""
+    # Primero esperar a los micro-lotes pendientes: el resultado parcial que se
+    # publica tiene que estar ya en la base de datos
+    await sink.finish()
+    if sink.errors:
+        error_msg = f"{error_msg}. {persist_error(sink)}"
+    partial = list(sink.emails)
+    await job_store.update(request_id, {
+        "status": "error",
+        "error": error_msg,
+        "emails": partial,
+        "pages_scanned": pages_scanned,
+        "emails_found": len(partial),
+        "partial": True,
+        "unsaved_batches": sink.errors,
+        "execution_time_seconds": time.time() - start_time,
+        "timestamp": datetime.utcnow().isoformat()
+    }, flush=True)
+    progress_broker.close(request_id, {
+        "status": "error",
+        "error": error_msg,
+        "pages_scanned": pages_scanned,
+        "emails_found": len(partial),
+        "emails": partial
+    })
+
 # Tarea en segundo plano para el escaneo
 async def run_scraper(request_id: str, url: str, max_pages: int, max_emails: int, 
                      include_paths: List[str] = None, exclude_domains: List[str] = None,
-                     max_depth: int = 3, timeout: int = 300, user_id: str = None):
+                     max_depth: int = 3, timeout: int = 300, user_id: str = None,
+                     cache_max_age: int = 0):
     """
     Función para ejecutar el scraper en segundo plano con timeout
     
@@ -1015,12 +1525,36 @@ async def run_scraper(request_id: str, url: str, max_pages: int, max_emails: int
     """
     start_time = time.time()
     
+    progress_broker.open(request_id)
+    # Los correos se guardan a medida que aparecen: un timeout o una caída no los pierden
+    sink = email_writer.sink(url, user_id=user_id, limit=max_emails)
+    progress = {"pages_scanned": 0}
+    
+    async def report_progress(pages_scanned: int, emails_found: int, new_emails: List[str]) -> None:
+        progress["pages_scanned"] = pages_scanned
+        await sink.add(new_emails)
+        # Se acumula en memoria y se escribe en el siguiente volcado por lotes; la
+        # lista de correos permite a otros procesos difundir los nuevos por SSE
+        await job_store.update(request_id, {
+            "pages_scanned": pages_scanned,
+            "emails_found": emails_found,
+            "emails": list(sink.emails),
+            "timestamp": datetime.utcnow().isoformat()
+        })
+        # Y se difunde al momento a los clientes suscritos por SSE
+        progress_broker.publish(request_id, "progress", {
+            "pages_scanned": pages_scanned,
+            "emails_found": emails_found,
+            "new_emails": new_emails
+        })
+    
     try:
         # Configurar el timeout usando asyncio.wait_for
         async def scrape_task():
-            async with EmailScraper() as scraper:
+            async with EmailScraper(session=get_http_session(), on_progress=report_progress,
+                                    cache_max_age=cache_max_age) as scraper:
                 logger.info(f"Iniciando escaneo de {url} (timeout: {timeout}s)")
-                result = await scraper.scrape_website(
+                return await scraper.scrape_website(
                     url=url,
                     max_pages=max_pages,
                     max_emails=max_emails,
@@ -1028,77 +1562,61 @@ async def run_scraper(request_id: str, url: str, max_pages: int, max_emails: int
                     exclude_domains=exclude_domains or [],
                     max_depth=max_depth
                 )
-                # Actualizar caché con resultados
-                emails_list = list(result.get("emails", set()))
-                exec_time = time.time() - start_time
-                result_cache[request_id].update({
-                    "status": "completed",
-                    "emails": emails_list,
-                    "pages_scanned": result.get("pages_scanned", 0),
-                    "emails_found": len(emails_list),
-                    "execution_time_seconds": round(exec_time, 2),
-                    "completed_at": datetime.utcnow().isoformat(),
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-                logger.info(f"Finalizado scraping de {url} en {exec_time:.2f}s. "
-                            f"Páginas: {result.get('pages_scanned', 0)}, "
-                            f"Correos: {len(emails_list)}")
-
-                # Guardar en la base de datos solo si hay correos encontrados
-                if emails_list:
-                    try:
-                        pool = await get_pg_pool()
-                        async with pool.acquire() as conn:
-                            # Buscar los correos que ya existen
-                            rows = await conn.fetch(
-                                """
-                                SELECT email FROM found_emails WHERE user_id IS NULL AND url = $1 AND email = ANY($2::text[])
-                                """,
-                                url, emails_list
-                            )
-                            existentes = {row['email'] for row in rows}
-                            nuevos = [email for email in emails_list if email not in existentes]
-                            if nuevos:
-                                await conn.executemany(
-                                    """
-                                    INSERT INTO found_emails (user_id, email, url, found_at)
-                                    VALUES (NULL, $1, $2, NOW())
-                                    ON CONFLICT (email, url, user_id) DO NOTHING
-                                    """,
-                                    [(email, url) for email in nuevos]
-                                )
-                                logger.info(f"Se guardaron {len(nuevos)} correos anónimos en la base de datos.")
-                                result_cache[request_id]["message"] = f"Correos almacenados exitosamente. Se insertaron los siguientes correos: {', '.join(nuevos)}"
-                            else:
-                                logger.info("No hay correos nuevos para insertar.")
-                                result_cache[request_id]["message"] = "No hay correos nuevos para insertar."
-                    except Exception as db_err:
-                        logger.error(f"Error guardando correos en la base de datos: {db_err}")
 
-        await asyncio.wait_for(scrape_task(), timeout=timeout)
+        result = await asyncio.wait_for(scrape_task(), timeout=timeout)
+
+        # Fuera del timeout: esperar a los últimos micro-lotes antes de dar el
+        # trabajo por completado, para informar de los correos nuevos
+        nuevos = await sink.finish()
+        # Mismos correos (y en el mismo orden) que los ya guardados
+        emails_list = list(sink.emails)
+        exec_time = time.time() - start_time
+        completed = {
+            "status": "completed",
+            "emails": emails_list,
+            "pages_scanned": result.get("pages_scanned", 0),
+            "emails_found": len(emails_list),
+            "execution_time_seconds": round(exec_time, 2),
+            "http_stats": result.get("http_stats"),
+            "completed_at": datetime.utcnow().isoformat(),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        if sink.errors:
+            # El rastreo terminó, pero no todo lo encontrado quedó en found_emails
+            completed["error"] = persist_error(sink)
+            completed["unsaved_batches"] = sink.errors
+        elif nuevos:
+            completed["message"] = f"Correos almacenados exitosamente. Se insertaron los siguientes correos: {', '.join(nuevos)}"
+        elif emails_list:
+            completed["message"] = "No hay correos nuevos para insertar."
+        await job_store.update(request_id, completed, flush=True)
+        if user_id is None and not sink.errors:
+            # Solo los escaneos anónimos: son los que lee la respuesta con max_age
+            await record_site_scan(url, completed["pages_scanned"], len(emails_list))
+        progress_broker.close(request_id, {
+            "status": "completed",
+            "pages_scanned": completed["pages_scanned"],
+            "emails_found": len(emails_list),
+            "emails": emails_list,
+            **({"error": completed["error"]} if sink.errors else {})
+        })
+        logger.info(f"Finalizado scraping de {url} en {exec_time:.2f}s. "
+                    f"Páginas: {completed['pages_scanned']}, "
+                    f"Correos: {len(emails_list)}")
 
     except asyncio.TimeoutError:
         error_msg = f"Tiempo de espera agotado ({timeout}s) para el escaneo de {url}"
         logger.error(error_msg)
-        result_cache[request_id].update({
-            "status": "error",
-            "error": error_msg,
-            "execution_time_seconds": time.time() - start_time,
-            "timestamp": datetime.utcnow().isoformat()
-        })
+        await finish_partial(request_id, sink, error_msg, progress["pages_scanned"], start_time)
 
     except Exception as e:
         error_msg = f"Error en scraper para {url}: {str(e)}"
         logger.error(error_msg, exc_info=True)
-        result_cache[request_id].update({
-            "status": "error",
-            "error": error_msg,
-            "execution_time_seconds": time.time() - start_time,
-            "timestamp": datetime.utcnow().isoformat()
-        })
+        await finish_partial(request_id, sink, error_msg, progress["pages_scanned"], start_time)
+    
     finally:
-        # Limpiar caché después de 1 hora
-        asyncio.create_task(cleanup_old_entries(request_id))
+        # Escaneo cancelado (el worker se detiene): el trabajo vuelve a la cola
+        progress_broker.close(request_id, {"status": "queued"})
 
 # Ruta de verificación de estado
 @app.get("/health", tags=["Estado"])
@@ -1106,29 +1624,94 @@ async def health_check():
     """Verifica el estado del servicio"""
     return {"status": "ok", "timestamp": datetime.utcnow().isoformat()}
 
-# Limpiar caché de resultados antiguos periódicamente
+# Limpiar resultados antiguos periódicamente (una sola tarea por proceso)
 async def cleanup_old_results():
-    """Limpia resultados antiguos de la caché"""
+    """Limpia resultados antiguos del almacén de trabajos y de la caché local"""
     while True:
-        await asyncio.sleep(3600)  # Cada hora
-        now = time.time()
-        old_keys = []
-        
-        for req_id, result in result_cache.items():
-            completed_at = result.get("completed_at")
-            if completed_at:
-                completed_ts = datetime.fromisoformat(completed_at).timestamp()
-                if now - completed_ts > 86400:  # 24 horas
-                    old_keys.append(req_id)
-        
-        for req_id in old_keys:
-            result_cache.pop(req_id, None)
+        await asyncio.sleep(JOB_PURGE_INTERVAL)
+        result_cache.expire()
+        try:
+            # Borrado por rango sobre el índice de updated_at
+            removed = await job_store.purge_older_than(JOB_RESULT_TTL)
+            if removed:
+                logger.debug(f"Eliminados {removed} trabajos antiguos del almacén")
+        except Exception as e:
+            logger.error(f"Error limpiando trabajos antiguos: {str(e)}")
+
+# Métricas internas para dimensionar el servicio bajo carga
+@app.get("/api/v1/metrics", tags=["Estado"])
+async def metrics():
+    """Estadísticas de los recursos compartidos del proceso"""
+    return {
+        "db_pool": get_pool_stats(),
+        "ocr": get_ocr_stats(),
+        "ocr_cache": ocr_cache.get_stats(),
+        "http": get_http_stats(),
+        "result_cache": result_cache.get_stats(),
+        "page_cache": page_cache.get_stats(),
+        "progress": progress_broker.get_stats(),
+        "bulk": bulk_stats,
+        "found_emails_writer": email_writer.get_stats(),
+        "auth_cache": auth.get_auth_cache_stats(),
+        "passwords": get_password_stats(),
+        "token_revocations": token_revocations.get_stats(),
+        "mail": mail_sender.get_stats(),
+        "jobs": {
+            "queued": await job_store.count_queued(),
+            "coalesced": coalesce_stats["coalesced"],
+            "freshness": freshness_stats,
+            "embedded_worker": embedded_worker.get_stats() if embedded_worker is not None else None
+        },
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+# Worker de rastreo dentro del proceso de la API (JOB_EMBEDDED_WORKER)
+embedded_worker: Optional[ScrapeWorker] = None
 
 # Iniciar tarea de limpieza al arrancar
 @app.on_event("startup")
 async def startup_event():
+    global embedded_worker
+    try:
+        await init_pg_pool()
+    except Exception as e:
+        # El pool se volverá a intentar crear en la primera petición que lo use
+        logger.error(f"No se pudo iniciar el pool de PostgreSQL: {str(e)}")
+    init_ocr_pool()
+    init_password_pool()
+    init_http_session()
+    email_writer.start()
+    mail_sender.start()
+    try:
+        await job_store.start()
+    except Exception as e:
+        logger.error(f"No se pudo preparar el almacén de trabajos: {str(e)}")
+    try:
+        await token_revocations.start()
+    except Exception as e:
+        # Se reintenta en segundo plano; mientras tanto cada comprobación consulta el almacén
+        logger.error(f"No se pudo cargar el registro de tokens revocados: {str(e)}")
+    if JOB_EMBEDDED_WORKER:
+        embedded_worker = ScrapeWorker(run_scraper)
+        await embedded_worker.start()
     asyncio.create_task(cleanup_old_results())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Los escaneos interrumpidos vuelven a la cola para otro worker
+    if embedded_worker is not None:
+        await embedded_worker.stop()
+    # Volcar el progreso y los correos pendientes antes de cerrar el pool
+    await job_store.close()
+    await email_writer.close()
+    await token_revocations.close()
+    # Dar unos segundos a los correos en cola antes de cortar las conexiones SMTP
+    await mail_sender.close()
+    await close_http_session()
+    close_ocr_pool()
+    close_password_pool()
+    await close_pg_pool()
+
 # Si se ejecuta directamente
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,185 @@
+"""
+OCR en un pool de procesos acotado.
+
+Tesseract y el preprocesado con PIL son trabajo de CPU de cientos de milisegundos
+por imagen; ejecutarlos dentro del event loop bloquea todas las peticiones del
+worker. Aquí se delegan a un ProcessPoolExecutor con un límite global de trabajos
+en curso, una cola de espera acotada, un límite por escaneo y timeouts.
+"""
+import asyncio
+import logging
+import os
+import platform
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from io import BytesIO
+from multiprocessing import get_context
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("webscraper")
+
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", 2))
+OCR_MAX_PENDING = int(os.getenv("OCR_MAX_PENDING", 32))
+OCR_MAX_PER_JOB = int(os.getenv("OCR_MAX_PER_JOB", 2))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", 20))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+
+_executor: Optional[ProcessPoolExecutor] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_pending = 0
+
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "rejected": 0,
+    "timeouts": 0,
+    "errors": 0,
+}
+
+
+@lru_cache(maxsize=1)
+def get_tesseract_cmd() -> Optional[str]:
+    """Localiza Tesseract una sola vez por proceso"""
+    system_type = platform.system()
+    if system_type == "Windows":
+        tesseract_path = r'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
+    else:
+        tesseract_path = '/usr/bin/tesseract'
+    logger.info(f"[OCR] platform.system() = {system_type}, usando tesseract_path = {tesseract_path}")
+    if system_type != "Windows" and not os.path.exists(tesseract_path):
+        logger.error(f"[OCR] Tesseract no está instalado en {tesseract_path}. Instálalo con 'apt-get install tesseract-ocr'")
+        return None
+    try:
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = tesseract_path
+        # Verificar que Tesseract funciona
+        pytesseract.get_tesseract_version()
+    except Exception as e:
+        logger.error(f"Error al inicializar Tesseract en {tesseract_path}: {str(e)}")
+        return None
+    return tesseract_path
+
+
+def _ocr_worker(image_data: bytes, tesseract_cmd: str, lang: str, timeout: float) -> str:
+    """Se ejecuta en el proceso hijo: preprocesa la imagen y aplica Tesseract"""
+    import pytesseract
+    from PIL import Image, ImageEnhance
+
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    image = Image.open(BytesIO(image_data))
+
+    # Convertir a escala de grises para mejor OCR
+    if image.mode != 'L':
+        image = image.convert('L')
+
+    # Mejorar el contraste para mejor reconocimiento
+    image = ImageEnhance.Contrast(image).enhance(2.0)
+
+    # pytesseract mata el proceso de Tesseract si supera el timeout
+    return pytesseract.image_to_string(image, lang=lang, timeout=timeout)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn evita heredar el event loop y las conexiones abiertas del worker de uvicorn
+        _executor = ProcessPoolExecutor(max_workers=OCR_MAX_WORKERS, mp_context=get_context("spawn"))
+    return _executor
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(OCR_MAX_WORKERS)
+    return _semaphore
+
+
+def init_ocr_pool() -> None:
+    """Crea el pool de procesos de OCR (se llama al arrancar la aplicación)"""
+    _get_executor()
+    _get_semaphore()
+
+
+def close_ocr_pool() -> None:
+    """Detiene el pool de procesos de OCR (se llama al apagar la aplicación)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def new_job_limiter() -> asyncio.Semaphore:
+    """Límite de imágenes en OCR simultáneas para un mismo escaneo"""
+    return asyncio.Semaphore(OCR_MAX_PER_JOB)
+
+
+async def run_ocr(image_data: bytes, job_limiter: Optional[asyncio.Semaphore] = None) -> Optional[str]:
+    """
+    Ejecuta OCR sobre los bytes de una imagen fuera del event loop
+
+    Devuelve None si Tesseract no está disponible, si la cola está llena o si se
+    agota el tiempo de espera.
+    """
+    global _pending
+    tesseract_cmd = get_tesseract_cmd()
+    if not tesseract_cmd:
+        return None
+
+    if _pending >= OCR_MAX_PENDING:
+        _stats["rejected"] += 1
+        logger.warning(f"[OCR] Cola llena ({_pending} imágenes pendientes), se omite la imagen")
+        return None
+
+    _pending += 1
+    _stats["submitted"] += 1
+    try:
+        if job_limiter is not None:
+            await job_limiter.acquire()
+        try:
+            async with _get_semaphore():
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(
+                    _get_executor(), _ocr_worker, image_data, tesseract_cmd, OCR_LANG, OCR_TIMEOUT
+                )
+                text = await asyncio.wait_for(future, timeout=OCR_TIMEOUT + 5)
+                _stats["completed"] += 1
+                return text
+        finally:
+            if job_limiter is not None:
+                job_limiter.release()
+    except asyncio.TimeoutError:
+        _stats["timeouts"] += 1
+        logger.warning("[OCR] Tiempo de espera agotado procesando imagen")
+        return None
+    except BrokenProcessPool as e:
+        # Un proceso hijo murió; el pool se recrea en la siguiente imagen
+        _stats["errors"] += 1
+        logger.error(f"[OCR] El pool de procesos se rompió: {str(e)}")
+        close_ocr_pool()
+        return None
+    except Exception as e:
+        # pytesseract lanza RuntimeError cuando mata a Tesseract por timeout
+        if isinstance(e, RuntimeError) and 'timeout' in str(e).lower():
+            _stats["timeouts"] += 1
+        else:
+            _stats["errors"] += 1
+        logger.warning(f"[OCR] Error al procesar imagen: {str(e)}")
+        return None
+    finally:
+        _pending -= 1
+
+
+def get_ocr_stats() -> Dict[str, Any]:
+    """Estadísticas del pool de OCR"""
+    return {
+        "max_workers": OCR_MAX_WORKERS,
+        "max_pending": OCR_MAX_PENDING,
+        "max_per_job": OCR_MAX_PER_JOB,
+        "pending": _pending,
+        **_stats,
+    }
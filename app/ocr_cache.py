@@ -0,0 +1,238 @@
+"""
+Caché de resultados de OCR direccionada por contenido.
+
+Los banners de contacto de cabeceras y pies de página aparecen en casi todas las
+páginas de un sitio y en cada nuevo escaneo. La caché guarda:
+
+- por URL: el hash del contenido y los validadores HTTP (ETag/Last-Modified),
+  para no descargar la imagen mientras esté fresca o revalidarla con un 304;
+- por hash SHA-256 del contenido: el texto resultante del OCR, para no volver a
+  pasar por Tesseract aunque la misma imagen se sirva desde otra URL.
+
+Ambos niveles viven en memoria con desalojo LRU y, opcionalmente, en disco; las
+lecturas y escrituras en disco se hacen en hilos, fuera del event loop.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("webscraper")
+
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", 2048))
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", 3600))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR")  # Sin definir = solo memoria
+OCR_CACHE_DISK_MAX_ENTRIES = int(os.getenv("OCR_CACHE_DISK_MAX_ENTRIES", 20000))
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class OCRCache:
+    """Caché LRU de dos niveles (URL → validadores, hash → texto) con capa en disco opcional"""
+
+    def __init__(self, max_entries: int = OCR_CACHE_MAX_ENTRIES, ttl: int = OCR_CACHE_TTL,
+                 disk_dir: Optional[str] = OCR_CACHE_DIR, disk_max_entries: int = OCR_CACHE_DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self._urls: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._results: "OrderedDict[str, str]" = OrderedDict()
+        self._disk_writes = 0
+        self.stats = {
+            "fresh_hits": 0,
+            "revalidated_hits": 0,
+            "content_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+        }
+        if disk_dir:
+            os.makedirs(os.path.join(disk_dir, "urls"), exist_ok=True)
+            os.makedirs(os.path.join(disk_dir, "results"), exist_ok=True)
+
+    # -- Capa en memoria -------------------------------------------------
+
+    def _remember(self, store: OrderedDict, key: str, value: Any) -> None:
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self.max_entries:
+            store.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    # -- Capa en disco (los métodos síncronos se ejecutan en un hilo) ----
+
+    def _disk_path(self, kind: str, key: str) -> str:
+        name = hashlib.sha1(key.encode()).hexdigest() if kind == "urls" else key
+        return os.path.join(self.disk_dir, kind, f"{name}.json")
+
+    def _disk_read(self, kind: str, key: str) -> Optional[Any]:
+        path = self._disk_path(kind, key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # Marcar como usado recientemente para el desalojo
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def _disk_write(self, kind: str, key: str, value: Any) -> bool:
+        path = self._disk_path(kind, key)
+        # Nombre temporal único por hilo: puede haber varias escrituras a la vez
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"[OCR] No se pudo escribir la caché en disco: {str(e)}")
+            return False
+        return True
+
+    def _prune_disk(self) -> int:
+        """Elimina las entradas menos usadas cuando el disco supera el límite; devuelve cuántas"""
+        evicted = 0
+        for kind in ("urls", "results"):
+            folder = os.path.join(self.disk_dir, kind)
+            try:
+                entries = [e for e in os.scandir(folder) if e.is_file()]
+            except OSError:
+                continue
+            excess = len(entries) - self.disk_max_entries
+            if excess <= 0:
+                continue
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for entry in entries[:excess]:
+                try:
+                    os.remove(entry.path)
+                    evicted += 1
+                except OSError:
+                    pass
+        return evicted
+
+    async def _load(self, kind: str, key: str) -> Optional[Any]:
+        if not self.disk_dir:
+            return None
+        return await asyncio.to_thread(self._disk_read, kind, key)
+
+    async def _store(self, kind: str, key: str, value: Any) -> None:
+        if not self.disk_dir:
+            return
+        if not await asyncio.to_thread(self._disk_write, kind, key, value):
+            return
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self.stats["evictions"] += await asyncio.to_thread(self._prune_disk)
+
+    # -- Niveles ---------------------------------------------------------
+
+    async def _get_url(self, url: str) -> Optional[Dict[str, Any]]:
+        entry = self._urls.get(url)
+        if entry is None:
+            entry = await self._load("urls", url)
+            if entry is None:
+                return None
+        self._remember(self._urls, url, entry)
+        return entry
+
+    async def _get_result(self, digest: str) -> Optional[str]:
+        result = self._results.get(digest)
+        if result is None:
+            stored = await self._load("results", digest)
+            if stored is None:
+                return None
+            result = stored.get("text", "")
+        self._remember(self._results, digest, result)
+        return result
+
+    async def _put_url(self, url: str, digest: str, etag: Optional[str],
+                       last_modified: Optional[str]) -> None:
+        entry = {
+            "hash": digest,
+            "etag": etag,
+            "last_modified": last_modified,
+            "checked_at": time.time(),
+        }
+        self._remember(self._urls, url, entry)
+        await self._store("urls", url, entry)
+
+    # -- API pública -----------------------------------------------------
+
+    async def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Lo que se sabe de una imagen por su URL: hash, validadores HTTP y, en
+        "result", el texto de OCR de ese contenido ('' si no tenía correos).
+        None si la URL no está en caché o su resultado ya se desalojó.
+        """
+        entry = await self._get_url(url)
+        if entry is None:
+            return None
+        result = await self._get_result(entry["hash"])
+        if result is None:
+            return None
+        return {**entry, "result": result}
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry.get("checked_at", 0) < self.ttl
+
+    def fresh_hit(self, entry: Dict[str, Any]) -> str:
+        """Resultado de una imagen aún fresca: sin descarga ni OCR"""
+        self.stats["fresh_hits"] += 1
+        return entry["result"]
+
+    async def revalidated_hit(self, url: str, entry: Dict[str, Any]) -> str:
+        """Renueva la frescura de una URL tras una revalidación 304 y devuelve su resultado"""
+        self.stats["revalidated_hits"] += 1
+        await self._put_url(url, entry["hash"], entry.get("etag"), entry.get("last_modified"))
+        return entry["result"]
+
+    async def content_hit(self, url: str, digest: str, etag: Optional[str] = None,
+                          last_modified: Optional[str] = None) -> Optional[str]:
+        """
+        Resultado ya conocido para este contenido aunque llegue desde otra URL;
+        None si hay que pasar la imagen por OCR
+        """
+        result = await self._get_result(digest)
+        if result is None:
+            return None
+        self.stats["content_hits"] += 1
+        await self._put_url(url, digest, etag, last_modified)
+        return result
+
+    def record_miss(self) -> None:
+        """Imagen nueva cuyo resultado no se guarda (fallo de OCR o cola llena)"""
+        self.stats["misses"] += 1
+
+    async def put(self, url: str, digest: str, text: str, etag: Optional[str] = None,
+                  last_modified: Optional[str] = None) -> None:
+        """Guarda el resultado de OCR de una imagen nueva (cuenta como fallo de caché)"""
+        self.stats["misses"] += 1
+        self._remember(self._results, digest, text)
+        await self._store("results", digest, {"text": text})
+        await self._put_url(url, digest, etag, last_modified)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = sum(self.stats.values()) - self.stats["evictions"]
+        hits = lookups - self.stats["misses"]
+        return {
+            "urls": len(self._urls),
+            "results": len(self._results),
+            "max_entries": self.max_entries,
+            "disk": bool(self.disk_dir),
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            **self.stats,
+        }
+
+
+# Caché compartida por todos los escaneos del proceso
+ocr_cache = OCRCache()
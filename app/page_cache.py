@@ -0,0 +1,253 @@
+"""
+Caché de páginas HTML compartida entre escaneos.
+
+Los clientes vuelven a escanear los mismos sitios una y otra vez. Cada página se
+guarda bajo su URL canónica con el cuerpo comprimido (zlib) y los validadores
+HTTP (ETag/Last-Modified):
+
+- dentro de la antigüedad que permita el escaneo (cache_max_age) se sirve sin
+  tocar la red;
+- fuera de ella se hace una petición condicional y un 304 reutiliza el cuerpo.
+
+Hay una capa en memoria (LRU acotada en bytes) y una en disco (PAGE_CACHE_DIR),
+también acotada en bytes y compartida por los workers del mismo nodo. La lectura
+y escritura en disco y la (des)compresión se hacen en hilos, fuera del event loop.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from .urls import canonicalize_url
+
+load_dotenv()
+
+logger = logging.getLogger("webscraper")
+
+PAGE_CACHE_MEMORY_MAX_BYTES = int(os.getenv("PAGE_CACHE_MEMORY_MAX_BYTES", 32 * 1024 * 1024))
+# Vacío = solo memoria
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "webscraper_page_cache"))
+PAGE_CACHE_DISK_MAX_BYTES = int(os.getenv("PAGE_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024))
+
+# Cambia cuando cambian las reglas de canonicalize_url: las entradas en disco con
+# claves antiguas dejan de leerse (y son las primeras en desalojarse)
+PAGE_CACHE_KEY_VERSION = 2
+
+
+def compress_text(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+class CachedPage:
+    """Cuerpo comprimido de una página y sus validadores"""
+    __slots__ = ("body", "etag", "last_modified", "final_url", "fetched_at")
+
+    def __init__(self, body: bytes, etag: Optional[str], last_modified: Optional[str],
+                 final_url: Optional[str], fetched_at: float):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.final_url = final_url
+        self.fetched_at = fetched_at
+
+    def _decode(self) -> str:
+        return zlib.decompress(self.body).decode("utf-8") if self.body else ""
+
+    async def read_text(self) -> str:
+        """Cuerpo descomprimido (en un hilo: zlib libera el GIL)"""
+        if not self.body:
+            return ""
+        return await asyncio.to_thread(self._decode)
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def _header(self) -> bytes:
+        return json.dumps({
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "final_url": self.final_url,
+            "fetched_at": self.fetched_at,
+        }).encode("utf-8")
+
+    def to_bytes(self) -> bytes:
+        # Cabecera JSON en la primera línea y el cuerpo comprimido a continuación
+        return self._header() + b"\n" + self.body
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CachedPage":
+        header, _, body = data.partition(b"\n")
+        meta = json.loads(header)
+        return cls(body, meta.get("etag"), meta.get("last_modified"), meta.get("final_url"), meta["fetched_at"])
+
+
+class PageCache:
+    """Caché LRU de páginas por URL canónica con capa en disco opcional"""
+
+    def __init__(self, memory_max_bytes: int = PAGE_CACHE_MEMORY_MAX_BYTES,
+                 disk_dir: Optional[str] = PAGE_CACHE_DIR, disk_max_bytes: int = PAGE_CACHE_DISK_MAX_BYTES):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self._pages: "OrderedDict[str, CachedPage]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_written = 0
+        self.stats = {
+            "fresh_hits": 0,
+            "revalidated_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"No se pudo crear la caché de páginas en {self.disk_dir}: {str(e)}")
+                self.disk_dir = None
+
+    # -- Capa en memoria -------------------------------------------------
+
+    def _remember(self, key: str, page: CachedPage) -> None:
+        previous = self._pages.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous.body)
+        self._pages[key] = page
+        self._memory_bytes += len(page.body)
+        while self._memory_bytes > self.memory_max_bytes and len(self._pages) > 1:
+            _, evicted = self._pages.popitem(last=False)
+            self._memory_bytes -= len(evicted.body)
+            self.stats["evictions"] += 1
+
+    # -- Capa en disco (los métodos síncronos se ejecutan en un hilo) ----
+
+    def _disk_path(self, key: str) -> str:
+        digest = hashlib.sha1(f"{PAGE_CACHE_KEY_VERSION}:{key}".encode()).hexdigest()
+        return os.path.join(self.disk_dir, digest + ".page")
+
+    def _disk_read(self, key: str) -> Optional[CachedPage]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                page = CachedPage.from_bytes(f.read())
+            os.utime(path)  # Marcar como usado recientemente para el desalojo
+            return page
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _disk_write(self, key: str, page: CachedPage) -> int:
+        """Escribe la página; devuelve los bytes escritos (0 si falla)"""
+        path = self._disk_path(key)
+        # Nombre temporal único por hilo: puede haber varias escrituras a la vez
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        data = page.to_bytes()
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"No se pudo escribir la caché de páginas en disco: {str(e)}")
+            return 0
+        return len(data)
+
+    def _prune_disk(self) -> int:
+        """Elimina las páginas menos usadas cuando el disco supera el límite; devuelve cuántas"""
+        try:
+            entries = [(e.path, e.stat()) for e in os.scandir(self.disk_dir)
+                       if e.is_file() and e.name.endswith(".page")]
+        except OSError:
+            return 0
+        total = sum(st.st_size for _, st in entries)
+        if total <= self.disk_max_bytes:
+            return 0
+        entries.sort(key=lambda item: item[1].st_mtime)
+        evicted = 0
+        for path, st in entries:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= st.st_size
+                evicted += 1
+            except OSError:
+                pass
+        return evicted
+
+    async def _store_on_disk(self, key: str, page: CachedPage) -> None:
+        if not self.disk_dir:
+            return
+        self._disk_written += await asyncio.to_thread(self._disk_write, key, page)
+        # Comprobar el tamaño total cada vez que se escribe ~1/20 del límite
+        if self._disk_written >= self.disk_max_bytes // 20:
+            self._disk_written = 0
+            self.stats["evictions"] += await asyncio.to_thread(self._prune_disk)
+
+    # -- API pública -----------------------------------------------------
+
+    async def get(self, url: str) -> Optional[CachedPage]:
+        key = canonicalize_url(url)
+        page = self._pages.get(key)
+        if page is None:
+            if not self.disk_dir:
+                return None
+            page = await asyncio.to_thread(self._disk_read, key)
+            if page is None:
+                return None
+        self._remember(key, page)
+        return page
+
+    async def fresh_hit(self, page: CachedPage) -> str:
+        """Texto de una página servida sin red por estar dentro de la antigüedad permitida"""
+        self.stats["fresh_hits"] += 1
+        return await page.read_text()
+
+    async def revalidated_hit(self, url: str, page: CachedPage) -> str:
+        """Renueva la frescura de una página tras un 304 y devuelve su texto"""
+        self.stats["revalidated_hits"] += 1
+        key = canonicalize_url(url)
+        page = CachedPage(page.body, page.etag, page.last_modified, page.final_url, time.time())
+        self._remember(key, page)
+        await self._store_on_disk(key, page)
+        return await page.read_text()
+
+    def record_miss(self) -> None:
+        """Página descargada que no se guarda (p. ej. sin decodificar por no tener nada que extraer)"""
+        self.stats["misses"] += 1
+
+    async def put(self, url: str, text: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+                  final_url: Optional[str] = None) -> None:
+        """Guarda una página descargada (cuenta como fallo de caché)"""
+        self.stats["misses"] += 1
+        key = canonicalize_url(url)
+        body = await asyncio.to_thread(compress_text, text) if text else b""
+        page = CachedPage(body, etag, last_modified, final_url, time.time())
+        self._remember(key, page)
+        self.stats["stores"] += 1
+        await self._store_on_disk(key, page)
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self.stats["fresh_hits"] + self.stats["revalidated_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            "pages": len(self._pages),
+            "memory_bytes": self._memory_bytes,
+            "memory_max_bytes": self.memory_max_bytes,
+            "disk": bool(self.disk_dir),
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            **self.stats,
+        }
+
+
+# Caché compartida por todos los escaneos del proceso
+page_cache = PageCache()
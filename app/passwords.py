@@ -0,0 +1,103 @@
+"""
+Hash y verificación de contraseñas (bcrypt) en un pool de hilos acotado.
+
+bcrypt consume 100-300 ms de CPU por operación a propósito; ejecutado dentro de
+un handler async congela el event loop del worker (estados de escaneo, rastreos,
+SSE) durante todo ese tiempo. La librería libera el GIL mientras calcula, así que
+basta con un ThreadPoolExecutor propio, separado del pool por defecto del loop.
+
+La cola es acotada: con PASSWORD_HASH_MAX_PENDING operaciones pendientes las
+nuevas se rechazan con 503 y Retry-After en lugar de acumular latencia.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+load_dotenv()
+
+logger = logging.getLogger("webscraper")
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 32))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", 2))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pending = 0
+
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "rejected": 0,
+    "errors": 0,
+}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def init_password_pool() -> None:
+    """Crea el pool de hilos de bcrypt (se llama al arrancar la aplicación)"""
+    _get_executor()
+
+
+def close_password_pool() -> None:
+    """Detiene el pool de hilos de bcrypt (se llama al apagar la aplicación)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _run(func: Callable[..., T], *args) -> T:
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        _stats["rejected"] += 1
+        logger.warning(f"Cola de contraseñas llena ({_pending} pendientes), se rechaza la petición")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado. Inténtalo de nuevo en unos segundos.",
+            headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)}
+        )
+    _pending += 1
+    _stats["submitted"] += 1
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+        _stats["completed"] += 1
+        return result
+    except Exception:
+        _stats["errors"] += 1
+        raise
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(pwd_context.hash, password)
+
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run(pwd_context.verify, plain_password, hashed_password)
+
+
+def get_password_stats() -> Dict[str, Any]:
+    """Estadísticas del pool de bcrypt"""
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_pending": PASSWORD_HASH_MAX_PENDING,
+        "pending": _pending,
+        **_stats,
+    }
@@ -0,0 +1,163 @@
+"""
+Difusión en vivo del progreso de los escaneos (Server-Sent Events).
+
+Cada trabajo en curso en este proceso tiene un canal con un buffer circular de
+eventos numerados. Publicar es O(1): se añade el evento al buffer y se despierta
+a los suscriptores; cada suscriptor lleva su propio cursor sobre el buffer
+compartido, así que el coste por evento no depende de cuántos haya. Quien se
+conecta tarde (o se queda atrás más de lo que guarda el buffer) recibe primero
+una instantánea con el estado acumulado.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("webscraper")
+
+PROGRESS_BUFFER_SIZE = int(os.getenv("PROGRESS_BUFFER_SIZE", 256))
+PROGRESS_KEEPALIVE = float(os.getenv("PROGRESS_KEEPALIVE", 15))
+
+Event = Tuple[int, str, Dict[str, Any]]
+
+
+def format_sse(event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """Serializa un evento en el formato text/event-stream"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class JobChannel:
+    """Buffer de eventos de un trabajo compartido por todos sus suscriptores"""
+
+    def __init__(self, max_events: int = PROGRESS_BUFFER_SIZE):
+        # Buffer circular: el evento número `seq` ocupa la posición seq % max_events
+        self._events: List[Optional[Event]] = [None] * max_events
+        self._max_events = max_events
+        self._seq = 0
+        self._changed = asyncio.Event()
+        self.closed = False
+        self.subscribers = 0
+        # Estado acumulado para las instantáneas de quien llega tarde
+        self.state: Dict[str, Any] = {"status": "processing", "pages_scanned": 0, "emails_found": 0}
+        self._emails: List[str] = []
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    @property
+    def oldest_seq(self) -> int:
+        """Número del evento más antiguo que conserva el buffer"""
+        return max(1, self._seq - self._max_events + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.state, "emails": list(self._emails)}
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        if self.closed:
+            return
+        self._seq += 1
+        self._events[self._seq % self._max_events] = (self._seq, event, data)
+        self.state.update({k: v for k, v in data.items() if k != "new_emails"})
+        self._emails.extend(data.get("new_emails", ()))
+        self._wake()
+
+    def close(self, data: Dict[str, Any]) -> None:
+        """Publica el estado final y termina las suscripciones"""
+        if self.closed:
+            return
+        self.publish("status", data)
+        self.closed = True
+        self._wake()
+
+    def _wake(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self, after: Optional[int] = None,
+                        keepalive: float = PROGRESS_KEEPALIVE) -> AsyncIterator[Optional[Event]]:
+        """
+        Itera los eventos posteriores a `after`; None indica un keep-alive
+
+        Sin `after`, o si esos eventos ya salieron del buffer, empieza con una
+        instantánea ("snapshot") del estado acumulado.
+        """
+        self.subscribers += 1
+        try:
+            cursor = after
+            if cursor is None or cursor + 1 < self.oldest_seq:
+                cursor = self._seq
+                yield (cursor, "snapshot", self.snapshot())
+            while True:
+                if cursor < self._seq:
+                    if cursor + 1 < self.oldest_seq:
+                        # Suscriptor demasiado lento: el buffer ya descartó sus eventos
+                        cursor = self._seq
+                        yield (cursor, "snapshot", self.snapshot())
+                        continue
+                    # Acceso directo por el cursor: O(1) por evento sea cual sea el retraso
+                    cursor += 1
+                    yield self._events[cursor % self._max_events]
+                    continue
+                if self.closed:
+                    return
+                changed = self._changed
+                try:
+                    await asyncio.wait_for(changed.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self.subscribers -= 1
+
+
+class ProgressBroker:
+    """Canales de los trabajos que se ejecutan en este proceso"""
+
+    def __init__(self):
+        self._channels: Dict[str, JobChannel] = {}
+        self.stats = {"events": 0, "channels_opened": 0}
+
+    def open(self, request_id: str) -> JobChannel:
+        channel = self._channels.get(request_id)
+        if channel is None or channel.closed:
+            channel = JobChannel()
+            self._channels[request_id] = channel
+            self.stats["channels_opened"] += 1
+        return channel
+
+    def get(self, request_id: str) -> Optional[JobChannel]:
+        return self._channels.get(request_id)
+
+    def publish(self, request_id: str, event: str, data: Dict[str, Any]) -> None:
+        channel = self._channels.get(request_id)
+        if channel is not None:
+            channel.publish(event, data)
+            self.stats["events"] += 1
+
+    def close(self, request_id: str, data: Dict[str, Any]) -> None:
+        # Los suscriptores conservan su referencia al canal hasta leer el estado final
+        channel = self._channels.pop(request_id, None)
+        if channel is not None:
+            channel.close(data)
+            self.stats["events"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "active_channels": len(self._channels),
+            "subscribers": sum(c.subscribers for c in self._channels.values()),
+            **self.stats,
+        }
+
+
+# Canales de progreso de todos los trabajos del proceso
+progress_broker = ProgressBroker()
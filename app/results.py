@@ -0,0 +1,235 @@
+"""
+Consulta y exportación de los correos guardados en found_emails.
+
+El listado usa paginación por clave (keyset): el cursor es la posición
+(found_at, id) de la última fila devuelta, así que pedir la página 1000 cuesta lo
+mismo que pedir la primera, a diferencia de OFFSET. Cada filtro principal
+(dominio, url, usuario o solo fechas) tiene su índice compuesto terminado en
+(found_at, id_found_emails), de modo que el orden sale del propio índice.
+
+Ambas rutas exigen sesión: cada usuario ve sus propios correos y los de los
+escaneos anónimos; solo un administrador puede ver los de otro usuario.
+
+La exportación (CSV o NDJSON) recorre el resultado con un cursor del servidor y
+envía las filas en bloques: la memoria no depende del número de filas.
+"""
+import base64
+import csv
+import io
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from .auth import UserInDB, get_current_active_user
+from .db import pg_connection
+from .urls import canonical_host
+
+load_dotenv()
+
+logger = logging.getLogger("webscraper")
+
+RESULTS_MAX_PAGE_SIZE = int(os.getenv("RESULTS_MAX_PAGE_SIZE", 1000))
+# Filas que pide el cursor del servidor en cada viaje durante la exportación
+RESULTS_EXPORT_PREFETCH = int(os.getenv("RESULTS_EXPORT_PREFETCH", 1000))
+
+EXPORT_COLUMNS = ("id", "email", "url", "domain", "user_id", "found_at", "last_seen_at")
+
+router = APIRouter(
+    prefix="/api/v1/emails",
+    tags=["Resultados"],
+    responses={404: {"description": "No encontrado"}}
+)
+
+
+class FoundEmail(BaseModel):
+    id: int
+    email: str
+    url: str
+    domain: Optional[str] = None
+    user_id: Optional[str] = None
+    found_at: datetime
+    last_seen_at: Optional[datetime] = None
+
+
+class FoundEmailPage(BaseModel):
+    items: List[FoundEmail]
+    next_cursor: Optional[str] = Field(None, description="Cursor de la página siguiente (None si no hay más)")
+
+
+class EmailFilters:
+    """Filtros comunes al listado y a la exportación, traducidos a SQL parametrizado"""
+
+    def __init__(
+        self,
+        current_user: UserInDB = Depends(get_current_active_user),
+        domain: Optional[str] = Query(None, description="Dominio del sitio escaneado (ej: ejemplo.com)"),
+        url: Optional[str] = Query(None, description="URL exacta escaneada"),
+        user_id: Optional[uuid.UUID] = Query(None, description="Usuario propietario de los resultados (solo administradores)"),
+        email: Optional[str] = Query(None, description="Correo exacto"),
+        since: Optional[datetime] = Query(None, description="Encontrados desde esta fecha (incluida)"),
+        until: Optional[datetime] = Query(None, description="Encontrados antes de esta fecha"),
+    ):
+        is_admin = current_user.role == "admin" or current_user.is_super_admin
+        if user_id is not None and not is_admin and str(user_id) != current_user.id:
+            raise HTTPException(status_code=403, detail="No tienes permiso para ver los correos de otro usuario")
+        # Sin ser administrador: solo los correos propios y los de escaneos anónimos
+        self.owner = None if is_admin else uuid.UUID(current_user.id)
+        self.domain = canonical_host(domain.strip()) if domain else None
+        self.url = url
+        self.user_id = user_id
+        self.email = email.strip().lower() if email else None
+        self.since = since
+        self.until = until
+
+    def where(self, args: List[Any]) -> List[str]:
+        clauses = []
+        if self.owner is not None:
+            args.append(self.owner)
+            clauses.append(f"(user_id = ${len(args)} OR user_id IS NULL)")
+        for column, value in (("domain", self.domain), ("url", self.url), ("user_id", self.user_id),
+                              ("email", self.email)):
+            if value is not None:
+                args.append(value)
+                clauses.append(f"{column} = ${len(args)}")
+        if self.since is not None:
+            args.append(self.since)
+            clauses.append(f"found_at >= ${len(args)}")
+        if self.until is not None:
+            args.append(self.until)
+            clauses.append(f"found_at < ${len(args)}")
+        return clauses
+
+
+def encode_cursor(found_at: datetime, row_id: int) -> str:
+    raw = json.dumps([found_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        found_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(found_at), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def build_query(filters: EmailFilters, after: Optional[Tuple[datetime, int]] = None,
+                limit: Optional[int] = None) -> Tuple[str, List[Any]]:
+    """SELECT ordenado por (found_at, id) descendente, opcionalmente desde un cursor"""
+    args: List[Any] = []
+    clauses = filters.where(args)
+    if after is not None:
+        args.extend(after)
+        clauses.append(f"(found_at, id_found_emails) < (${len(args) - 1}, ${len(args)})")
+    sql = """
+        SELECT id_found_emails AS id, email, url, domain, user_id, found_at, last_seen_at
+        FROM public.found_emails
+    """
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY found_at DESC, id_found_emails DESC"
+    if limit is not None:
+        args.append(limit)
+        sql += f" LIMIT ${len(args)}"
+    return sql, args
+
+
+def row_to_dict(row) -> Dict[str, Any]:
+    item = dict(row)
+    if item["user_id"] is not None:
+        item["user_id"] = str(item["user_id"])
+    return item
+
+
+@router.get("", response_model=FoundEmailPage)
+async def list_found_emails(
+    filters: EmailFilters = Depends(),
+    limit: int = Query(100, ge=1, le=RESULTS_MAX_PAGE_SIZE, description="Filas por página"),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior"),
+):
+    """
+    Lista los correos guardados, del más reciente al más antiguo.
+
+    Para la página siguiente, repite la consulta con `cursor` igual al
+    `next_cursor` recibido.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    # Una fila de más indica si hay página siguiente
+    sql, args = build_query(filters, after, limit + 1)
+    async with pg_connection() as conn:
+        rows = await conn.fetch(sql, *args)
+    items = [row_to_dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last["found_at"], last["id"])
+    return {"items": items, "next_cursor": next_cursor}
+
+
+async def export_rows(filters: EmailFilters) -> AsyncIterator[Dict[str, Any]]:
+    sql, args = build_query(filters)
+    async with pg_connection() as conn:
+        # Los cursores del servidor solo existen dentro de una transacción
+        async with conn.transaction(readonly=True):
+            async for row in conn.cursor(sql, *args, prefetch=RESULTS_EXPORT_PREFETCH):
+                yield row_to_dict(row)
+
+
+async def export_csv(filters: EmailFilters) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    rows = 0
+    async for item in export_rows(filters):
+        writer.writerow(item)
+        rows += 1
+        if rows % RESULTS_EXPORT_PREFETCH == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+async def export_ndjson(filters: EmailFilters) -> AsyncIterator[str]:
+    chunk: List[str] = []
+    async for item in export_rows(filters):
+        chunk.append(json.dumps(item, default=str))
+        if len(chunk) >= RESULTS_EXPORT_PREFETCH:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+@router.get("/export")
+async def export_found_emails(
+    filters: EmailFilters = Depends(),
+    format: Literal["csv", "ndjson"] = Query("csv", description="Formato de exportación"),
+):
+    """
+    Exporta todos los correos que cumplen los filtros, en streaming.
+
+    Las filas se leen con un cursor del servidor, así que la exportación de
+    millones de filas usa memoria constante.
+    """
+    stamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    if format == "ndjson":
+        return StreamingResponse(
+            export_ndjson(filters),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="found_emails_{stamp}.ndjson"'}
+        )
+    return StreamingResponse(
+        export_csv(filters),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="found_emails_{stamp}.csv"'}
+    )
@@ -0,0 +1,396 @@
+"""
+Registro compartido de tokens revocados (logout).
+
+Cada token revocado se guarda por su identificador (jti) con la misma
+caducidad que el token: pasado su exp ya no hace falta recordarlo y la limpieza
+periódica lo borra. Hay dos backends, como en app.job_store:
+
+- PostgresRevocationStore: tabla revoked_tokens (compartida entre workers y nodos).
+- SQLiteRevocationStore: fichero SQLite local (un solo nodo, desarrollo y pruebas).
+
+Delante del almacén hay un filtro de Bloom en memoria con todos los tokens
+revocados vigentes, que se sincroniza cada TOKEN_REVOCATION_SYNC_INTERVAL
+segundos con lo revocado por otros workers. La comprobación habitual ("no está
+revocado") se resuelve con el filtro sin ninguna E/S; solo los positivos (reales
+o falsos) consultan una LRU de respuestas y, si no está, el almacén.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .db import pg_connection
+from .job_store import JOB_STORE_BACKEND, JOB_STORE_SQLITE_PATH
+
+load_dotenv()
+
+logger = logging.getLogger("webscraper")
+
+TOKEN_REVOCATION_BACKEND = os.getenv("TOKEN_REVOCATION_BACKEND", JOB_STORE_BACKEND).lower()
+TOKEN_REVOCATION_SQLITE_PATH = os.getenv("TOKEN_REVOCATION_SQLITE_PATH", JOB_STORE_SQLITE_PATH)
+# Retraso máximo con el que un worker ve los logouts hechos en otro
+TOKEN_REVOCATION_SYNC_INTERVAL = float(os.getenv("TOKEN_REVOCATION_SYNC_INTERVAL", 5))
+TOKEN_REVOCATION_PRUNE_INTERVAL = float(os.getenv("TOKEN_REVOCATION_PRUNE_INTERVAL", 300))
+# Tamaño del filtro de Bloom (se duplica si se supera) y de la LRU de respuestas
+TOKEN_REVOCATION_BLOOM_CAPACITY = int(os.getenv("TOKEN_REVOCATION_BLOOM_CAPACITY", 100000))
+TOKEN_REVOCATION_CACHE_SIZE = int(os.getenv("TOKEN_REVOCATION_CACHE_SIZE", 10000))
+# Caducidad de la revocación de un token sin exp
+TOKEN_REVOCATION_MAX_TTL = float(os.getenv("TOKEN_REVOCATION_MAX_TTL", 30 * 24 * 3600))
+
+Revocation = Tuple[str, float, float]  # (token_id, revoked_at, expires_at)
+
+
+class BloomFilter:
+    """Conjunto probabilístico: sin falsos negativos, ~1% de falsos positivos a plena capacidad"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(1, capacity)
+        self.num_bits = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str) -> Iterable[int]:
+        # Doble hashing: k posiciones a partir de dos hashes de 64 bits
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevocationStore(ABC):
+    """Base común: filtro de Bloom, LRU de respuestas y tarea de sincronización"""
+
+    def __init__(self, sync_interval: float = TOKEN_REVOCATION_SYNC_INTERVAL,
+                 prune_interval: float = TOKEN_REVOCATION_PRUNE_INTERVAL,
+                 capacity: int = TOKEN_REVOCATION_BLOOM_CAPACITY,
+                 cache_size: int = TOKEN_REVOCATION_CACHE_SIZE):
+        self.sync_interval = sync_interval
+        self.prune_interval = prune_interval
+        self.capacity = capacity
+        self.cache_size = cache_size
+        self._bloom = BloomFilter(capacity)
+        self._cache: "OrderedDict[str, bool]" = OrderedDict()
+        # Mientras el filtro no se haya cargado, todas las consultas van al almacén
+        self._synced = False
+        self._synced_until = 0.0
+        self._last_prune = 0.0
+        # Revocaciones locales hechas mientras se reconstruye el filtro
+        self._rebuilding: Optional[List[str]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            "checks": 0,
+            "bloom_negatives": 0,
+            "cache_hits": 0,
+            "store_lookups": 0,
+            "revoked_hits": 0,
+            "false_positives": 0,
+            "revoked": 0,
+            "synced": 0,
+            "pruned": 0,
+        }
+
+    async def start(self) -> None:
+        # La tarea reintenta la carga inicial si el almacén aún no está disponible
+        if self._task is None:
+            self._task = asyncio.create_task(self._sync_loop())
+        await self._setup()
+        await self._rebuild()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def revoke(self, token_id: str, expires_at: Optional[float] = None) -> None:
+        """Revoca un token hasta su caducidad (exp)"""
+        now = time.time()
+        if expires_at is None:
+            expires_at = now + TOKEN_REVOCATION_MAX_TTL
+        if expires_at <= now:
+            return
+        await self._insert(token_id, expires_at)
+        if token_id not in self._bloom:
+            self._bloom.add(token_id)
+        if self._rebuilding is not None:
+            self._rebuilding.append(token_id)
+        self._remember(token_id, True)
+        self.stats["revoked"] += 1
+
+    async def is_revoked(self, token_id: str) -> bool:
+        self.stats["checks"] += 1
+        if self._synced and token_id not in self._bloom:
+            self.stats["bloom_negatives"] += 1
+            return False
+        cached = self._cache.get(token_id)
+        if cached is not None:
+            self._cache.move_to_end(token_id)
+            self.stats["cache_hits"] += 1
+            return cached
+        self.stats["store_lookups"] += 1
+        revoked = await self._exists(token_id, time.time())
+        self.stats["revoked_hits" if revoked else "false_positives"] += 1
+        self._remember(token_id, revoked)
+        return revoked
+
+    def _remember(self, token_id: str, revoked: bool) -> None:
+        self._cache[token_id] = revoked
+        self._cache.move_to_end(token_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _add_all(self, rows: List[Revocation]) -> int:
+        added = 0
+        for token_id, revoked_at, _ in rows:
+            # La ventana de solape devuelve filas ya vistas: no contarlas dos veces
+            if token_id not in self._bloom:
+                self._bloom.add(token_id)
+                added += 1
+            if token_id in self._cache:
+                self._cache[token_id] = True
+            self._synced_until = max(self._synced_until, revoked_at)
+        return added
+
+    async def _rebuild(self) -> None:
+        """Reconstruye el filtro con las revocaciones vigentes (descarta las caducadas)"""
+        self._rebuilding = []
+        try:
+            rows = await self._fetch_since(0.0, time.time())
+            capacity = self.capacity
+            while len(rows) > capacity * 0.8:
+                capacity *= 2
+            self.capacity = capacity
+            self._bloom = BloomFilter(capacity)
+            self._cache.clear()
+            self._synced_until = 0.0
+            self._add_all(rows)
+            for token_id in self._rebuilding:
+                if token_id not in self._bloom:
+                    self._bloom.add(token_id)
+            self._synced = True
+        finally:
+            self._rebuilding = None
+
+    async def sync(self) -> None:
+        """Incorpora al filtro lo revocado por otros workers desde la última sincronización"""
+        # Solapar una ventana: transacciones confirmadas tarde con revoked_at anterior
+        since = max(0.0, self._synced_until - self.sync_interval)
+        rows = await self._fetch_since(since, time.time())
+        self.stats["synced"] += self._add_all(rows)
+
+    async def prune(self) -> int:
+        removed = await self._purge(time.time())
+        self.stats["pruned"] += removed
+        await self._rebuild()
+        return removed
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                if not self._synced:
+                    await self._setup()
+                    await self._rebuild()
+                elif time.time() - self._last_prune >= self.prune_interval:
+                    self._last_prune = time.time()
+                    await self.prune()
+                else:
+                    await self.sync()
+                if self._bloom.count > self.capacity:
+                    await self._rebuild()
+            except Exception as e:
+                logger.error(f"Error sincronizando los tokens revocados: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        checks = self.stats["checks"]
+        return {
+            "synced": self._synced,
+            "bloom_entries": self._bloom.count,
+            "bloom_capacity": self.capacity,
+            "cache_entries": len(self._cache),
+            "no_io_rate": round(self.stats["bloom_negatives"] / checks, 3) if checks else 0.0,
+            **self.stats,
+        }
+
+    # Implementación de cada backend
+    @abstractmethod
+    async def _setup(self) -> None:
+        ...
+
+    @abstractmethod
+    async def _insert(self, token_id: str, expires_at: float) -> None:
+        ...
+
+    @abstractmethod
+    async def _exists(self, token_id: str, now: float) -> bool:
+        ...
+
+    @abstractmethod
+    async def _fetch_since(self, since: float, now: float) -> List[Revocation]:
+        ...
+
+    @abstractmethod
+    async def _purge(self, now: float) -> int:
+        ...
+
+
+class PostgresRevocationStore(RevocationStore):
+    """Tokens revocados en la tabla revoked_tokens de PostgreSQL"""
+
+    async def _setup(self) -> None:
+        async with pg_connection() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS public.revoked_tokens (
+                    token_id TEXT PRIMARY KEY,
+                    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                    revoked_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+                )
+            """)
+            await conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at ON public.revoked_tokens(revoked_at)"
+            )
+            await conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at ON public.revoked_tokens(expires_at)"
+            )
+
+    async def _insert(self, token_id: str, expires_at: float) -> None:
+        async with pg_connection() as conn:
+            await conn.execute(
+                """
+                INSERT INTO public.revoked_tokens (token_id, expires_at)
+                VALUES ($1, to_timestamp($2))
+                ON CONFLICT (token_id) DO NOTHING
+                """,
+                token_id, expires_at
+            )
+
+    async def _exists(self, token_id: str, now: float) -> bool:
+        async with pg_connection() as conn:
+            return bool(await conn.fetchval(
+                "SELECT 1 FROM public.revoked_tokens WHERE token_id = $1 AND expires_at > to_timestamp($2)",
+                token_id, now
+            ))
+
+    async def _fetch_since(self, since: float, now: float) -> List[Revocation]:
+        async with pg_connection() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT token_id, EXTRACT(EPOCH FROM revoked_at)::float8 AS revoked_at,
+                       EXTRACT(EPOCH FROM expires_at)::float8 AS expires_at
+                FROM public.revoked_tokens
+                WHERE revoked_at >= to_timestamp($1) AND expires_at > to_timestamp($2)
+                """,
+                since, now
+            )
+        return [(row["token_id"], row["revoked_at"], row["expires_at"]) for row in rows]
+
+    async def _purge(self, now: float) -> int:
+        async with pg_connection() as conn:
+            result = await conn.execute(
+                "DELETE FROM public.revoked_tokens WHERE expires_at <= to_timestamp($1)", now
+            )
+        return int(result.split()[-1])
+
+
+class SQLiteRevocationStore(RevocationStore):
+    """Tokens revocados en un fichero SQLite local (modo WAL)"""
+
+    def __init__(self, path: str = TOKEN_REVOCATION_SQLITE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _run(self, func, *args):
+        # sqlite3 es bloqueante: cada operación se ejecuta en el pool de hilos
+        def _locked():
+            with self._lock:
+                return func(*args)
+        return asyncio.to_thread(_locked)
+
+    def _setup_sync(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS revoked_tokens (
+                token_id TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL,
+                revoked_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at ON revoked_tokens(revoked_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at ON revoked_tokens(expires_at)")
+
+    async def _setup(self) -> None:
+        if self._conn is None:
+            await self._run(self._setup_sync)
+
+    async def close(self) -> None:
+        await super().close()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+
+    def _insert_sync(self, token_id: str, expires_at: float) -> None:
+        self._conn.execute(
+            "INSERT OR IGNORE INTO revoked_tokens (token_id, expires_at, revoked_at) VALUES (?, ?, ?)",
+            (token_id, expires_at, time.time())
+        )
+
+    async def _insert(self, token_id: str, expires_at: float) -> None:
+        await self._run(self._insert_sync, token_id, expires_at)
+
+    def _exists_sync(self, token_id: str, now: float) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM revoked_tokens WHERE token_id = ? AND expires_at > ?", (token_id, now)
+        ).fetchone()
+        return row is not None
+
+    async def _exists(self, token_id: str, now: float) -> bool:
+        return await self._run(self._exists_sync, token_id, now)
+
+    def _fetch_since_sync(self, since: float, now: float) -> List[Revocation]:
+        return self._conn.execute(
+            "SELECT token_id, revoked_at, expires_at FROM revoked_tokens WHERE revoked_at >= ? AND expires_at > ?",
+            (since, now)
+        ).fetchall()
+
+    async def _fetch_since(self, since: float, now: float) -> List[Revocation]:
+        return await self._run(self._fetch_since_sync, since, now)
+
+    def _purge_sync(self, now: float) -> int:
+        return self._conn.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (now,)).rowcount
+
+    async def _purge(self, now: float) -> int:
+        return await self._run(self._purge_sync, now)
+
+
+def create_revocation_store(backend: str = TOKEN_REVOCATION_BACKEND) -> RevocationStore:
+    if backend == "sqlite":
+        return SQLiteRevocationStore()
+    if backend == "postgres":
+        return PostgresRevocationStore()
+    raise RuntimeError(f"TOKEN_REVOCATION_BACKEND desconocido: {backend} (usa 'postgres' o 'sqlite')")
+
+
+# Registro compartido por todo el proceso
+token_revocations = create_revocation_store()
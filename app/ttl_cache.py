@@ -0,0 +1,97 @@
+"""
+Caché en memoria con caducidad indexada por un heap.
+
+Cada entrada tiene su instante de expiración; el heap ordena esos instantes y la
+limpieza solo mira la cabeza, así que caducar k entradas cuesta O(k log n) en
+lugar de recorrer toda la caché. Las entradas reescritas dejan su marca antigua
+en el heap, que se descarta al salir (borrado perezoso). Con la caché llena se
+desaloja la entrada que antes iba a caducar.
+"""
+import heapq
+import itertools
+import time
+from typing import Any, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """Diccionario acotado cuyas entradas caducan tras `ttl` segundos"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: Dict[Hashable, Tuple[V, float]] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._counter = itertools.count()
+        self.stats = {"hits": 0, "misses": 0, "expirations": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        self.expire()
+        entry = self._data.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return entry[0]
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        now = time.monotonic()
+        self.expire(now)
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        if key not in self._data:
+            while len(self._data) >= self.max_entries and self._pop_head() is not None:
+                self.stats["evictions"] += 1
+        self._data[key] = (value, expires_at)
+        heapq.heappush(self._heap, (expires_at, next(self._counter), key))
+        # Evitar que el heap crezca sin límite con marcas obsoletas
+        if len(self._heap) > 2 * self.max_entries:
+            self._rebuild()
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        entry = self._data.pop(key, None)
+        return entry[0] if entry is not None else None
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Elimina las entradas caducadas; devuelve cuántas"""
+        now = time.monotonic() if now is None else now
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, _, key = heapq.heappop(self._heap)
+            entry = self._data.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self._data[key]
+                removed += 1
+        self.stats["expirations"] += removed
+        return removed
+
+    def _pop_head(self) -> Optional[Hashable]:
+        """Saca la cabeza del heap; devuelve la clave si seguía vigente"""
+        while self._heap:
+            expires_at, _, key = heapq.heappop(self._heap)
+            entry = self._data.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self._data[key]
+                return key
+        return None
+
+    def _rebuild(self) -> None:
+        self._heap = [(expires_at, next(self._counter), key) for key, (_, expires_at) in self._data.items()]
+        heapq.heapify(self._heap)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            **self.stats,
+        }
@@ -0,0 +1,117 @@
+"""
+Canonicalización de URLs para deduplicar páginas del rastreo.
+
+Dos URLs que apuntan a la misma página lógica (fragmento, barra final, orden de
+los parámetros, http/https, prefijo www., puerto por defecto, mayúsculas en el
+host) producen la misma clave canónica.
+"""
+from typing import Dict, Optional, Set
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit, urlunsplit
+
+# Parámetros de seguimiento que no cambian el contenido de la página (más cualquier utm_*).
+# Solo identificadores de campañas y clics: otros como 'ref' o 'source' los usan
+# muchos sitios para elegir el contenido y quitarlos mezclaría páginas distintas.
+TRACKING_PARAMS = {
+    'gclid', 'dclid', 'gbraid', 'wbraid', 'fbclid', 'msclkid', 'yclid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok', 'igshid',
+}
+
+_DEFAULT_PORTS = {'http': '80', 'https': '443'}
+_INDEX_PAGES = ('index.html', 'index.htm', 'index.php', 'default.aspx')
+
+
+def canonical_host(netloc: str) -> str:
+    """Host en minúsculas, sin www., credenciales ni puerto por defecto"""
+    host = netloc.rsplit('@', 1)[-1].lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return host
+
+
+def site_domain(url: str) -> str:
+    """Dominio de una URL tal como lo guarda la columna domain de found_emails (sin www. ni puerto)"""
+    return canonical_host(urlsplit(url).hostname or '')
+
+
+def is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith('utm_')
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Clave canónica de una URL; no se usa para pedir la página, solo para compararla
+    """
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = canonical_host(parts.netloc)
+    if ':' in host:
+        name, port = host.rsplit(':', 1)
+        if _DEFAULT_PORTS.get(scheme) == port:
+            host = name
+
+    # Normalizar escapes de la ruta y eliminar páginas índice y barra final
+    path = quote(unquote(parts.path), safe="/:@!$&'()*+,;=-._~") or '/'
+    for index_page in _INDEX_PAGES:
+        if path.endswith('/' + index_page):
+            path = path[:-len(index_page)]
+            break
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/') or '/'
+
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not is_tracking_param(k)]
+    query.sort()
+
+    # http y https se tratan como la misma página; el fragmento se descarta
+    return urlunsplit(('', host, path, urlencode(query), ''))
+
+
+class SeenURLs:
+    """
+    Conjunto de páginas ya encoladas en un escaneo
+
+    Se consulta al encolar, no al terminar de descargar, para que la misma página
+    no se pida dos veces en paralelo. Las URLs finales de redirecciones y los
+    <link rel=canonical> se registran como alias de la página original.
+    """
+
+    def __init__(self):
+        self._seen: Set[str] = set()
+        self._aliases: Dict[str, str] = {}
+
+    def __contains__(self, url: str) -> bool:
+        return canonicalize_url(url) in self._seen
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def add(self, url: str) -> bool:
+        """Registra la URL; devuelve False si la página ya estaba vista"""
+        key = canonicalize_url(url)
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        return True
+
+    def add_alias(self, url: str, alias: Optional[str]) -> bool:
+        """
+        Registra otra URL de la misma página (redirección o canonical)
+
+        Devuelve False si el alias ya pertenecía a otra página vista, es decir, si
+        la página actual es un duplicado.
+        """
+        if not alias:
+            return True
+        key = canonicalize_url(url)
+        alias_key = canonicalize_url(alias)
+        if alias_key == key:
+            return True
+        if alias_key in self._seen and self._aliases.get(alias_key) != key:
+            return False
+        self._seen.add(alias_key)
+        self._aliases[alias_key] = key
+        return True
@@ -0,0 +1,163 @@
+"""
+Worker de rastreo: reclama trabajos de la cola compartida y los ejecuta.
+
+La API solo encola (POST /api/v1/scrape); los escaneos corren aquí, con un
+máximo de JOB_WORKER_CONCURRENCY trabajos simultáneos por proceso. Se puede
+lanzar como proceso dedicado:
+
+    python -m app.worker
+
+o embebido en el proceso de la API (JOB_EMBEDDED_WORKER=true, por defecto) para
+despliegues de un solo servicio.
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from .job_store import job_store
+
+load_dotenv()
+
+logger = logging.getLogger("webscraper")
+
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", 2))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+JOB_EMBEDDED_WORKER = os.getenv("JOB_EMBEDDED_WORKER", "true").lower() in ("1", "true", "yes")
+# Trabajos en cola a partir de los cuales la API responde 429
+JOB_QUEUE_MAX_PENDING = int(os.getenv("JOB_QUEUE_MAX_PENDING", 100))
+JOB_QUEUE_RETRY_AFTER = int(os.getenv("JOB_QUEUE_RETRY_AFTER", 30))
+
+JobHandler = Callable[..., Awaitable[None]]
+
+
+class ScrapeWorker:
+    """Bucle que reclama trabajos mientras haya huecos libres y los ejecuta"""
+
+    def __init__(self, handler: JobHandler, concurrency: int = JOB_WORKER_CONCURRENCY,
+                 poll_interval: float = JOB_POLL_INTERVAL):
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{os.urandom(3).hex()}"
+        self._running: Dict[str, asyncio.Task] = {}
+        self._loop_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.stats = {"claimed": 0, "completed": 0, "failed": 0}
+
+    def notify(self) -> None:
+        """Avisa de que hay trabajo nuevo sin esperar al siguiente sondeo"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        if self._loop_task is None:
+            self._wakeup = asyncio.Event()
+            self._loop_task = asyncio.create_task(self._run())
+            logger.info(f"Worker de rastreo {self.worker_id} iniciado (concurrencia={self.concurrency})")
+
+    async def stop(self) -> None:
+        """Cancela los trabajos en curso y los devuelve a la cola para otro worker"""
+        if self._loop_task is None:
+            return
+        self._loop_task.cancel()
+        await asyncio.gather(self._loop_task, return_exceptions=True)
+        self._loop_task = None
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            released = await job_store.release(self.worker_id)
+            if released:
+                logger.info(f"{released} trabajos devueltos a la cola por {self.worker_id}")
+        except Exception as e:
+            logger.error(f"No se pudieron devolver los trabajos de {self.worker_id}: {str(e)}")
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            free = self.concurrency - len(self._running)
+            if free > 0:
+                try:
+                    jobs = await job_store.claim(self.worker_id, free)
+                except Exception as e:
+                    logger.error(f"Error reclamando trabajos de la cola: {str(e)}")
+                    jobs = []
+                for request_id, params in jobs:
+                    self.stats["claimed"] += 1
+                    task = asyncio.create_task(self._execute(request_id, params))
+                    self._running[request_id] = task
+                if jobs and len(jobs) == free:
+                    # Puede haber más en cola: volver a mirar en cuanto quede un hueco
+                    continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, request_id: str, params: Dict[str, Any]) -> None:
+        try:
+            await self.handler(request_id=request_id, **params)
+            self.stats["completed"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"Error ejecutando el trabajo {request_id}: {str(e)}", exc_info=True)
+        finally:
+            self._running.pop(request_id, None)
+            self.notify()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "running": len(self._running),
+            **self.stats,
+        }
+
+
+async def main() -> None:
+    """Proceso dedicado: recursos compartidos + worker hasta recibir SIGINT/SIGTERM"""
+    logging.basicConfig(level=logging.INFO)
+    from .db import init_pg_pool, close_pg_pool
+    from .ocr import init_ocr_pool, close_ocr_pool
+    from .http_client import init_http_session, close_http_session
+    from .email_writer import email_writer
+    from .main import run_scraper
+
+    try:
+        await init_pg_pool()
+    except Exception as e:
+        logger.error(f"No se pudo iniciar el pool de PostgreSQL: {str(e)}")
+    init_ocr_pool()
+    init_http_session()
+    email_writer.start()
+    await job_store.start()
+
+    worker = ScrapeWorker(run_scraper)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await worker.start()
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info(f"Deteniendo worker de rastreo {worker.worker_id}")
+        await worker.stop()
+        await job_store.close()
+        await email_writer.close()
+        await close_http_session()
+        close_ocr_pool()
+        await close_pg_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,269 @@
+"""
+Benchmark del crawler completo (EmailScraper.scrape_website) sin red externa.
+
+Levanta el sitio sintético de benchmarks.synthetic_site en un proceso aparte (así
+su CPU y su memoria no se mezclan con las del crawler) y rastrea cada escenario
+midiendo:
+
+- páginas/s y correos/s del escaneo completo;
+- latencia p50/p99 de get_page_content (descarga + lectura del cuerpo);
+- RSS máximo del proceso del crawler durante el escaneo;
+- retraso p99 del event loop (una tarea "latido" cada pocos milisegundos);
+- cobertura: correos encontrados / correos alcanzables en el sitio.
+
+Con --save-baseline guarda las medianas en un JSON; las ejecuciones siguientes
+se comparan con él y terminan con código 1 si alguna métrica empeora más que
+--tolerance. La línea base depende de la máquina: generarla en la misma donde se
+compara, a partir de la rama principal.
+
+Uso:
+    python -m benchmarks.bench_crawl --save-baseline
+    python -m benchmarks.bench_crawl --scenario hostil --runs 5
+    python -m benchmarks.bench_crawl --scenario basico --pages 2000 --fanout 12
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from dataclasses import asdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# app.main exige la configuración de autenticación al importarse; para el benchmark da igual
+os.environ.setdefault("FRONTEND_URL", "http://localhost:5173")
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark")
+os.environ.setdefault("JWT_ALGORITHM", "HS256")
+
+from app.frontier import CRAWL_WORKERS  # noqa: E402
+from app.main import EmailScraper  # noqa: E402
+
+from benchmarks.synthetic_site import (SiteConfig, SyntheticSite, add_site_arguments,  # noqa: E402
+                                       serve_forever, site_config_from_args)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "bench_crawl.json")
+
+SCENARIOS = {
+    # Sitio sano: mide el coste propio del crawler (parseo, frontera, extracción)
+    "basico": SiteConfig(pages=500, depth=4, fanout=8),
+    # Sitio grande y ancho: presión sobre la frontera, la deduplicación y la memoria
+    "grande": SiteConfig(pages=2000, depth=5, fanout=12, cross_links=8, paragraphs=80),
+    # Sitio problemático: páginas lentas, errores 500 y redirecciones
+    "hostil": SiteConfig(pages=500, depth=4, fanout=8, slow_ratio=0.05, slow_delay=0.5,
+                         error_ratio=0.05, redirect_ratio=0.15),
+}
+
+# Métricas en las que más es mejor; en el resto, menos es mejor
+HIGHER_IS_BETTER = {"pages_per_s", "emails_per_s", "coverage"}
+# Diferencias absolutas por debajo de las cuales no se considera regresión (ruido)
+MIN_ABSOLUTE_DELTA = {"fetch_p50_ms": 2.0, "fetch_p99_ms": 5.0, "lag_p99_ms": 5.0,
+                      "peak_rss_mb": 10.0, "coverage": 0.005}
+REPORTED_METRICS = ("pages_per_s", "emails_per_s", "fetch_p50_ms", "fetch_p99_ms",
+                    "peak_rss_mb", "lag_p99_ms", "coverage")
+
+
+def current_rss_mb() -> float:
+    """RSS actual en MB (/proc en Linux; si no, el máximo que da getrusage)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class TimedScraper(EmailScraper):
+    """EmailScraper que anota la duración de cada descarga de página"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fetch_times: List[float] = []
+
+    async def get_page_content(self, url: str, **kwargs) -> Optional[str]:
+        start = time.perf_counter()
+        try:
+            return await super().get_page_content(url, **kwargs)
+        finally:
+            self.fetch_times.append((time.perf_counter() - start) * 1000)
+
+
+async def heartbeat(interval: float, lags: list, rss: list, stop: asyncio.Event) -> None:
+    """Mide cuánto tarda el loop en despertar una tarea y muestrea la memoria"""
+    beats = 0
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+        beats += 1
+        if beats % 10 == 0:
+            rss.append(current_rss_mb())
+
+
+async def crawl_once(base_url: str, config: SiteConfig, expected: set, args) -> Dict[str, float]:
+    lags: list = []
+    rss: list = [current_rss_mb()]
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(args.interval, lags, rss, stop))
+    start = time.perf_counter()
+    async with TimedScraper(max_workers=args.concurrency) as scraper:
+        result = await scraper.scrape_website(
+            base_url,
+            max_pages=config.pages,
+            max_emails=10 ** 7,
+            max_depth=config.depth,
+            timeout=args.timeout,
+            workers=args.workers,
+        )
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    rss.append(current_rss_mb())
+
+    if result.get("error"):
+        print(f"  aviso: el escaneo terminó con error: {result['error']}")
+    found = set(result["emails"])
+    return {
+        "pages": result["pages_scanned"],
+        "emails": len(found),
+        "elapsed_s": elapsed,
+        "pages_per_s": result["pages_scanned"] / elapsed,
+        "emails_per_s": len(found) / elapsed,
+        "fetch_p50_ms": percentile(scraper.fetch_times, 0.5),
+        "fetch_p99_ms": percentile(scraper.fetch_times, 0.99),
+        "peak_rss_mb": max(rss),
+        "lag_p99_ms": percentile(lags, 0.99),
+        "coverage": len(found & expected) / len(expected) if expected else 1.0,
+    }
+
+
+def run_scenario(name: str, config: SiteConfig, args) -> Dict[str, float]:
+    site = SyntheticSite(config)
+    expected = site.expected_emails(max_depth=config.depth)
+    print(f"\n== {name}: {len(site.plans)} páginas, {len(expected)} correos alcanzables "
+          f"(lentas {config.slow_ratio:.0%}, errores {config.error_ratio:.0%}, "
+          f"redirecciones {config.redirect_ratio:.0%})")
+
+    # Servidor en otro proceso: su CPU no cuenta como retraso del loop del crawler
+    ctx = multiprocessing.get_context("spawn")
+    port_queue = ctx.Queue()
+    server = ctx.Process(target=serve_forever, args=(asdict(config), port_queue), daemon=True)
+    server.start()
+    try:
+        base_url = port_queue.get(timeout=30)
+        runs = []
+        for i in range(args.runs):
+            metrics = asyncio.run(crawl_once(base_url, config, expected, args))
+            runs.append(metrics)
+            print(f"  ejecución {i + 1}: {metrics['pages']} páginas, {metrics['emails']} correos "
+                  f"en {metrics['elapsed_s']:.2f}s")
+    finally:
+        server.terminate()
+        server.join()
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def compare(name: str, metrics: Dict[str, float], baseline: Optional[Dict], tolerance: float) -> List[str]:
+    """Imprime la tabla del escenario y devuelve las métricas que empeoran"""
+    regressions = []
+    print(f"\n  {'métrica':<14} {'actual':>10} {'base':>10} {'cambio':>9}")
+    for key in REPORTED_METRICS:
+        value = metrics[key]
+        line = f"  {key:<14} {value:10.2f}"
+        base = (baseline or {}).get(key)
+        if base is not None:
+            change = (value - base) / base if base else 0.0
+            worse = -change if key in HIGHER_IS_BETTER else change
+            regressed = worse > tolerance and abs(value - base) > MIN_ABSOLUTE_DELTA.get(key, 0.0)
+            line += f" {base:10.2f} {change:+8.1%}"
+            if regressed:
+                line += "  REGRESIÓN"
+                regressions.append(f"{name}.{key}")
+        print(line)
+    return regressions
+
+
+def load_baseline(path: str) -> Dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path: str, results: Dict[str, Dict], configs: Dict[str, SiteConfig], args) -> None:
+    data = load_baseline(path)
+    data.setdefault("scenarios", {})
+    for name, metrics in results.items():
+        data["scenarios"][name] = {"site": asdict(configs[name]), "metrics": metrics}
+    data["updated_at"] = datetime.utcnow().isoformat()
+    data["machine"] = {"python": platform.python_version(), "platform": platform.platform(),
+                       "cpus": os.cpu_count(), "workers": args.workers, "concurrency": args.concurrency}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    print(f"\nLínea base guardada en {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS) + ["todos"], default="todos",
+                        help="Escenario a ejecutar")
+    parser.add_argument("--runs", type=int, default=3, help="Ejecuciones por escenario (se usa la mediana)")
+    parser.add_argument("--workers", type=int, default=CRAWL_WORKERS, help="Workers de la frontera")
+    parser.add_argument("--concurrency", type=int, default=5, help="Descargas simultáneas (max_workers)")
+    parser.add_argument("--timeout", type=int, default=300, help="Tiempo máximo por escaneo (s)")
+    parser.add_argument("--interval", type=float, default=0.01, help="Segundos entre latidos")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Fichero JSON de la línea base")
+    parser.add_argument("--save-baseline", action="store_true", help="Guardar los resultados como línea base")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Empeoramiento relativo tolerado antes de marcar regresión")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar el log del crawler")
+    site_group = parser.add_argument_group("sitio sintético (sobrescribe el escenario)")
+    add_site_arguments(site_group)
+    args = parser.parse_args()
+
+    if not args.verbose:
+        # Los 500 y las páginas lentas del escenario hostil llenarían la salida de avisos
+        logging.getLogger("webscraper").setLevel(logging.ERROR)
+
+    names = sorted(SCENARIOS) if args.scenario == "todos" else [args.scenario]
+    configs = {name: site_config_from_args(args, SCENARIOS[name]) for name in names}
+    baseline = load_baseline(args.baseline).get("scenarios", {})
+    print(f"workers {args.workers}, descargas simultáneas {args.concurrency}, "
+          f"{args.runs} ejecuciones por escenario, tolerancia {args.tolerance:.0%}")
+
+    results, regressions = {}, []
+    for name in names:
+        results[name] = run_scenario(name, configs[name], args)
+        stored = baseline.get(name)
+        base_metrics = None
+        if stored is not None:
+            if stored["site"] == asdict(configs[name]):
+                base_metrics = stored["metrics"]
+            else:
+                print("  (la línea base se midió con otro sitio; no se compara)")
+        regressions += compare(name, results[name], base_metrics, args.tolerance)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results, configs, args)
+    elif regressions:
+        print(f"\nRegresiones respecto a {args.baseline}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
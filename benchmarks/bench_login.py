@@ -0,0 +1,100 @@
+"""
+Benchmark de logins concurrentes: throughput y latencia del event loop.
+
+Simula ráfagas de logins (verificación bcrypt) mientras una tarea "latido" se
+despierta cada pocos milisegundos, como lo haría una consulta de estado o un
+rastreo en el mismo worker. El retraso de cada latido respecto a lo previsto es
+la latencia que añade el event loop a todo lo demás.
+
+"antes" verifica la contraseña dentro del handler async (como hacía auth.login);
+"después" usa app.passwords.check_password, que la delega al pool de hilos
+acotado y rechaza con 503 lo que no cabe en la cola.
+
+Uso:
+    python -m benchmarks.bench_login --logins 40 --concurrency 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from fastapi import HTTPException
+
+from app import passwords
+from app.passwords import check_password, pwd_context
+
+PASSWORD = "Contraseña123"
+
+
+async def heartbeat(interval: float, lags: list, stop: asyncio.Event) -> None:
+    """Mide cuánto tarda el loop en despertar una tarea respecto a lo previsto"""
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+
+async def inline_login(hashed: str) -> bool:
+    return pwd_context.verify(PASSWORD, hashed)
+
+
+async def pooled_login(hashed: str) -> bool:
+    return await check_password(PASSWORD, hashed)
+
+
+async def run(label: str, login, hashed: str, logins: int, concurrency: int, interval: float) -> None:
+    lags: list = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(interval, lags, stop))
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {"ok": 0, "shed": 0}
+
+    async def one() -> None:
+        async with semaphore:
+            try:
+                await login(hashed)
+                results["ok"] += 1
+            except HTTPException as e:
+                if e.status_code != 503:
+                    raise
+                results["shed"] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+
+    lags.sort()
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else 0.0
+    print(f"{label:<34} {results['ok'] / elapsed:8.1f} logins/s  "
+          f"503: {results['shed']:<4} latidos: {len(lags):<5} "
+          f"lag p50 {statistics.median(lags) if lags else 0.0:7.1f} ms  "
+          f"p99 {p99:7.1f} ms  máx {lags[-1] if lags else 0.0:7.1f} ms")
+
+
+async def main_async(args) -> None:
+    hashed = pwd_context.hash(PASSWORD)
+    print(f"{args.logins} logins, {args.concurrency} concurrentes, latido cada {args.interval * 1000:.0f} ms, "
+          f"pool de {passwords.PASSWORD_HASH_WORKERS} hilos (cola máx. {passwords.PASSWORD_HASH_MAX_PENDING})\n")
+    passwords.init_password_pool()
+    try:
+        await run("antes (bcrypt en el event loop)", inline_login, hashed,
+                  args.logins, args.concurrency, args.interval)
+        await run("después (pool de hilos acotado)", pooled_login, hashed,
+                  args.logins, args.concurrency, args.interval)
+    finally:
+        passwords.close_password_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40, help="Número total de logins")
+    parser.add_argument("--concurrency", type=int, default=20, help="Logins simultáneos")
+    parser.add_argument("--interval", type=float, default=0.01, help="Segundos entre latidos")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
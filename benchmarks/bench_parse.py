@@ -0,0 +1,84 @@
+"""
+Benchmark del análisis de páginas: páginas/segundo antes y después.
+
+"Antes" reproduce el flujo original (dos BeautifulSoup con html.parser por página,
+uno para correos y otro para enlaces); "después" usa app.extraction.analyze_page,
+que parsea una sola vez con el parser más rápido disponible.
+
+Uso:
+    python -m benchmarks.bench_parse --pages 200 --links 150
+"""
+import argparse
+import random
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+from app.extraction import EMAIL_PATTERN, HTML_PARSER, analyze_page
+
+
+def build_page(n_links: int, n_paragraphs: int, seed: int) -> str:
+    """Genera una página sintética con enlaces, correos e imágenes"""
+    rnd = random.Random(seed)
+    parts = ["<html><head><title>Página de prueba</title></head><body>"]
+    parts.append("<nav>")
+    for i in range(n_links):
+        text = rnd.choice(["Inicio", "Contacto", "Blog", "Equipo", "Productos", "Ayuda"])
+        parts.append(f"<a href='/seccion/{i}'>{text}</a>")
+    parts.append("</nav>")
+    for i in range(n_paragraphs):
+        parts.append(f"<p>Lorem ipsum dolor sit amet {i}, consectetur adipiscing elit.</p>")
+        if i % 10 == 0:
+            parts.append(f"<p>Escríbenos a ventas{i}@ejemplo.com</p>")
+            parts.append(f"<a href='mailto:soporte{i}@ejemplo.com?subject=Hola'>Soporte</a>")
+            parts.append(f"<img src='/img/banner{i}.png' alt='banner'>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def legacy_analyze(content: str, base_url: str):
+    """Flujo original: un parseo para correos y otro para enlaces"""
+    soup = BeautifulSoup(content, 'html.parser')
+    text_emails = re.findall(EMAIL_PATTERN, soup.get_text(), re.IGNORECASE)
+    for tag in soup.find_all(True):
+        for attr in ['href', 'data-email', 'data-contact', 'data-mail', 'data-email-address']:
+            if attr in tag.attrs and '@' in tag[attr]:
+                re.findall(EMAIL_PATTERN, tag[attr], re.IGNORECASE)
+    soup.find_all('img')
+    soup = BeautifulSoup(content, 'html.parser')
+    links = [(link.get('href'), link.get_text()) for link in soup.find_all(['a', 'link'], href=True)]
+    return text_emails, links
+
+
+def run(label: str, func, pages, base_url: str) -> float:
+    start = time.perf_counter()
+    for page in pages:
+        func(page, base_url)
+    elapsed = time.perf_counter() - start
+    rate = len(pages) / elapsed if elapsed else float("inf")
+    print(f"{label:<40} {rate:10.1f} páginas/s  ({elapsed:.2f}s)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="Número de páginas sintéticas")
+    parser.add_argument("--links", type=int, default=150, help="Enlaces por página")
+    parser.add_argument("--paragraphs", type=int, default=300, help="Párrafos por página")
+    args = parser.parse_args()
+
+    base_url = "https://ejemplo.com/"
+    pages = [build_page(args.links, args.paragraphs, seed) for seed in range(args.pages)]
+    size_kb = sum(len(p) for p in pages) / len(pages) / 1024
+    print(f"{args.pages} páginas de ~{size_kb:.0f} KB, parser rápido: {HTML_PARSER}\n")
+
+    before = run("antes (2 parseos, html.parser)", legacy_analyze, pages, base_url)
+    run("después (1 parseo, html.parser)",
+        lambda c, u: analyze_page(c, u, parser="html.parser"), pages, base_url)
+    after = run(f"después (1 parseo, {HTML_PARSER})", analyze_page, pages, base_url)
+    print(f"\nMejora: x{after / before:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Sitio web sintético para medir el crawler sin salir de la máquina.
+
+Genera bajo demanda un sitio determinista (mismo seed = mismo sitio) con:
+
+- un árbol de páginas con `fanout` enlaces por página hasta `depth` niveles,
+  más enlaces cruzados a páginas al azar (duplicados que el crawler debe saltar);
+- correos en texto, en enlaces mailto:, en atributos data-email y ofuscados con
+  entidades HTML (&#64;), además de correos "[at]" que el extractor no reconoce;
+- imágenes PNG con un correo dibujado (nombre con "contact" para que sean
+  candidatas a OCR);
+- páginas lentas, páginas que responden 500 y enlaces que redirigen con 301.
+
+Cada página sabe qué correos contiene (`SyntheticSite.expected_emails`), así que
+el benchmark puede calcular también la cobertura.
+
+Uso (servir el sitio para navegarlo a mano):
+    python -m benchmarks.synthetic_site --pages 200 --port 8081
+"""
+import argparse
+import asyncio
+import io
+import random
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Set
+
+from aiohttp import web
+
+# Pillow es opcional: sin él las imágenes son PNG vacíos
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+
+EMAIL_DOMAIN = "empresa-sintetica.com"
+
+# PNG de 1x1 para cuando no hay Pillow
+BLANK_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+    "0000000d49444154789c6360000002000001e221bc330000000049454e44ae426082"
+)
+
+
+@dataclass
+class SiteConfig:
+    pages: int = 500
+    depth: int = 4
+    fanout: int = 8
+    # Enlaces extra por página a páginas al azar del sitio
+    cross_links: int = 4
+    # Correos por página (media)
+    email_density: float = 1.0
+    # Fracciones de páginas con cada característica
+    obfuscated_ratio: float = 0.2
+    image_ratio: float = 0.05
+    slow_ratio: float = 0.0
+    error_ratio: float = 0.0
+    redirect_ratio: float = 0.0
+    # Retraso de las páginas lentas (s)
+    slow_delay: float = 0.5
+    # Párrafos de relleno por página (tamaño del HTML)
+    paragraphs: int = 40
+    seed: int = 1
+
+
+@dataclass
+class PagePlan:
+    page_id: int
+    depth: int
+    children: List[int]
+    cross: List[int]
+    emails: List[str]
+    obfuscated: List[str]
+    hidden: List[str]
+    image_email: Optional[str]
+    slow: bool
+    error: bool
+    redirected: bool
+
+
+class SyntheticSite:
+    """Plano determinista del sitio y aplicación aiohttp que lo sirve"""
+
+    def __init__(self, config: SiteConfig):
+        self.config = config
+        self.plans: Dict[int, PagePlan] = {}
+        self._build()
+
+    def _build(self) -> None:
+        cfg = self.config
+        rnd = random.Random(cfg.seed)
+        # Árbol en anchura: cada nivel enlaza a `fanout` hijos hasta agotar páginas o profundidad
+        depths = {0: 0}
+        children: Dict[int, List[int]] = {0: []}
+        queue = [0]
+        next_id = 1
+        while queue and next_id < cfg.pages:
+            parent = queue.pop(0)
+            if depths[parent] >= cfg.depth:
+                continue
+            for _ in range(cfg.fanout):
+                if next_id >= cfg.pages:
+                    break
+                depths[next_id] = depths[parent] + 1
+                children[next_id] = []
+                children[parent].append(next_id)
+                queue.append(next_id)
+                next_id += 1
+
+        page_ids = list(depths)
+        for page_id in page_ids:
+            n_emails = int(cfg.email_density) + (1 if rnd.random() < cfg.email_density % 1 else 0)
+            emails = [f"contacto.{page_id}.{k}@{EMAIL_DOMAIN}" for k in range(n_emails)]
+            obfuscated, hidden = [], []
+            if rnd.random() < cfg.obfuscated_ratio:
+                obfuscated.append(f"ventas.{page_id}@{EMAIL_DOMAIN}")
+                hidden.append(f"oculto.{page_id}@{EMAIL_DOMAIN}")
+            image_email = f"imagen.{page_id}@{EMAIL_DOMAIN}" if rnd.random() < cfg.image_ratio else None
+            self.plans[page_id] = PagePlan(
+                page_id=page_id,
+                depth=depths[page_id],
+                children=children[page_id],
+                cross=[rnd.choice(page_ids) for _ in range(cfg.cross_links)],
+                emails=emails,
+                obfuscated=obfuscated,
+                hidden=hidden,
+                image_email=image_email,
+                # La portada siempre responde, si no no hay nada que rastrear
+                slow=page_id != 0 and rnd.random() < cfg.slow_ratio,
+                error=page_id != 0 and rnd.random() < cfg.error_ratio,
+                redirected=page_id != 0 and rnd.random() < cfg.redirect_ratio,
+            )
+
+    def expected_emails(self, max_depth: Optional[int] = None, with_images: bool = False) -> Set[str]:
+        """
+        Correos que el extractor puede encontrar en las páginas alcanzables
+
+        Recorre el sitio en anchura desde la portada como lo haría el crawler:
+        las páginas con error no se leen, así que sus enlaces no cuentan.
+        """
+        distance = {0: 0}
+        queue = [0]
+        for page_id in queue:
+            plan = self.plans[page_id]
+            if plan.error or (max_depth is not None and distance[page_id] >= max_depth):
+                continue
+            for target in plan.children + plan.cross:
+                if target not in distance:
+                    distance[target] = distance[page_id] + 1
+                    queue.append(target)
+        found = set()
+        for page_id in distance:
+            plan = self.plans[page_id]
+            if plan.error:
+                continue
+            found.update(plan.emails)
+            found.update(plan.obfuscated)
+            if with_images and plan.image_email:
+                found.add(plan.image_email)
+        return found
+
+    def link(self, page_id: int) -> str:
+        if page_id == 0:
+            return "/"
+        return f"/r/{page_id}" if self.plans[page_id].redirected else f"/p/{page_id}"
+
+    def render(self, plan: PagePlan) -> str:
+        rnd = random.Random(self.config.seed * 100003 + plan.page_id)
+        parts = [f"<html><head><title>Página {plan.page_id}</title></head><body><nav>"]
+        for child in plan.children:
+            text = "Contacto" if rnd.random() < 0.1 else f"Sección {child}"
+            parts.append(f"<a href='{self.link(child)}'>{text}</a>")
+        for other in plan.cross:
+            parts.append(f"<a href='{self.link(other)}?utm_source=relacionado-{plan.page_id}'>Relacionado</a>")
+        parts.append("<a href='/'>Inicio</a></nav>")
+        for i in range(self.config.paragraphs):
+            parts.append(f"<p>Lorem ipsum dolor sit amet {plan.page_id}-{i}, consectetur adipiscing elit.</p>")
+        for k, email in enumerate(plan.emails):
+            if k % 3 == 0:
+                parts.append(f"<p>Escríbenos a {email}</p>")
+            elif k % 3 == 1:
+                parts.append(f"<a href='mailto:{email}?subject=Hola'>Escríbenos</a>")
+            else:
+                parts.append(f"<span data-email='{email}'>Equipo</span>")
+        for email in plan.obfuscated:
+            parts.append(f"<p>Ventas: {email.replace('@', '&#64;')}</p>")
+        for email in plan.hidden:
+            parts.append(f"<p>Otro: {email.replace('@', ' [at] ').replace('.', ' [dot] ')}</p>")
+        if plan.image_email:
+            parts.append(f"<img src='/img/contact-{plan.page_id}.png' alt='contacto'>")
+        parts.append("</body></html>")
+        # Un elemento por línea, como el HTML real sin minificar
+        return "\n".join(parts)
+
+    def render_image(self, email: str) -> bytes:
+        if Image is None:
+            return BLANK_PNG
+        image = Image.new("RGB", (8 * len(email) + 20, 40), "white")
+        ImageDraw.Draw(image).text((10, 12), email, fill="black")
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    async def handle_page(self, request: web.Request) -> web.Response:
+        page_id = int(request.match_info.get("page_id", 0))
+        plan = self.plans.get(page_id)
+        if plan is None:
+            raise web.HTTPNotFound()
+        if plan.slow:
+            await asyncio.sleep(self.config.slow_delay)
+        if plan.error:
+            raise web.HTTPInternalServerError()
+        return web.Response(text=self.render(plan), content_type="text/html")
+
+    async def handle_redirect(self, request: web.Request) -> web.Response:
+        raise web.HTTPMovedPermanently(f"/p/{request.match_info['page_id']}")
+
+    async def handle_image(self, request: web.Request) -> web.Response:
+        plan = self.plans.get(int(request.match_info["page_id"]))
+        if plan is None or not plan.image_email:
+            raise web.HTTPNotFound()
+        return web.Response(body=self.render_image(plan.image_email), content_type="image/png")
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/", self.handle_page)
+        app.router.add_get(r"/p/{page_id:\d+}", self.handle_page)
+        app.router.add_get(r"/r/{page_id:\d+}", self.handle_redirect)
+        app.router.add_get(r"/img/contact-{page_id:\d+}.png", self.handle_image)
+        return app
+
+
+async def start_site(config: SiteConfig, host: str = "127.0.0.1", port: int = 0):
+    """Arranca el servidor; devuelve (runner, url base). Con port=0 elige uno libre"""
+    site = SyntheticSite(config)
+    runner = web.AppRunner(site.make_app(), access_log=None)
+    await runner.setup()
+    tcp_site = web.TCPSite(runner, host, port)
+    await tcp_site.start()
+    bound_port = runner.addresses[0][1]
+    return runner, f"http://{host}:{bound_port}/"
+
+
+def serve_forever(config_dict: dict, port_queue, host: str = "127.0.0.1", port: int = 0) -> None:
+    """Punto de entrada del proceso servidor del benchmark: publica la URL en port_queue"""
+    async def run():
+        runner, base_url = await start_site(SiteConfig(**config_dict), host, port)
+        port_queue.put(base_url)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+    asyncio.run(run())
+
+
+def add_site_arguments(parser: argparse.ArgumentParser) -> None:
+    """Opciones de SiteConfig en la línea de comandos (las comparten servidor y benchmark)"""
+    defaults = SiteConfig()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=None,
+                            help=f"(por defecto {value})")
+
+
+def site_config_from_args(args: argparse.Namespace, base: Optional[SiteConfig] = None) -> SiteConfig:
+    values = asdict(base or SiteConfig())
+    for name in values:
+        override = getattr(args, name, None)
+        if override is not None:
+            values[name] = override
+    return SiteConfig(**values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_site_arguments(parser)
+    args = parser.parse_args()
+    config = site_config_from_args(args)
+    site = SyntheticSite(config)
+    print(f"{len(site.plans)} páginas, {len(site.expected_emails())} correos detectables "
+          f"en http://{args.host}:{args.port}/")
+    web.run_app(site.make_app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
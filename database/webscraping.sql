@@ -66,4 +66,68 @@ CREATE TABLE IF NOT EXISTS public.found_emails (
     UNIQUE(email, url, user_id)
 );
 CREATE INDEX IF NOT EXISTS idx_found_emails_user_id ON public.found_emails(user_id);
-CREATE INDEX IF NOT EXISTS idx_found_emails_email ON public.found_emails(email);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_found_emails_email ON public.found_emails(email);
+-- Última vez que un escaneo volvió a ver el correo (reutilización con max_age)
+ALTER TABLE public.found_emails ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS idx_found_emails_url_last_seen ON public.found_emails(url, last_seen_at DESC);
+
+-- UNIQUE(email, url, user_id) no impide duplicados cuando user_id es NULL (NULL <> NULL).
+-- Eliminar los duplicados anónimos existentes y deduplicar con un índice por expresión,
+-- que es el que usa el INSERT ... ON CONFLICT de la escritura por lotes.
+DELETE FROM public.found_emails a
+USING public.found_emails b
+WHERE a.user_id IS NULL AND b.user_id IS NULL
+  AND a.email = b.email AND a.url = b.url
+  AND a.id_found_emails > b.id_found_emails;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_found_emails_owner
+    ON public.found_emails (email, url, COALESCE(user_id, '00000000-0000-0000-0000-000000000000'::uuid));
+
+-- Consulta paginada por clave (found_at, id): found_at no puede ser NULL
+UPDATE public.found_emails SET found_at = NOW() WHERE found_at IS NULL;
+ALTER TABLE public.found_emails ALTER COLUMN found_at SET NOT NULL;
+-- Dominio del sitio escaneado (sin www.), para filtrar por dominio con índice
+ALTER TABLE public.found_emails ADD COLUMN IF NOT EXISTS domain TEXT
+    GENERATED ALWAYS AS (lower(substring(url from '^[A-Za-z][A-Za-z0-9+.-]*://(?:[^@/]*@)?(?:www\.)?([^/:?#]+)'))) STORED;
+-- Un índice por filtro principal, terminado en el orden del listado
+CREATE INDEX IF NOT EXISTS idx_found_emails_domain_found ON public.found_emails(domain, found_at, id_found_emails);
+CREATE INDEX IF NOT EXISTS idx_found_emails_url_found ON public.found_emails(url, found_at, id_found_emails);
+CREATE INDEX IF NOT EXISTS idx_found_emails_user_found ON public.found_emails(user_id, found_at, id_found_emails);
+CREATE INDEX IF NOT EXISTS idx_found_emails_found ON public.found_emails(found_at, id_found_emails);
+-- Cubierto por idx_found_emails_user_found
+DROP INDEX IF EXISTS public.idx_found_emails_user_id;
+-- Reutilización con max_age por dominio (sustituye a la consulta por url)
+CREATE INDEX IF NOT EXISTS idx_found_emails_domain_last_seen ON public.found_emails(domain, last_seen_at DESC);
+DROP INDEX IF EXISTS public.idx_found_emails_url_last_seen;
+-- Último escaneo anónimo completado de cada sitio, aunque no encontrara correos:
+-- con max_age solo se responde desde found_emails si el sitio se rastreó en ese plazo
+CREATE TABLE IF NOT EXISTS public.site_scans (
+    domain TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    pages_scanned INTEGER NOT NULL DEFAULT 0,
+    emails_found INTEGER NOT NULL DEFAULT 0,
+    completed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+-- Estado de los trabajos de escaneo, compartido entre workers de uvicorn
+CREATE TABLE IF NOT EXISTS public.scrape_jobs (
+    request_id TEXT PRIMARY KEY,
+    status VARCHAR(20) NOT NULL,
+    data JSONB NOT NULL,
+    params JSONB,
+    claimed_by TEXT,
+    dedupe_key TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_scrape_jobs_updated_at ON public.scrape_jobs(updated_at);
+CREATE INDEX IF NOT EXISTS idx_scrape_jobs_queued ON public.scrape_jobs(created_at) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_scrape_jobs_claimed_by ON public.scrape_jobs(claimed_by) WHERE status = 'processing';
+CREATE INDEX IF NOT EXISTS idx_scrape_jobs_inflight ON public.scrape_jobs(dedupe_key) WHERE status IN ('queued', 'processing');
+
+-- Tokens revocados (logout), compartidos entre workers; se purgan al pasar su exp
+CREATE TABLE IF NOT EXISTS public.revoked_tokens (
+    token_id TEXT PRIMARY KEY,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    revoked_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at ON public.revoked_tokens(revoked_at);
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at ON public.revoked_tokens(expires_at);